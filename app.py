@@ -1,28 +1,98 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, make_response, send_file, stream_with_context, get_template_attribute
+from markupsafe import Markup
 import pandas as pd
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import numpy as np
 from datetime import timedelta
 import requests
 import re
-import google.generativeai as genai
+import hashlib
+import base64
+import zlib
+import gzip
 from dotenv import load_dotenv
 import io
 import threading
 import time
 import tempfile
-import torch
-from transformers import AutoTokenizer
-import soundfile as sf
+import unicodedata
+import random
+from collections import OrderedDict, namedtuple
+from functools import lru_cache, wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
 import numpy as np
-import joblib
-from scipy.special import inv_boxcox
+from flask.json.provider import DefaultJSONProvider
+from farm_schema import read_farm_csv, apply_farm_dtypes, format_issues
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 # Load environment variables from .env file
 load_dotenv()
 
+def _json_default(obj):
+    """Serialize the NumPy/pandas values that the JSON encoders don't handle themselves"""
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()  # Non-contiguous or object arrays
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        return None if isinstance(value, float) and value != value else value
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return DefaultJSONProvider.default(obj)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify() through orjson: NumPy scalars and arrays, pandas Timestamps and
+    NaN/inf (as null) serialize directly, several times faster than the stdlib
+    encoder. Falls back to Flask's encoder (plus _json_default) without orjson.
+    """
+    default = staticmethod(_json_default)
+    
+    def _options(self, indent=False, sort_keys=None):
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_json_default, option=self._options(kwargs.get('indent'))).decode('utf-8')
+    
+    def dumpb(self, obj, sort_keys=None):
+        """Compact UTF-8 JSON bytes (sort_keys defaults to the provider's setting)"""
+        if sort_keys is None:
+            sort_keys = self.sort_keys
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':'), sort_keys=sort_keys).encode('utf-8')
+        return orjson.dumps(obj, default=_json_default, option=self._options(sort_keys=sort_keys))
+    
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=_json_default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 FARM_FILES = {
     'FarmA': 'farm_a_data.csv',
@@ -31,376 +101,1491 @@ FARM_FILES = {
     'FarmD': 'farm_d_data.csv'
 }
 
-# Field name mapping from new CSV format to old internal field names
-FIELD_NAME_MAPPING = {
-    'Fertilizerkgperha': 'Fertilizer_kg_per_ha',
-    'SoilMoisture%': 'SoilMoisture_%',
-    'TemperatureC': 'Temperature_C',
-    'Rainfallmm': 'Rainfall_mm',
-    'Yieldtonnesperha': 'Yield_tonnes_per_ha',
-    'PestRiskScore': 'PestRiskScore',
-    'HarvestRobotUptime%': 'HarvestRobotUptime_%',
-    'StorageTemperatureC': 'StorageTemperature_C',
-    'Humidity%': 'Humidity_%',
-    'SpoilageRate%': 'SpoilageRate_%',
-    'GradingScore': 'GradingScore',
-    'PredictedShelfLifedays': 'PredictedShelfLife_days',
-    'StorageDays': 'StorageDays',
-    'ProcessType': 'ProcessType',
-    'PackagingType': 'PackagingType',
-    'PackagingSpeedunitspermin': 'PackagingSpeed_units_per_min',
-    'DefectRate%': 'DefectRate_%',
-    'MachineryUptime%': 'MachineryUptime_%',
-    'TransportMode': 'TransportMode',
-    'TransportDistancekm': 'TransportDistance_km',
-    'FuelUsageLper100km': 'FuelUsage_L_per_100km',
-    'DeliveryTimehr': 'DeliveryTime_hr',
-    'DeliveryDelayFlag': 'DeliveryDelayFlag',
-    'SpoilageInTransit%': 'SpoilageInTransit_%',
-    'RetailInventoryunits': 'RetailInventory_units',
-    'SalesVelocityunitsperday': 'SalesVelocity_units_per_day',
-    'DynamicPricingIndex': 'DynamicPricingIndex',
-    'WastePercentage%': 'WastePercentage_%',
-    'HouseholdWastekg': 'HouseholdWaste_kg',
-    'RecipeRecommendationAccuracy%': 'RecipeRecommendationAccuracy_%',
-    'SatisfactionScore010': 'SatisfactionScore_0_10',
-    'WasteType': 'WasteType',
-    'SegregationAccuracy%': 'SegregationAccuracy_%',
-    'UpcyclingRate%': 'UpcyclingRate_%',
-    'BiogasOutputm3': 'BiogasOutput_m3',
-    'minprice': 'minprice',
-    'maxprice': 'maxprice',
-    'modalprice': 'modalprice',
-    'marketname': 'marketname',
-    'latitude': 'latitude',
-    'longitude': 'longitude',
-    'BatchID': 'BatchID',
-    'CropType': 'CropType',
-    'FarmLocation': 'FarmLocation',
-    'HarvestDate': 'HarvestDate'
-}
+# Process-wide farm data store: one parsed frame per farm, shared by every route.
+# Each entry is keyed by the source file's (mtime_ns, size) so a changed CSV only
+# reloads that farm. Readers must treat the cached frames as read-only.
+_farm_data_cache = {}
+_farm_data_lock = threading.Lock()
+
+# Append-aware ingest: when a farm CSV only grew, parse just the new tail and fold
+# it into the running aggregates instead of re-parsing the whole file. The rows
+# already ingested must still be byte for byte what they were: the old prefix is
+# re-hashed and compared with the SHA-1 of the bytes the frame was parsed from,
+# and any difference (an edited row, a rewrite, a truncation) means a full reload.
+# Set FARM_APPEND_INGEST=0 to always do a full reload.
+APPEND_AWARE_INGEST = os.environ.get('FARM_APPEND_INGEST', '1') != '0'
+
+# Binary sidecar cache: each parsed farm frame is also written next to its CSV as
+# one .npy file per column (<csv>.npcache/). Later cold starts memory-map those
+# files instead of parsing the CSV, so worker processes share the same pages.
+# Set FARM_BINARY_CACHE=0 to disable.
+FARM_BINARY_CACHE = os.environ.get('FARM_BINARY_CACHE', '1') != '0'
+_BINARY_CACHE_FORMAT = 5
 
-# In-memory cache for farm data (for efficiency)
-_farm_data_cache = None
-_farm_data_cache_timestamp = None
-
-def normalize_column_names(df):
-    """Rename columns from new CSV format to internal field names"""
-    rename_dict = {}
-    for old_name, new_name in FIELD_NAME_MAPPING.items():
-        if old_name in df.columns:
-            rename_dict[old_name] = new_name
-    if rename_dict:
-        df = df.rename(columns=rename_dict)
+# The sidecar is written on every full parse. After appends it is rewritten only
+# once the frame has grown by this fraction since the last write, so its cost is
+# amortized over the appended rows; a cold start folds in whatever tail it lacks.
+BINARY_CACHE_REFRESH_GROWTH = 0.25
+
+def _farm_file_signature(file_path):
+    """Return (mtime_ns, size) for a farm CSV, or None if it doesn't exist"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_farm_csv(source, source_name, first_row=0):
+    """Parse a farm CSV (path or file-like) with the shared farm schema, logging any bad rows"""
+    issues = []
+    df = read_farm_csv(source, issues, first_row=first_row)
+    if issues:
+        print(format_issues(issues, source_name))
     return df
 
+def _ingest_state(raw):
+    """Offset and digest of the bytes a frame was parsed from, to recognise a later append"""
+    header_end = raw.find(b'\n') + 1
+    return {
+        'offset': len(raw),
+        'header': bytes(raw[:header_end]),
+        'digest': hashlib.sha1(raw).hexdigest(),
+        'ends_with_newline': raw.endswith(b'\n')
+    }
+
+def _prefix_digest(f, size):
+    """SHA-1 object over an open file's first `size` bytes (read in chunks), or None if it is shorter"""
+    digest = hashlib.sha1()
+    f.seek(0)
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(remaining, 1 << 20))
+        if not chunk:
+            return None
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest
+
+def _file_digest(file_path, size):
+    """Hex SHA-1 of a file's first `size` bytes, or None if it is shorter"""
+    with open(file_path, 'rb') as f:
+        digest = _prefix_digest(f, size)
+    return digest.hexdigest() if digest is not None else None
+
+def _category_code_dtype(count):
+    """Code dtype pandas uses for a categorical with `count` categories"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if count < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class _FarmFrameBuffer:
+    """
+    Append-only column storage behind a farm frame that receives appends.
+    
+    frame() returns a DataFrame whose columns are views of the first `rows`
+    values. append() writes past them, into spare capacity that doubles when it
+    runs out, so frames already handed to readers never change and an append
+    costs time in proportion to the appended rows rather than the farm's size.
+    """
+    MIN_CAPACITY = 1024
+    
+    def __init__(self, data):
+        self.rows = len(data)
+        self.capacity = max(2 * self.rows, self.MIN_CAPACITY)
+        self.columns = {}  # name -> [kind, values, categories]
+        for name in data.columns:
+            series = data[name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categories = series.cat.categories
+                column = ['category', series.cat.codes.to_numpy().astype(_category_code_dtype(len(categories))), categories]
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                column = ['datetime', series.to_numpy(dtype='datetime64[ns]'), None]
+            elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+                column = ['numeric', series.to_numpy(), None]
+            else:
+                column = ['object', series.to_numpy(dtype=object), None]
+            column[1] = self._resized(column[1], self.capacity)
+            self.columns[name] = column
+    
+    def _resized(self, values, capacity):
+        resized = np.empty(capacity, dtype=values.dtype)
+        resized[:self.rows] = values[:self.rows]
+        return resized
+    
+    def append(self, new_rows):
+        """Store new_rows after the current rows; returns False if its columns differ"""
+        if list(new_rows.columns) != list(self.columns):
+            return False
+        start, end = self.rows, self.rows + len(new_rows)
+        if end > self.capacity:
+            self.capacity = max(2 * self.capacity, end)
+            for column in self.columns.values():
+                column[1] = self._resized(column[1], self.capacity)
+        
+        for name, column in self.columns.items():
+            kind, values, categories = column
+            series = new_rows[name]
+            if kind == 'category':
+                if not isinstance(series.dtype, pd.CategoricalDtype):
+                    series = series.astype('category')
+                added = series.cat.categories.difference(categories, sort=False)
+                if len(added):
+                    # New categories go last so the codes already stored stay valid
+                    categories = column[2] = categories.append(added)
+                    code_dtype = _category_code_dtype(len(categories))
+                    if values.dtype != code_dtype:
+                        values = column[1] = values.astype(code_dtype)
+                tail_codes = series.cat.codes.to_numpy()
+                codes = np.full(len(tail_codes), -1, dtype=values.dtype)
+                present = tail_codes >= 0
+                codes[present] = categories.get_indexer(series.cat.categories)[tail_codes[present]]
+                values[start:end] = codes
+            elif kind == 'datetime':
+                values[start:end] = series.to_numpy(dtype='datetime64[ns]')
+            elif kind == 'numeric':
+                tail = series.to_numpy()
+                dtype = np.result_type(values.dtype, tail.dtype)
+                if dtype != values.dtype:
+                    # e.g. a 0/1 flag column that now has blanks becomes float32
+                    values = column[1] = values.astype(dtype)
+                values[start:end] = tail
+            else:
+                values[start:end] = series.to_numpy(dtype=object)
+        self.rows = end
+        return True
+    
+    def frame(self):
+        """DataFrame of the current rows, sharing the buffer's memory"""
+        columns = {}
+        for name, (kind, values, categories) in self.columns.items():
+            values = values[:self.rows]
+            if kind == 'category':
+                columns[name] = pd.Categorical.from_codes(values, categories=categories, validate=False)
+            elif kind == 'object':
+                columns[name] = pd.Series(values, dtype=object, copy=False)
+            else:
+                columns[name] = values
+        return pd.DataFrame(columns, copy=False)
+
+def _build_farm_entry(signature, ingest, data, aggregates, buffer=None, cached_rows=0):
+    """Assemble a cache entry from a parsed frame and its ingest state"""
+    entry = {
+        'signature': signature,
+        'data': data,
+        'aggregates': aggregates,
+        'cube': build_farm_cube(aggregates) if aggregates is not None else None,
+        'rows': len(data),
+        'buffer': buffer,  # _FarmFrameBuffer that `data` views, once the farm has had an append
+        'cached_rows': cached_rows  # Rows in the binary sidecar cache
+    }
+    # Ingest state used to fold future appends into this entry
+    entry.update(ingest)
+    return entry
+
+def _binary_cache_dir(file_path):
+    return file_path + '.npcache'
+
+def _write_farm_binary_cache(file_path, signature, ingest, data):
+    """Write a parsed farm frame as memory-mappable .npy columns next to its CSV.
+    
+    The frame is stored under the digest of the bytes it was parsed from
+    (ingest['digest']), never of the file as it is now. Column files are named
+    after that digest and meta.json is replaced last, so a reader never pairs a
+    meta file with columns from a different version.
+    """
+    cache_dir = _binary_cache_dir(file_path)
+    token = ingest['digest'][:16]
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    columns = []
+    for i, col in enumerate(data.columns):
+        series = data[col]
+        column = {'name': col, 'file': f'{token}-{i:03d}.npy'}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            column['kind'] = 'category'
+            column['categories'] = series.cat.categories.tolist()
+            column['ordered'] = bool(series.cat.ordered)
+            values = series.cat.codes.to_numpy()
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            column['kind'] = 'datetime'
+            values = series.to_numpy(dtype='datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            column['kind'] = 'numeric'
+            values = series.to_numpy()
+        else:
+            # Strings are stored as codes into a list of unique values (-1 = missing)
+            codes, uniques = pd.factorize(series)
+            column['kind'] = 'object'
+            column['categories'] = [str(u) for u in uniques]
+            values = codes.astype('int32')
+        np.save(os.path.join(cache_dir, column['file']), values, allow_pickle=False)
+        columns.append(column)
+    
+    meta = {
+        'format': _BINARY_CACHE_FORMAT,
+        'source': {'mtime_ns': signature[0], 'size': signature[1]},
+        'rows': len(data),
+        'ingest': {
+            'offset': ingest['offset'],
+            'header': base64.b64encode(ingest['header']).decode('ascii'),
+            'digest': ingest['digest'],
+            'ends_with_newline': ingest['ends_with_newline']
+        },
+        'columns': columns
+    }
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+    
+    # Drop columns from older versions; readers that mapped them keep their pages
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npy') and not name.startswith(token):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+def _load_farm_binary_cache(file_path, signature):
+    """
+    Return (data, ingest) from the binary sidecar cache, or None if it is missing or
+    stale. A sidecar of a shorter file is returned too: the caller folds in the tail.
+    """
+    meta_path = os.path.join(_binary_cache_dir(file_path), 'meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != _BINARY_CACHE_FORMAT:
+        return None
+    
+    ingest = meta['ingest']
+    source = meta['source']
+    if (source['mtime_ns'], source['size']) != tuple(signature):
+        # A new mtime (a fresh checkout, an edit, an append): trust the cache only if
+        # the file still starts with exactly the bytes the cached frame was parsed from
+        if _file_digest(file_path, ingest['offset']) != ingest['digest']:
+            return None
+    
+    cache_dir = os.path.dirname(meta_path)
+    columns = {}
+    try:
+        for column in meta['columns']:
+            values = np.load(os.path.join(cache_dir, column['file']), mmap_mode='r', allow_pickle=False)
+            if len(values) != meta['rows']:
+                return None
+            if column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=column['categories'], ordered=column['ordered'])
+            elif column['kind'] == 'object':
+                values = pd.Categorical.from_codes(values, categories=column['categories']).astype(object)
+            columns[column['name']] = values
+    except (OSError, ValueError, KeyError):
+        return None
+    
+    data = pd.DataFrame(columns, copy=False)
+    return data, {
+        'offset': ingest['offset'],
+        'header': base64.b64decode(ingest['header']),
+        'digest': ingest['digest'],
+        'ends_with_newline': ingest['ends_with_newline']
+    }
+
+def _store_farm_binary_cache(file_path, signature, ingest, data):
+    """Best-effort cache write; a read-only data directory just means no sidecar"""
+    if not FARM_BINARY_CACHE:
+        return
+    try:
+        _write_farm_binary_cache(file_path, signature, ingest, data)
+    except Exception as e:
+        print(f"Could not write binary cache for {file_path}: {e}")
+
+def _load_farm_entry_full(file_path, signature):
+    """Load a farm from its binary sidecar cache (plus any appended tail), or parse and aggregate the CSV from scratch"""
+    cached = _load_farm_binary_cache(file_path, signature) if FARM_BINARY_CACHE else None
+    if cached is not None:
+        data, ingest = cached
+        aggregates = build_farm_aggregates(data) if not data.empty else None
+        entry = _build_farm_entry(signature, ingest, data, aggregates, cached_rows=len(data))
+        if ingest['offset'] == signature[1]:
+            return entry
+        # The CSV grew since the sidecar was written
+        entry = _load_farm_entry_appended(file_path, signature, entry)
+        if entry is not None:
+            return entry
+    
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    data = _read_farm_csv(io.BytesIO(raw), file_path)
+    ingest = _ingest_state(raw)
+    _store_farm_binary_cache(file_path, signature, ingest, data)
+    aggregates = build_farm_aggregates(data) if not data.empty else None
+    return _build_farm_entry(signature, ingest, data, aggregates, cached_rows=len(data))
+
+def _load_farm_entry_appended(file_path, signature, previous):
+    """Fold rows appended since `previous` was built into a new entry.
+    
+    The old prefix is hashed (not parsed) to prove it is unchanged; only the
+    bytes after it are parsed, and the rows are added to the farm's
+    _FarmFrameBuffer. Returns None when the prefix differs (an edited row, a
+    rewrite, a truncation), in which case the caller does a full reload.
+    """
+    offset = previous['offset']
+    if not previous['ends_with_newline'] or signature[1] < offset:
+        return None
+    with open(file_path, 'rb') as f:
+        digest = _prefix_digest(f, offset)
+        if digest is None or digest.hexdigest() != previous['digest']:
+            return None
+        tail = f.read(signature[1] - offset)
+    # Digest of exactly the bytes the new entry is built from
+    digest.update(tail)
+    
+    ingest = {
+        'offset': offset + len(tail),
+        'header': previous['header'],
+        'digest': digest.hexdigest(),
+        'ends_with_newline': tail.endswith(b'\n') if tail else previous['ends_with_newline']
+    }
+    unchanged = (previous['data'], previous['aggregates'], previous['buffer'], previous['cached_rows'])
+    if not tail.strip():
+        # Touched or only whitespace appended: nothing new to parse
+        return _build_farm_entry(signature, ingest, *unchanged)
+    
+    new_rows = _read_farm_csv(io.BytesIO(previous['header'] + tail), file_path, first_row=previous['rows'])
+    if new_rows.empty:
+        return _build_farm_entry(signature, ingest, *unchanged)
+    
+    buffer = previous['buffer']
+    if buffer is None or buffer.rows != previous['rows']:
+        buffer = _FarmFrameBuffer(previous['data'])
+    if not buffer.append(new_rows):
+        return None  # Different columns: reload
+    data = buffer.frame()
+    new_aggregates = build_farm_aggregates(new_rows)
+    if previous['aggregates'] is None:
+        aggregates = new_aggregates
+    else:
+        aggregates = merge_farm_aggregates(previous['aggregates'], new_aggregates)
+    print(f"Appended {len(new_rows)} rows to {file_path} ({previous['rows']} -> {len(data)})")
+    
+    cached_rows = previous['cached_rows']
+    if len(data) >= cached_rows * (1 + BINARY_CACHE_REFRESH_GROWTH):
+        _store_farm_binary_cache(file_path, signature, ingest, data)
+        cached_rows = len(data)
+    return _build_farm_entry(signature, ingest, data, aggregates, buffer, cached_rows)
+
+def _get_farm_entry(farm_name):
+    """Return the up-to-date cache entry for a farm, reloading only that farm's file if it changed"""
+    file_path = FARM_FILES.get(farm_name)
+    if file_path is None:
+        return None
+    signature = _farm_file_signature(file_path)
+    if signature is None:
+        with _farm_data_lock:
+            _farm_data_cache.pop(farm_name, None)
+        return None
+    
+    # Fast path: lock-free read of the current entry
+    entry = _farm_data_cache.get(farm_name)
+    if entry is not None and entry['signature'] == signature:
+        return entry
+    
+    with _farm_data_lock:
+        # Another thread may have reloaded this farm while we were waiting
+        previous = _farm_data_cache.get(farm_name)
+        if previous is not None and previous['signature'] == signature:
+            return previous
+        entry = None
+        if previous is not None and APPEND_AWARE_INGEST:
+            entry = _load_farm_entry_appended(file_path, signature, previous)
+        if entry is None:
+            entry = _load_farm_entry_full(file_path, signature)
+        _farm_data_cache[farm_name] = entry
+        return entry
+
 def load_farm_data(farm_name):
-    """Load CSV data for a specific farm"""
-    if farm_name in FARM_FILES and os.path.exists(FARM_FILES[farm_name]):
-        df = pd.read_csv(FARM_FILES[farm_name])
-        df = normalize_column_names(df)
-        if 'HarvestDate' in df.columns:
-            df['HarvestDate'] = pd.to_datetime(df['HarvestDate'])
-        return df
-    return pd.DataFrame()
+    """Load CSV data for a specific farm (served from the shared farm data store)"""
+    entry = _get_farm_entry(farm_name)
+    if entry is None:
+        return pd.DataFrame()
+    return entry['data']
 
 def load_all_farms_data():
-    """Load data from all farms for comparison (cached in memory for efficiency)"""
-    global _farm_data_cache, _farm_data_cache_timestamp
+    """Load data from all farms for comparison (served from the shared farm data store)"""
+    all_data = {}
+    for farm_name in FARM_FILES:
+        entry = _get_farm_entry(farm_name)
+        if entry is not None:
+            all_data[farm_name] = entry['data']
+    return all_data
+
+def clear_farm_data_cache(farm_name=None):
+    """Clear the cached farm data for one farm, or all farms (useful if CSV files are updated)"""
+    with _farm_data_lock:
+        if farm_name is None:
+            _farm_data_cache.clear()
+        else:
+            _farm_data_cache.pop(farm_name, None)
+
+# --- KPI Aggregate Cube ---
+# Every dashboard section, the chatbot context and the comparison views read their
+# numbers from one cube per farm, built in a single aggregation pass when the farm's
+# data is loaded. The cube holds metric x crop x section values, so request time no
+# longer depends on row count and every view reports the same numbers.
+
+# Categorical columns whose value counts are kept in the cube
+CATEGORICAL_AGG_COLUMNS = ['CropType', 'ProcessType', 'PackagingType', 'TransportMode', 'WasteType', 'GradingScore']
+
+# Farm-level metrics: name -> (column, statistic)
+# 'mean'/'std'/'sum' are over non-null values; 'pct' is sum / total records * 100
+FARM_METRICS = {
+    'yield': ('Yield_tonnes_per_ha', 'mean'),
+    'yield_std': ('Yield_tonnes_per_ha', 'std'),
+    'soil_moisture': ('SoilMoisture_%', 'mean'),
+    'temperature': ('Temperature_C', 'mean'),
+    'rainfall': ('Rainfall_mm', 'mean'),
+    'fertilizer': ('Fertilizer_kg_per_ha', 'mean'),
+    'pest_risk': ('PestRiskScore', 'mean'),
+    'harvest_uptime': ('HarvestRobotUptime_%', 'mean'),
+    'storage_temp': ('StorageTemperature_C', 'mean'),
+    'humidity': ('Humidity_%', 'mean'),
+    'spoilage': ('SpoilageRate_%', 'mean'),
+    'shelf_life': ('PredictedShelfLife_days', 'mean'),
+    'storage_days': ('StorageDays', 'mean'),
+    'packaging_speed': ('PackagingSpeed_units_per_min', 'mean'),
+    'defects': ('DefectRate_%', 'mean'),
+    'machinery_uptime': ('MachineryUptime_%', 'mean'),
+    'distance': ('TransportDistance_km', 'mean'),
+    'fuel': ('FuelUsage_L_per_100km', 'mean'),
+    'delivery_time': ('DeliveryTime_hr', 'mean'),
+    'delays': ('DeliveryDelayFlag', 'pct'),
+    'transit_spoilage': ('SpoilageInTransit_%', 'mean'),
+    'inventory': ('RetailInventory_units', 'mean'),
+    'total_inventory': ('RetailInventory_units', 'sum'),
+    'sales_velocity': ('SalesVelocity_units_per_day', 'mean'),
+    'pricing_index': ('DynamicPricingIndex', 'mean'),
+    'waste': ('WastePercentage_%', 'mean'),
+    'household_waste': ('HouseholdWaste_kg', 'mean'),
+    'recipe_accuracy': ('RecipeRecommendationAccuracy_%', 'mean'),
+    'satisfaction': ('SatisfactionScore_0_10', 'mean'),
+    'segregation': ('SegregationAccuracy_%', 'mean'),
+    'upcycling': ('UpcyclingRate_%', 'mean'),
+    'biogas': ('BiogasOutput_m3', 'mean'),
+}
+
+# Per-crop metrics kept for the crop breakdown and crop recommendations
+CROP_METRICS = ['yield', 'spoilage', 'waste', 'defects', 'shelf_life', 'pest_risk']
+
+def _frame_moments(numeric):
+    """Return {column: [count, sum, sum_of_squares]} for a numeric frame"""
+    counts = numeric.count()
+    sums = numeric.sum()
+    sumsqs = (numeric * numeric).sum()
+    return {col: [int(counts[col]), float(sums[col]), float(sumsqs[col])] for col in numeric.columns}
+
+def build_farm_aggregates(data):
+    """Single aggregation pass over a farm's data.
     
-    # Check if cache is still valid (reload if files were modified)
-    current_timestamps = {}
-    for farm_name, file_path in FARM_FILES.items():
-        if os.path.exists(file_path):
-            current_timestamps[farm_name] = os.path.getmtime(file_path)
+    Keeps running moments (count/sum/sum-of-squares) for every numeric column,
+    overall and per crop, defect moments per process type, and value counts for
+    the categorical columns. Means, standard deviations and totals are derived
+    from these, so the same structure can later be updated incrementally.
+    """
+    numeric = data.select_dtypes(include='number').astype('float64')
+    aggregates = {
+        'records': len(data),
+        'moments': _frame_moments(numeric),
+        'crops': {},
+        'defect_by_process': {},
+        'value_counts': {}
+    }
     
-    # Use cache if it exists and files haven't changed
-    if _farm_data_cache is not None and _farm_data_cache_timestamp == current_timestamps:
-        return _farm_data_cache
+    if 'CropType' in data.columns:
+        crop_keys = data['CropType'].dropna().astype(str).str.lower()
+        crop_groups = crop_keys.groupby(crop_keys, sort=False).groups
+        has_dates = 'HarvestDate' in data.columns
+        for crop in crop_keys.unique():
+            index = crop_groups[crop]
+            crop_rows = numeric.loc[index]
+            aggregates['crops'][crop] = {
+                'label': str(data['CropType'].loc[index[0]]),
+                'records': len(crop_rows),
+                'moments': _frame_moments(crop_rows),
+                'last_harvest': data['HarvestDate'].loc[index].max() if has_dates else None
+            }
     
-    # Load fresh data
-    all_data = {}
-    for farm_name, file_path in FARM_FILES.items():
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-            df = normalize_column_names(df)
-            if 'HarvestDate' in df.columns:
-                df['HarvestDate'] = pd.to_datetime(df['HarvestDate'])
-            all_data[farm_name] = df
-    
-    # Update cache
-    _farm_data_cache = all_data
-    _farm_data_cache_timestamp = current_timestamps
+    if 'ProcessType' in data.columns and 'DefectRate_%' in numeric.columns:
+        defect_groups = numeric['DefectRate_%'].groupby(data['ProcessType'], observed=True)
+        counts = defect_groups.count()
+        sums = defect_groups.sum()
+        sumsqs = (numeric['DefectRate_%'] ** 2).groupby(data['ProcessType'], observed=True).sum()
+        for process in counts.index:
+            aggregates['defect_by_process'][process] = [int(counts[process]), float(sums[process]), float(sumsqs[process])]
     
-    return all_data
+    for col in CATEGORICAL_AGG_COLUMNS:
+        if col in data.columns:
+            aggregates['value_counts'][col] = {k: int(v) for k, v in data[col].value_counts().items() if v > 0}
+    
+    return aggregates
+
+def _merge_moments(base, delta):
+    """Add two {key: [count, sum, sum_of_squares]} dicts"""
+    merged = {key: list(moment) for key, moment in base.items()}
+    for key, moment in delta.items():
+        if key in merged:
+            merged[key] = [a + b for a, b in zip(merged[key], moment)]
+        else:
+            merged[key] = list(moment)
+    return merged
+
+def _merge_counts(base, delta):
+    """Add two value-count dicts, keeping them ordered by count like value_counts()"""
+    merged = dict(base)
+    for key, count in delta.items():
+        merged[key] = merged.get(key, 0) + count
+    return dict(sorted(merged.items(), key=lambda item: item[1], reverse=True))
+
+def merge_farm_aggregates(base, delta):
+    """Fold the aggregates of newly appended rows into a farm's running aggregates"""
+    crops = dict(base['crops'])
+    for crop, crop_delta in delta['crops'].items():
+        crop_base = crops.get(crop)
+        if crop_base is None:
+            crops[crop] = crop_delta
+            continue
+        harvests = [h for h in (crop_base['last_harvest'], crop_delta['last_harvest']) if h is not None and not pd.isna(h)]
+        crops[crop] = {
+            'label': crop_base['label'],
+            'records': crop_base['records'] + crop_delta['records'],
+            'moments': _merge_moments(crop_base['moments'], crop_delta['moments']),
+            'last_harvest': max(harvests) if harvests else crop_base['last_harvest']
+        }
+    
+    value_counts = dict(base['value_counts'])
+    for col, counts in delta['value_counts'].items():
+        value_counts[col] = _merge_counts(value_counts.get(col, {}), counts)
+    
+    return {
+        'records': base['records'] + delta['records'],
+        'moments': _merge_moments(base['moments'], delta['moments']),
+        'crops': crops,
+        'defect_by_process': _merge_moments(base['defect_by_process'], delta['defect_by_process']),
+        'value_counts': value_counts
+    }
+
+def _moment_stat(moment, stat, records):
+    """Derive a statistic from [count, sum, sum_of_squares]"""
+    if moment is None:
+        return float('nan')
+    count, total, total_sq = moment
+    if stat == 'sum':
+        return total
+    if stat == 'pct':
+        return total / records * 100 if records else float('nan')
+    if count == 0:
+        return float('nan')
+    mean = total / count
+    if stat == 'mean':
+        return mean
+    if stat == 'std':
+        if count < 2:
+            return float('nan')
+        return float(np.sqrt(max(0.0, (total_sq - total * mean) / (count - 1))))
+    raise ValueError(f"Unknown statistic: {stat}")
+
+def _moments_to_metrics(moments, records, names):
+    """Evaluate the named FARM_METRICS against a moments dict"""
+    return {
+        name: _moment_stat(moments.get(FARM_METRICS[name][0]), FARM_METRICS[name][1], records)
+        for name in names
+    }
+
+def _value_counts_mode(counts):
+    """Most common value; ties go to the smallest value, like Series.mode()[0]"""
+    if not counts:
+        return None
+    top = max(counts.values())
+    return min(k for k, v in counts.items() if v == top)
+
+def build_farm_cube(aggregates):
+    """Build the metric x crop x section cube served by every endpoint from a farm's aggregates"""
+    records = aggregates['records']
+    metrics = _moments_to_metrics(aggregates['moments'], records, FARM_METRICS)
+    
+    crops = {}
+    for crop, crop_aggs in aggregates['crops'].items():
+        crop_metrics = _moments_to_metrics(crop_aggs['moments'], crop_aggs['records'], CROP_METRICS)
+        crop_metrics['label'] = crop_aggs['label']
+        crop_metrics['records'] = crop_aggs['records']
+        crop_metrics['last_harvest'] = crop_aggs['last_harvest']
+        crops[crop] = crop_metrics
+    
+    value_counts = aggregates['value_counts']
+    defect_by_process = {
+        process: _moment_stat(moment, 'mean', records)
+        for process, moment in aggregates['defect_by_process'].items()
+    }
+    yield_by_crop = {crop['label']: crop['yield'] for crop in crops.values()}
+    
+    cube = {
+        'records': records,
+        'metrics': metrics,
+        'crops': crops,
+        'value_counts': value_counts,
+        'grading_mode': _value_counts_mode(value_counts.get('GradingScore', {})),
+        'defect_by_process': defect_by_process,
+        'score': calculate_performance_score(metrics)
+    }
+    
+    m = metrics
+    cube['sections'] = {
+        'kpis': {
+            'total_production': m['yield'],
+            'storage_spoilage': m['spoilage'],
+            'processing_defects': m['defects'],
+            'transport_delays': m['delays'],
+            'retail_inventory': m['total_inventory'],
+            'waste_percentage': m['waste'],
+            'satisfaction': m['satisfaction'],
+            'waste_segregation': m['segregation'],
+            'total_records': records,
+            'pest_risk': m['pest_risk'],
+            'machinery_uptime': m['machinery_uptime'],
+            'harvest_uptime': m['harvest_uptime']
+        },
+        'production': {
+            'crop_types': [crop['label'] for crop in crops.values()],
+            'yield_by_crop': yield_by_crop
+        },
+        'storage': {
+            'avg_temp': m['storage_temp'],
+            'avg_humidity': m['humidity'],
+            'avg_spoilage': m['spoilage'],
+            'avg_shelf_life': m['shelf_life']
+        },
+        'processing': {
+            'avg_defect_rate': m['defects'],
+            'avg_uptime': m['machinery_uptime'],
+            'avg_packaging_speed': m['packaging_speed'],
+            'defect_by_process': defect_by_process
+        },
+        'transportation': {
+            'avg_distance': m['distance'],
+            'avg_fuel': m['fuel'],
+            'avg_delivery_time': m['delivery_time'],
+            'delay_percentage': m['delays']
+        },
+        'retail': {
+            'total_inventory': m['total_inventory'],
+            'avg_sales_velocity': m['sales_velocity'],
+            'avg_pricing_index': m['pricing_index'],
+            'avg_waste': m['waste']
+        },
+        'consumption': {
+            'avg_household_waste': m['household_waste'],
+            'avg_recipe_accuracy': m['recipe_accuracy'],
+            'avg_satisfaction': m['satisfaction']
+        },
+        'waste': {
+            'avg_segregation': m['segregation'],
+            'avg_upcycling': m['upcycling'],
+            'avg_biogas': m['biogas'],
+            'waste_dist': value_counts.get('WasteType', {})
+        }
+    }
+    
+    # The comparison view shows a wider production section than the farm tab
+    cube['comparison'] = dict(cube['sections'])
+    cube['comparison']['production'] = {
+        'yield': m['yield'],
+        'pest_risk': m['pest_risk'],
+        'harvest_uptime': m['harvest_uptime'],
+        'machinery_uptime': m['machinery_uptime'],
+        'yield_by_crop': yield_by_crop
+    }
+    return cube
+
+def get_farm_cube(farm_name):
+    """Return the aggregate cube for a farm, or None if the farm has no data"""
+    entry = _get_farm_entry(farm_name)
+    if entry is None:
+        return None
+    return entry['cube']
+
+def load_all_farm_cubes():
+    """Return {farm_name: cube} for every farm with data"""
+    cubes = {}
+    for farm_name in FARM_FILES:
+        cube = get_farm_cube(farm_name)
+        if cube is not None:
+            cubes[farm_name] = cube
+    return cubes
+
+# --- HTML Fragment Cache ---
+# The detail and price forecast pages are Jinja templates (templates/details.html,
+# comparison_details.html, price_predictions.html). Their expensive parts - a page
+# of records, the cross-farm comparison table, each crop's forecast - are template
+# macros rendered once per key and kept here, least recently used evicted beyond
+# FRAGMENT_CACHE_SIZE. Keys include the data version or model file signature, so
+# stale fragments are simply never asked for again.
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '1024'))
+
+_fragment_cache = OrderedDict()  # key -> Markup
+_fragment_cache_lock = threading.Lock()
+_fragment_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def render_fragment(key, render):
+    """Cached HTML for `key`; on a miss render() is called (outside the lock) and stored"""
+    with _fragment_cache_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+            _fragment_cache_stats['hits'] += 1
+            return fragment
+        _fragment_cache_stats['misses'] += 1
+    
+    fragment = Markup(render())
+    with _fragment_cache_lock:
+        _fragment_cache[key] = fragment
+        _fragment_cache.move_to_end(key)
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+            _fragment_cache_stats['evictions'] += 1
+    return fragment
+
+def clear_fragment_cache():
+    with _fragment_cache_lock:
+        _fragment_cache.clear()
+
+def fragment_cache_stats():
+    with _fragment_cache_lock:
+        stats = dict(_fragment_cache_stats)
+        stats['size'] = len(_fragment_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+# --- Response Compression ---
+# JSON, HTML and text responses of at least COMPRESS_MIN_BYTES are compressed with
+# brotli (when the brotli package is installed) or gzip, whichever the client
+# prefers. Bodies of @http_cached views are also kept, already encoded, in an LRU
+# of RESPONSE_CACHE_MB keyed on (URL, ETag, coding): a repeat request for the same
+# data version skips the view, the JSON encoding and the compression.
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVELS = {'br': 5, 'gzip': 6}
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/html', 'text/csv',
+                          'text/plain', 'text/css', 'application/javascript'}
+RESPONSE_CACHE_MB = float(os.environ.get('RESPONSE_CACHE_MB', '32'))
+
+_body_cache = OrderedDict()  # (full_path, etag, coding) -> (body, headers)
+_body_cache_bytes = 0
+_body_cache_lock = threading.Lock()
+_body_cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+def negotiate_encoding():
+    """'br', 'gzip' or None (identity) for the current request's Accept-Encoding"""
+    codings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_quality = None, 0
+    for coding in codings:
+        quality = request.accept_encodings[coding]
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def compress_body(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=COMPRESS_LEVELS['br'])
+    # mtime=0 keeps the bytes identical for identical input, as a strong ETag requires
+    return gzip.compress(body, compresslevel=COMPRESS_LEVELS['gzip'], mtime=0)
+
+def encode_response(response, coding):
+    """Compress a buffered 200 response in place if its type and size are worth it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if coding is None:
+        return response
+    response.set_data(compress_body(body, coding))
+    response.headers['Content-Encoding'] = coding
+    tag, weak = response.get_etag()
+    if tag:
+        # Each encoding is a different representation, so it gets its own tag
+        response.set_etag(f'{tag}-{coding}', weak)
+    return response
+
+@app.after_request
+def compress_response(response):
+    return encode_response(response, negotiate_encoding())
+
+def _get_cached_body(key):
+    with _body_cache_lock:
+        cached = _body_cache.get(key)
+        if cached is None:
+            _body_cache_stats['misses'] += 1
+            return None
+        _body_cache.move_to_end(key)
+        _body_cache_stats['hits'] += 1
+        return cached
+
+def _store_cached_body(key, response):
+    global _body_cache_bytes
+    body = response.get_data()
+    limit = RESPONSE_CACHE_MB * 1024 * 1024
+    if len(body) > limit / 8:
+        return  # Don't let one large page flush everything else
+    headers = [(name, value) for name, value in response.headers.items() if name.lower() != 'content-length']
+    with _body_cache_lock:
+        previous = _body_cache.pop(key, None)
+        if previous is not None:
+            _body_cache_bytes -= len(previous[0])
+        _body_cache[key] = (body, headers)
+        _body_cache_bytes += len(body)
+        _body_cache_stats['stores'] += 1
+        while _body_cache_bytes > limit and _body_cache:
+            _, (evicted, _) = _body_cache.popitem(last=False)
+            _body_cache_bytes -= len(evicted)
+            _body_cache_stats['evictions'] += 1
+
+def clear_body_cache():
+    global _body_cache_bytes
+    with _body_cache_lock:
+        _body_cache.clear()
+        _body_cache_bytes = 0
+
+def body_cache_stats():
+    with _body_cache_lock:
+        stats = dict(_body_cache_stats)
+        stats['size'] = len(_body_cache)
+        stats['bytes'] = _body_cache_bytes
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+# --- HTTP Caching ---
+# Read-only GET endpoints are wrapped with @http_cached(): their responses carry a
+# strong ETag derived from the data version (farm CSVs + models, salted with the
+# app and template files so a deploy also changes it), a Last-Modified from the
+# newest of those files, and Cache-Control max-age / stale-while-revalidate.
+# A matching If-None-Match (or If-Modified-Since) is answered with 304 before the
+# view runs, so a revalidation costs a few stat() calls and no aggregation.
+# Compressed variants get their own tag (<etag>-gzip, <etag>-br).
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', '60'))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('HTTP_CACHE_STALE_WHILE_REVALIDATE', '600'))
+
+def _code_signature():
+    """Signature of app.py and the page templates, mixed into every ETag"""
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+    paths = [os.path.abspath(__file__)]
+    if os.path.isdir(template_dir):
+        paths += sorted(os.path.join(template_dir, name) for name in os.listdir(template_dir))
+    return hashlib.sha1(repr([_farm_file_signature(path) for path in paths]).encode()).hexdigest()[:8]
+
+_HTTP_CODE_SIGNATURE = _code_signature()
+
+def http_validators():
+    """(etag, last_modified) for the current farm data and models"""
+    signatures = _data_file_signatures()
+    etag = f"{get_data_version(signatures)}-{_HTTP_CODE_SIGNATURE}"
+    mtimes = [signature[0] for _, signature in signatures if signature is not None]
+    last_modified = datetime.fromtimestamp(max(mtimes) // 10**9, tz=timezone.utc) if mtimes else None
+    return etag, last_modified
 
-def clear_farm_data_cache():
-    """Clear the cached farm data (useful if CSV files are updated)"""
-    global _farm_data_cache, _farm_data_cache_timestamp
-    _farm_data_cache = None
-    _farm_data_cache_timestamp = None
+def _matching_etag(etag, last_modified):
+    """
+    The current ETag (or its compressed variant) that the request's validators
+    match, or None if the client's copy is stale. If-None-Match takes precedence.
+    """
+    if request.if_none_match:
+        # Weak comparison: a proxy that compresses the body may have weakened the tag
+        for candidate in [etag] + [f'{etag}-{coding}' for coding in COMPRESS_LEVELS]:
+            if request.if_none_match.contains_weak(candidate):
+                return candidate
+        return None
+    if (last_modified is not None and request.if_modified_since is not None
+            and request.if_modified_since >= last_modified):
+        return etag
+    return None
+
+def http_cached(max_age=None, stale_while_revalidate=None):
+    """Decorator for GET views whose output only depends on the farm data and models"""
+    if max_age is None:
+        max_age = HTTP_CACHE_MAX_AGE
+    if stale_while_revalidate is None:
+        stale_while_revalidate = HTTP_CACHE_STALE_WHILE_REVALIDATE
+    cache_control = f'public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}'
+    
+    def decorate(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = http_validators()
+            matched = _matching_etag(etag, last_modified)
+            if matched is not None:
+                response = Response(status=304)
+                response.set_etag(matched)
+                response.vary.add('Accept-Encoding')
+            else:
+                coding = negotiate_encoding()
+                key = (request.full_path, etag, coding)
+                cached = _get_cached_body(key)
+                if cached is not None:
+                    return Response(cached[0], status=200, headers=cached[1])
+                
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response  # Errors are not cached
+                response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            if matched is None:
+                encode_response(response, coding)
+                if not response.is_streamed:
+                    _store_cached_body(key, response)
+            return response
+        return wrapper
+    return decorate
+
+# --- Batch Record API ---
+# /api/records/<farm>/<stage> pages through a farm's batches as JSON. Each farm
+# entry in the data store gets a record index: for every numeric column (and
+# HarvestDate) the row order sorted by that column, plus crop codes for the
+# CropType filter. Pages are addressed by a keyset cursor (last sort value, row
+# id) that is located with a binary search, so a deep page costs the same as
+# the first one and stays stable when rows are appended.
+
+# Columns shown for each stage, by the detail pages and the record API
+STAGE_FIELDS = {
+    'production': ['BatchID', 'CropType', 'FarmLocation', 'SoilMoisture_%', 'Temperature_C', 'Rainfall_mm', 'Fertilizer_kg_per_ha', 'Yield_tonnes_per_ha', 'PestRiskScore', 'HarvestRobotUptime_%'],
+    'storage': ['BatchID', 'CropType', 'GradingScore', 'StorageTemperature_C', 'Humidity_%', 'SpoilageRate_%', 'PredictedShelfLife_days', 'StorageDays'],
+    'processing': ['BatchID', 'ProcessType', 'PackagingType', 'PackagingSpeed_units_per_min', 'DefectRate_%', 'MachineryUptime_%'],
+    'transportation': ['BatchID', 'TransportMode', 'TransportDistance_km', 'FuelUsage_L_per_100km', 'DeliveryTime_hr', 'DeliveryDelayFlag', 'SpoilageInTransit_%'],
+    'retail': ['BatchID', 'CropType', 'RetailInventory_units', 'SalesVelocity_units_per_day', 'DynamicPricingIndex', 'WastePercentage_%'],
+    'consumption': ['BatchID', 'HouseholdWaste_kg', 'RecipeRecommendationAccuracy_%', 'SatisfactionScore_0_10'],
+    'waste': ['BatchID', 'WasteType', 'SegregationAccuracy_%', 'UpcyclingRate_%', 'BiogasOutput_m3'],
+    'overview': ['BatchID', 'CropType', 'Yield_tonnes_per_ha', 'SpoilageRate_%', 'DefectRate_%', 'WastePercentage_%']
+}
+
+STAGE_TITLES = {
+    'production': 'Production Stage',
+    'storage': 'Storage & Post-Harvest',
+    'processing': 'Processing & Packaging',
+    'transportation': 'Distribution & Transportation',
+    'retail': 'Retail Insights',
+    'consumption': 'Consumption & Household',
+    'waste': 'Waste Management',
+    'overview': 'Dashboard Overview'
+}
+
+RECORDS_PAGE_SIZE = 50
+RECORDS_MAX_PAGE_SIZE = 1000
+
+_record_index_lock = threading.Lock()
+
+class RecordQueryError(ValueError):
+    """Invalid record API parameters (answered with HTTP 400)"""
+
+def build_record_index(data):
+    """Sort orders and filter columns for one farm's frame.
+    
+    For each sortable column, 'order' holds the row ids sorted by value (ties by
+    row id) with missing values at the end, and 'keys' the sorted non-missing
+    values, so a cursor can be found with searchsorted. Dates are keyed by their
+    int64 nanoseconds.
+    """
+    index = {'rows': len(data), 'values': {}, 'sort': {}, 'crop_codes': None, 'crop_lookup': {}}
+    for col in data.columns:
+        series = data[col]
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            values = series.to_numpy(dtype='datetime64[ns]')
+            missing = np.isnat(values)
+            keys = values.view('int64')
+        elif pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            values = series.to_numpy()
+            missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+            keys = values
+        else:
+            continue
+        valid_rows = np.flatnonzero(~missing)
+        order = np.concatenate([valid_rows[np.argsort(keys[valid_rows], kind='stable')], np.flatnonzero(missing)])
+        order = order.astype(np.int32 if len(order) < 2 ** 31 else np.int64)
+        index['values'][col] = values
+        index['sort'][col] = {
+            'order': order,
+            'keys': keys[order[:len(valid_rows)]],
+            'valid': len(valid_rows),
+            'row_keys': keys,
+            'missing': missing
+        }
+    
+    if 'CropType' in data.columns:
+        codes, uniques = pd.factorize(data['CropType'])
+        index['crop_codes'] = codes
+        for code, crop in enumerate(uniques):
+            index['crop_lookup'].setdefault(str(crop).strip().lower(), []).append(code)
+    return index
+
+def get_record_index(entry):
+    """
+    Return the record index of a farm entry's data (built once per data version).
+    Callers pass the entry whose 'data' they read, so the index always matches it.
+    """
+    index = entry.get('record_index')
+    if index is None:
+        with _record_index_lock:
+            index = entry.get('record_index')
+            if index is None:
+                index = build_record_index(entry['data'])
+                entry['record_index'] = index
+    return index
+
+def load_all_record_indexes():
+    """Build the record index of every farm (warmup stage)"""
+    indexes = {}
+    for farm_name in FARM_FILES:
+        entry = _get_farm_entry(farm_name)
+        if entry is not None:
+            indexes[farm_name] = get_record_index(entry)
+    return indexes
+
+def _record_column(name, index):
+    """Resolve a sortable column by name or FARM_METRICS alias (e.g. 'spoilage')"""
+    if name in index['sort']:
+        return name
+    if name in FARM_METRICS and FARM_METRICS[name][0] in index['sort']:
+        return FARM_METRICS[name][0]
+    if name.lower() in ('harvestdate', 'harvest_date') and 'HarvestDate' in index['sort']:
+        return 'HarvestDate'
+    raise RecordQueryError(f"Unknown or non-numeric column '{name}'")
+
+def _parse_record_date(value, name):
+    try:
+        return np.datetime64(pd.Timestamp(value).to_datetime64(), 'ns')
+    except (ValueError, TypeError):
+        raise RecordQueryError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+def _record_filter_mask(index, args):
+    """Boolean row mask for the crop / harvest date / min_ / max_ filters, or None if unfiltered"""
+    mask = None
+    
+    def narrow(condition):
+        nonlocal mask
+        mask = condition if mask is None else mask & condition
+    
+    crops = [c.strip().lower() for c in args.get('crop', '').split(',') if c.strip()]
+    if crops:
+        if index['crop_codes'] is None:
+            raise RecordQueryError("This farm has no CropType column")
+        codes = [code for crop in crops for code in index['crop_lookup'].get(crop, [])]
+        narrow(np.isin(index['crop_codes'], codes))
+    
+    for name, op in (('harvested_from', np.greater_equal), ('harvested_to', np.less_equal)):
+        if args.get(name):
+            if 'HarvestDate' not in index['values']:
+                raise RecordQueryError("This farm has no HarvestDate column")
+            narrow(op(index['values']['HarvestDate'], _parse_record_date(args[name], name)))
+    
+    for key, value in args.items():
+        if key.startswith('min_'):
+            op = np.greater_equal
+        elif key.startswith('max_'):
+            op = np.less_equal
+        else:
+            continue
+        col = _record_column(key[4:], index)
+        if col == 'HarvestDate':
+            threshold = _parse_record_date(value, key)
+        else:
+            try:
+                threshold = float(value)
+            except ValueError:
+                raise RecordQueryError(f"'{key}' must be a number")
+        # Missing values never satisfy a threshold
+        narrow(op(index['values'][col], threshold))
+    return mask
+
+def _select_record_fields(stage, available, args):
+    """The `fields` projection (default: every available stage column)"""
+    if not args.get('fields'):
+        return list(available)
+    fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise RecordQueryError(f"Unknown fields for stage '{stage}': {', '.join(unknown)}")
+    return fields
+
+def _encode_record_cursor(sort, descending, value, row):
+    payload = json.dumps([sort, descending, value, int(row)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_record_cursor(cursor, sort, descending):
+    """Return (value, row) after which the next page starts"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_descending, value, row = json.loads(base64.urlsafe_b64decode(padded))
+        row = int(row)
+    except (ValueError, TypeError):
+        raise RecordQueryError("Invalid cursor")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise RecordQueryError("Cursor was issued for a different sort order")
+    return value, row
+
+def _record_runs(index, sort, descending, cursor):
+    """Row-id arrays that, read in sequence, continue the listing after the cursor"""
+    if sort is None:
+        # File order: the row id is the key
+        start = 0 if cursor is None else cursor[1] + 1
+        return [np.arange(max(start, 0), index['rows'])]
+    
+    sort_index = index['sort'][sort]
+    order, keys, valid = sort_index['order'], sort_index['keys'], sort_index['valid']
+    ranked, missing = order[:valid], order[valid:]
+    if cursor is None:
+        head, tail_start = 0, 0
+    else:
+        value, row = cursor
+        if value is None:
+            # The previous page ended among the rows with no value
+            head, tail_start = valid, int(np.searchsorted(missing, row, side='right'))
+        else:
+            lo = int(np.searchsorted(keys, value, side='left'))
+            hi = int(np.searchsorted(keys, value, side='right'))
+            ties = ranked[lo:hi]  # Equal keys are ordered by row id
+            if descending:
+                head = valid - (lo + int(np.searchsorted(ties, row, side='left')))
+            else:
+                head = lo + int(np.searchsorted(ties, row, side='right'))
+            tail_start = 0
+    if descending:
+        ranked = ranked[::-1]
+    return [ranked[head:], missing[tail_start:]]
+
+def _collect_record_rows(runs, mask, limit):
+    """The first `limit` row ids from the runs that pass the mask.
+    
+    Filtered runs are scanned in growing chunks, so the work depends on how many
+    rows are skipped, not on how deep the page is.
+    """
+    rows = []
+    found = 0
+    for run in runs:
+        if mask is None:
+            rows.append(run[:limit - found])
+            found += len(rows[-1])
+        else:
+            start, chunk = 0, max(256, limit * 4)
+            while start < len(run) and found < limit:
+                candidates = run[start:start + chunk]
+                hits = candidates[mask[candidates]][:limit - found]
+                rows.append(hits)
+                found += len(hits)
+                start += chunk
+                chunk *= 2
+        if found >= limit:
+            break
+    return np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+
+def _records_json(data, rows, fields):
+    """Selected rows as a list of JSON-ready dicts (missing values as null, dates as YYYY-MM-DD)"""
+    columns = []
+    for field in fields:
+        values = data[field].array.take(rows)
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            values = values.strftime('%Y-%m-%d')
+        values = np.asarray(values)
+        if values.dtype == np.float32:
+            # Shortest float32 repr, so 72.75053 isn't sent as 72.75052642822266
+            values = values.astype(str).astype(np.float64)
+        column = values.tolist()
+        for i in np.flatnonzero(pd.isna(values)):
+            column[i] = None
+        columns.append(column)
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+def query_records(farm_name, stage, args):
+    """One page of a farm's batch records; returns None if the farm has no data.
+    
+    `args` are the request's query parameters: fields, sort (prefix '-' for
+    descending), limit, cursor, crop, harvested_from/harvested_to and
+    min_<column>/max_<column> thresholds. Raises RecordQueryError for bad input.
+    """
+    entry = _get_farm_entry(farm_name)
+    if entry is None:
+        return None
+    data = entry['data']
+    index = get_record_index(entry)
+    
+    fields = _select_record_fields(stage, [f for f in STAGE_FIELDS[stage] if f in data.columns], args)
+    
+    try:
+        limit = int(args.get('limit', RECORDS_PAGE_SIZE))
+    except ValueError:
+        raise RecordQueryError("'limit' must be an integer")
+    limit = max(1, min(limit, RECORDS_MAX_PAGE_SIZE))
+    
+    sort_param = args.get('sort', '').strip()
+    descending = sort_param.startswith('-')
+    sort = _record_column(sort_param.lstrip('-'), index) if sort_param.lstrip('-') else None
+    if sort is None and descending:
+        raise RecordQueryError("'sort' needs a column")
+    
+    cursor = _decode_record_cursor(args['cursor'], sort, descending) if args.get('cursor') else None
+    mask = _record_filter_mask(index, args)
+    
+    # One extra row tells whether there is a next page
+    rows = _collect_record_rows(_record_runs(index, sort, descending, cursor), mask, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = int(rows[-1])
+        value = None
+        if sort is not None and not index['sort'][sort]['missing'][last]:
+            value = index['sort'][sort]['row_keys'][last].item()
+        next_cursor = _encode_record_cursor(sort, descending, value, last)
+    
+    return {
+        'farm': farm_name,
+        'stage': stage,
+        'fields': fields,
+        'sort': (('-' if descending else '') + sort) if sort else None,
+        'total': int(mask.sum()) if mask is not None else index['rows'],
+        'count': len(rows),
+        'records': _records_json(data, rows, fields),
+        'next_cursor': next_cursor
+    }
+
+@app.route('/api/records/<farm_name>/<stage>')
+@http_cached()
+def get_farm_records(farm_name, stage):
+    """Paginated, filterable, sortable batch records for one farm and stage"""
+    if stage not in STAGE_FIELDS:
+        return jsonify({'error': 'Stage not found'}), 404
+    try:
+        page = query_records(farm_name, stage, request.args)
+    except RecordQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    if page is None:
+        return jsonify({'error': 'Farm not found'}), 404
+    return jsonify(page)
+
+# --- Stage Export ---
+# /api/export/<stage> streams a stage's columns for every farm as CSV or NDJSON,
+# EXPORT_CHUNK_ROWS rows at a time, straight from the shared farm frames. Only
+# one chunk is materialised at a time, so memory stays flat however many rows
+# are exported, and the body is gzipped on the fly when the client accepts it.
+
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_GZIP_LEVEL = 6
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def _export_chunks(sources, fields, export_format):
+    """Chunks of the export for [(farm_name, data, mask)]: CSV text (header first) or NDJSON bytes"""
+    if export_format == 'csv':
+        yield pd.DataFrame(columns=['Farm'] + fields).to_csv(index=False)
+    for farm_name, data, mask in sources:
+        present = [f for f in fields if f in data.columns]
+        positions = [data.columns.get_loc(f) for f in present]
+        for start in range(0, len(data), EXPORT_CHUNK_ROWS):
+            rows = np.arange(start, min(start + EXPORT_CHUNK_ROWS, len(data)))
+            if mask is not None:
+                rows = rows[mask[start:start + EXPORT_CHUNK_ROWS]]
+            if not len(rows):
+                continue
+            if export_format == 'csv':
+                chunk = data.iloc[rows, positions].reindex(columns=fields)
+                chunk.insert(0, 'Farm', farm_name)
+                yield chunk.to_csv(index=False, header=False, date_format='%Y-%m-%d')
+            else:
+                dumpb = app.json.dumpb
+                yield b''.join(dumpb({'Farm': farm_name, **record}, sort_keys=False) + b'\n'
+                               for record in _records_json(data, rows, present))
+
+def _gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    """Compress a stream of text or byte chunks into one gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@app.route('/api/export/<stage>')
+def export_stage(stage):
+    """
+    Stream every record of a stage as CSV (default) or NDJSON (?format=ndjson).
+    ?farm=FarmA,FarmC limits the farms; fields and the record API filters apply.
+    """
+    if stage not in STAGE_FIELDS:
+        return jsonify({'error': 'Stage not found'}), 404
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{export_format}' (use csv or ndjson)"}), 400
+    farm_names = [f.strip() for f in request.args.get('farm', '').split(',') if f.strip()] or list(FARM_FILES)
+    unknown = [f for f in farm_names if f not in FARM_FILES]
+    if unknown:
+        return jsonify({'error': f"Unknown farms: {', '.join(unknown)}"}), 404
+    
+    try:
+        fields = _select_record_fields(stage, STAGE_FIELDS[stage], request.args)
+        sources = []
+        for farm_name in farm_names:
+            entry = _get_farm_entry(farm_name)
+            if entry is not None:
+                mask = _record_filter_mask(get_record_index(entry), request.args)
+                sources.append((farm_name, entry['data'], mask))
+    except RecordQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunks = _export_chunks(sources, fields, export_format)
+    headers = {
+        'Content-Disposition': f'attachment; filename="{stage}-records.{export_format}"',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no'
+    }
+    if request.accept_encodings['gzip']:
+        chunks = _gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=EXPORT_FORMATS[export_format], headers=headers)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/farm/<farm_name>/kpis')
+@http_cached()
 def get_farm_kpis(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    kpis = {
-        'total_production': float(data['Yield_tonnes_per_ha'].mean()),
-        'storage_spoilage': float(data['SpoilageRate_%'].mean()),
-        'processing_defects': float(data['DefectRate_%'].mean()),
-        'transport_delays': float((data['DeliveryDelayFlag'].sum() / len(data) * 100)),
-        'retail_inventory': float(data['RetailInventory_units'].sum()),
-        'waste_percentage': float(data['WastePercentage_%'].mean()),
-        'satisfaction': float(data['SatisfactionScore_0_10'].mean()),
-        'waste_segregation': float(data['SegregationAccuracy_%'].mean()),
-        'total_records': len(data),
-        'pest_risk': float(data['PestRiskScore'].mean()),
-        'machinery_uptime': float(data['MachineryUptime_%'].mean()),
-        'harvest_uptime': float(data['HarvestRobotUptime_%'].mean())
-    }
-    return jsonify(kpis)
+    return jsonify(cube['sections']['kpis'])
 
 @app.route('/api/farm/<farm_name>/production')
+@http_cached()
 def get_farm_production_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    yield_by_crop = data.groupby('CropType')['Yield_tonnes_per_ha'].mean().to_dict()
-    return jsonify({'crop_types': data['CropType'].unique().tolist(), 'yield_by_crop': yield_by_crop})
+    return jsonify(cube['sections']['production'])
 
 @app.route('/api/farm/<farm_name>/storage')
+@http_cached()
 def get_farm_storage_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    return jsonify({
-        'avg_temp': float(data['StorageTemperature_C'].mean()),
-        'avg_humidity': float(data['Humidity_%'].mean()),
-        'avg_spoilage': float(data['SpoilageRate_%'].mean()),
-        'avg_shelf_life': float(data['PredictedShelfLife_days'].mean())
-    })
+    return jsonify(cube['sections']['storage'])
 
 @app.route('/api/farm/<farm_name>/processing')
+@http_cached()
 def get_farm_processing_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    defect_by_process = data.groupby('ProcessType')['DefectRate_%'].mean().to_dict()
-    return jsonify({
-        'avg_defect_rate': float(data['DefectRate_%'].mean()),
-        'avg_uptime': float(data['MachineryUptime_%'].mean()),
-        'avg_packaging_speed': float(data['PackagingSpeed_units_per_min'].mean()),
-        'defect_by_process': defect_by_process
-    })
+    return jsonify(cube['sections']['processing'])
 
 @app.route('/api/farm/<farm_name>/transportation')
+@http_cached()
 def get_farm_transportation_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    return jsonify({
-        'avg_distance': float(data['TransportDistance_km'].mean()),
-        'avg_fuel': float(data['FuelUsage_L_per_100km'].mean()),
-        'avg_delivery_time': float(data['DeliveryTime_hr'].mean()),
-        'delay_percentage': float((data['DeliveryDelayFlag'].sum() / len(data) * 100))
-    })
+    return jsonify(cube['sections']['transportation'])
 
 @app.route('/api/farm/<farm_name>/retail')
+@http_cached()
 def get_farm_retail_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    return jsonify({
-        'total_inventory': float(data['RetailInventory_units'].sum()),
-        'avg_sales_velocity': float(data['SalesVelocity_units_per_day'].mean()),
-        'avg_pricing_index': float(data['DynamicPricingIndex'].mean()),
-        'avg_waste': float(data['WastePercentage_%'].mean())
-    })
+    return jsonify(cube['sections']['retail'])
 
 @app.route('/api/farm/<farm_name>/consumption')
+@http_cached()
 def get_farm_consumption_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    return jsonify({
-        'avg_household_waste': float(data['HouseholdWaste_kg'].mean()),
-        'avg_recipe_accuracy': float(data['RecipeRecommendationAccuracy_%'].mean()),
-        'avg_satisfaction': float(data['SatisfactionScore_0_10'].mean())
-    })
+    return jsonify(cube['sections']['consumption'])
 
 @app.route('/api/farm/<farm_name>/waste')
+@http_cached()
 def get_farm_waste_data(farm_name):
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return jsonify({'error': 'Farm not found'}), 404
-    
-    waste_dist = data['WasteType'].value_counts().to_dict()
-    return jsonify({
-        'avg_segregation': float(data['SegregationAccuracy_%'].mean()),
-        'avg_upcycling': float(data['UpcyclingRate_%'].mean()),
-        'avg_biogas': float(data['BiogasOutput_m3'].mean()),
-        'waste_dist': waste_dist
-    })
+    return jsonify(cube['sections']['waste'])
 
 @app.route('/api/comparison/<section>')
+@http_cached()
 def get_comparison_data(section):
     """Get comparison data for all farms for a specific section"""
-    all_farms = load_all_farms_data()
+    all_cubes = load_all_farm_cubes()
     comparison = {}
     
-    for farm_name, data in all_farms.items():
-        if section == 'production':
-            yield_by_crop = data.groupby('CropType')['Yield_tonnes_per_ha'].mean().to_dict()
-            comparison[farm_name] = {
-                'yield': float(data['Yield_tonnes_per_ha'].mean()),
-                'pest_risk': float(data['PestRiskScore'].mean()),
-                'harvest_uptime': float(data['HarvestRobotUptime_%'].mean()),
-                'machinery_uptime': float(data['MachineryUptime_%'].mean()),
-                'yield_by_crop': yield_by_crop
-            }
-        elif section == 'storage':
-            comparison[farm_name] = {
-                'avg_temp': float(data['StorageTemperature_C'].mean()),
-                'avg_humidity': float(data['Humidity_%'].mean()),
-                'avg_spoilage': float(data['SpoilageRate_%'].mean()),
-                'avg_shelf_life': float(data['PredictedShelfLife_days'].mean())
-            }
-        elif section == 'processing':
-            defect_by_process = data.groupby('ProcessType')['DefectRate_%'].mean().to_dict()
-            comparison[farm_name] = {
-                'avg_defect_rate': float(data['DefectRate_%'].mean()),
-                'avg_uptime': float(data['MachineryUptime_%'].mean()),
-                'avg_packaging_speed': float(data['PackagingSpeed_units_per_min'].mean()),
-                'defect_by_process': defect_by_process
-            }
-        elif section == 'transportation':
-            comparison[farm_name] = {
-                'avg_distance': float(data['TransportDistance_km'].mean()),
-                'avg_fuel': float(data['FuelUsage_L_per_100km'].mean()),
-                'avg_delivery_time': float(data['DeliveryTime_hr'].mean()),
-                'delay_percentage': float((data['DeliveryDelayFlag'].sum() / len(data) * 100))
-            }
-        elif section == 'retail':
-            comparison[farm_name] = {
-                'total_inventory': float(data['RetailInventory_units'].sum()),
-                'avg_sales_velocity': float(data['SalesVelocity_units_per_day'].mean()),
-                'avg_pricing_index': float(data['DynamicPricingIndex'].mean()),
-                'avg_waste': float(data['WastePercentage_%'].mean())
-            }
-        elif section == 'consumption':
-            comparison[farm_name] = {
-                'avg_household_waste': float(data['HouseholdWaste_kg'].mean()),
-                'avg_recipe_accuracy': float(data['RecipeRecommendationAccuracy_%'].mean()),
-                'avg_satisfaction': float(data['SatisfactionScore_0_10'].mean())
-            }
-        elif section == 'waste':
-            waste_dist = data['WasteType'].value_counts().to_dict()
-            comparison[farm_name] = {
-                'avg_segregation': float(data['SegregationAccuracy_%'].mean()),
-                'avg_upcycling': float(data['UpcyclingRate_%'].mean()),
-                'avg_biogas': float(data['BiogasOutput_m3'].mean()),
-                'waste_dist': waste_dist
-            }
+    for farm_name, cube in all_cubes.items():
+        if section in cube['comparison'] and section != 'kpis':
+            comparison[farm_name] = cube['comparison'][section]
     
     return jsonify(comparison)
 
 @app.route('/api/overview')
+@http_cached()
 def get_overview():
     """Get comparison data for all farms"""
-    all_farms = load_all_farms_data()
+    all_cubes = load_all_farm_cubes()
     overview = {}
     
-    for farm_name, data in all_farms.items():
+    for farm_name, cube in all_cubes.items():
+        m = cube['metrics']
         overview[farm_name] = {
-            'yield': float(data['Yield_tonnes_per_ha'].mean()),
-            'spoilage': float(data['SpoilageRate_%'].mean()),
-            'defects': float(data['DefectRate_%'].mean()),
-            'delays': float((data['DeliveryDelayFlag'].sum() / len(data) * 100)),
-            'waste': float(data['WastePercentage_%'].mean()),
-            'satisfaction': float(data['SatisfactionScore_0_10'].mean()),
-            'pest_risk': float(data['PestRiskScore'].mean()),
-            'machinery_uptime': float(data['MachineryUptime_%'].mean()),
-            'total_records': len(data),
-            'performance_score': 0  # Will calculate below
+            'yield': m['yield'],
+            'spoilage': m['spoilage'],
+            'defects': m['defects'],
+            'delays': m['delays'],
+            'waste': m['waste'],
+            'satisfaction': m['satisfaction'],
+            'pest_risk': m['pest_risk'],
+            'machinery_uptime': m['machinery_uptime'],
+            'total_records': cube['records'],
+            # The same score the chatbot and the insights report
+            'performance_score': round(cube['score'], 1)
         }
     
-    # Calculate performance scores (0-100)
-    if overview:
-        max_yield = max(f['yield'] for f in overview.values())
-        min_spoilage = min(f['spoilage'] for f in overview.values())
-        min_defects = min(f['defects'] for f in overview.values())
-        min_delays = min(f['delays'] for f in overview.values())
-        min_waste = min(f['waste'] for f in overview.values())
-        max_satisfaction = max(f['satisfaction'] for f in overview.values())
-        min_pest = min(f['pest_risk'] for f in overview.values())
-        max_uptime = max(f['machinery_uptime'] for f in overview.values())
-        
-        for farm_name in overview:
-            f = overview[farm_name]
-            score = (
-                (f['yield'] / max_yield * 20 if max_yield > 0 else 0) +
-                ((1 - f['spoilage'] / 30) * 15 if f['spoilage'] < 30 else 0) +
-                ((1 - f['defects'] / 15) * 15 if f['defects'] < 15 else 0) +
-                ((1 - f['delays'] / 30) * 10 if f['delays'] < 30 else 0) +
-                ((1 - f['waste'] / 25) * 10 if f['waste'] < 25 else 0) +
-                (f['satisfaction'] / 10 * 15) +
-                ((1 - f['pest_risk'] / 100) * 10 if f['pest_risk'] < 100 else 0) +
-                (f['machinery_uptime'] / 100 * 5)
-            )
-            f['performance_score'] = round(score, 1)
-    
     return jsonify(overview)
 
 @app.route('/api/ai-insights/<farm_name>/<section>')
+@http_cached()
 def get_ai_insights(farm_name, section):
     """Generate smart AI insights based on actual data analysis"""
     if farm_name == 'all':
-        all_farms = load_all_farms_data()
-        return generate_comparison_insights(all_farms, section)
+        all_cubes = load_all_farm_cubes()
+        return generate_comparison_insights(all_cubes, section)
     else:
-        data = load_farm_data(farm_name)
-        if data.empty:
+        cube = get_farm_cube(farm_name)
+        if cube is None:
             return jsonify({'error': 'Farm not found'}), 404
-        return generate_farm_insights(farm_name, data, section)
+        return generate_farm_insights(farm_name, cube, section)
 
-def generate_comparison_insights(all_farms, section):
+def generate_comparison_insights(all_cubes, section):
     """Generate concise insights comparing all farms"""
     insights = []
     recommendations = []
     farm_insights = {}  # One-line insights per farm
     
-    # Calculate metrics for all farms
+    # Metrics for all farms come straight from the aggregate cube
     farms_data = {}
-    for farm_name, data in all_farms.items():
-        farms_data[farm_name] = {
-            'yield': float(data['Yield_tonnes_per_ha'].mean()),
-            'spoilage': float(data['SpoilageRate_%'].mean()),
-            'defects': float(data['DefectRate_%'].mean()),
-            'delays': float((data['DeliveryDelayFlag'].sum() / len(data) * 100)),
-            'waste': float(data['WastePercentage_%'].mean()),
-            'satisfaction': float(data['SatisfactionScore_0_10'].mean()),
-            'pest_risk': float(data['PestRiskScore'].mean()),
-            'machinery_uptime': float(data['MachineryUptime_%'].mean()),
-            'harvest_uptime': float(data['HarvestRobotUptime_%'].mean()),
-            'storage_temp': float(data['StorageTemperature_C'].mean()),
-            'humidity': float(data['Humidity_%'].mean()),
-            'shelf_life': float(data['PredictedShelfLife_days'].mean()),
-            'segregation': float(data['SegregationAccuracy_%'].mean()),
-            'upcycling': float(data['UpcyclingRate_%'].mean()),
-            'biogas': float(data['BiogasOutput_m3'].mean()),
-        }
+    for farm_name, cube in all_cubes.items():
+        farms_data[farm_name] = cube['metrics']
         farm_insights[farm_name] = []
     
     # Production insights
@@ -546,10 +1731,8 @@ def generate_comparison_insights(all_farms, section):
     elif section == 'transportation':
         best_delays = min(farms_data.items(), key=lambda x: x[1]['delays'])
         worst_delays = max(farms_data.items(), key=lambda x: x[1]['delays'])
-        # Calculate fuel usage from data if available
-        fuel_data = {}
-        for farm_name, data in all_farms.items():
-            fuel_data[farm_name] = float(data['FuelUsage_L_per_100km'].mean())
+        # Fuel usage per farm
+        fuel_data = {farm_name: metrics['fuel'] for farm_name, metrics in farms_data.items()}
         best_fuel = min(fuel_data.items(), key=lambda x: x[1]) if fuel_data else None
         worst_fuel = max(fuel_data.items(), key=lambda x: x[1]) if fuel_data else None
         
@@ -691,9 +1874,6 @@ def generate_comparison_insights(all_farms, section):
         best_yield = max(farms_data.items(), key=lambda x: x[1]['yield'])
         worst_spoilage = max(farms_data.items(), key=lambda x: x[1]['spoilage'])
         best_satisfaction = max(farms_data.items(), key=lambda x: x[1]['satisfaction'])
-        worst_performer = min(farms_data.items(), key=lambda x: (
-            x[1]['yield'] / 10 - x[1]['spoilage'] / 20 + x[1]['satisfaction'] / 10
-        ))
         
         insights.append(f"🏆 {best_yield[0]} leads in production ({best_yield[1]['yield']:.1f}t/ha)")
         if worst_spoilage[1]['spoilage'] > 15:
@@ -702,16 +1882,9 @@ def generate_comparison_insights(all_farms, section):
         insights.append(f"⭐ {best_satisfaction[0]} has highest satisfaction ({best_satisfaction[1]['satisfaction']:.1f}/10)")
         
         # Farm-specific insights based on performance score
-        for farm, metrics in farms_data.items():
-            score = (metrics['yield'] / 10 * 20 + 
-                    (1 - metrics['spoilage'] / 30) * 15 +
-                    metrics['satisfaction'] / 10 * 15)
-            if score > 70:
-                farm_insights[farm] = "Excellent performance"
-            elif score > 55:
-                farm_insights[farm] = "Good performance"
-            else:
-                farm_insights[farm] = "Needs improvement"
+        for farm in farms_data:
+            score = all_cubes[farm]['score']
+            farm_insights[farm] = f"{performance_status(score)} ({score:.0f}/100)"
     
     # Ensure all farms have insights
     for farm in farms_data.keys():
@@ -751,18 +1924,19 @@ def generate_comparison_insights(all_farms, section):
         'farm_insights': farm_insights
     })
 
-def generate_farm_insights(farm_name, data, section):
+def generate_farm_insights(farm_name, cube, section):
     """Generate comprehensive insights for a specific farm and section - 5-6 insights with optimization suggestions"""
     insights = []
     recommendations = []
+    m = cube['metrics']
     
     if section == 'overview' or section == 'production':
-        yield_avg = float(data['Yield_tonnes_per_ha'].mean())
-        yield_std = float(data['Yield_tonnes_per_ha'].std())
-        pest_risk = float(data['PestRiskScore'].mean())
-        uptime = float(data['HarvestRobotUptime_%'].mean())
-        fertilizer = float(data['Fertilizer_kg_per_ha'].mean())
-        rainfall = float(data['Rainfall_mm'].mean())
+        yield_avg = m['yield']
+        yield_std = m['yield_std']
+        pest_risk = m['pest_risk']
+        uptime = m['harvest_uptime']
+        fertilizer = m['fertilizer']
+        rainfall = m['rainfall']
         
         optimal_yield = 7.0
         critical_pest = 50
@@ -808,11 +1982,11 @@ def generate_farm_insights(farm_name, data, section):
             recommendations.append("Conduct soil tests to optimize fertilizer application")
     
     if section == 'overview' or section == 'storage':
-        spoilage = float(data['SpoilageRate_%'].mean())
-        temp = float(data['StorageTemperature_C'].mean())
-        humidity = float(data['Humidity_%'].mean())
-        shelf_life = float(data['PredictedShelfLife_days'].mean())
-        storage_days = float(data['StorageDays'].mean())
+        spoilage = m['spoilage']
+        temp = m['storage_temp']
+        humidity = m['humidity']
+        shelf_life = m['shelf_life']
+        storage_days = m['storage_days']
         critical_spoilage = 15
         optimal_temp_range = (2, 5)
         optimal_humidity = (75, 85)
@@ -853,9 +2027,9 @@ def generate_farm_insights(farm_name, data, section):
             insights.append(f"✅ Good shelf life ({shelf_life:.1f} days)")
     
     if section == 'overview' or section == 'processing':
-        defect_rate = float(data['DefectRate_%'].mean())
-        machinery_uptime = float(data['MachineryUptime_%'].mean())
-        packaging_speed = float(data['PackagingSpeed_units_per_min'].mean())
+        defect_rate = m['defects']
+        machinery_uptime = m['machinery_uptime']
+        packaging_speed = m['packaging_speed']
         critical_defects = 5
         optimal_uptime = 95
         
@@ -888,18 +2062,18 @@ def generate_farm_insights(farm_name, data, section):
             insights.append(f"✅ Good packaging efficiency ({packaging_speed:.0f} units/min)")
         
         # Process type analysis
-        defect_by_process = data.groupby('ProcessType')['DefectRate_%'].mean()
+        defect_by_process = cube['defect_by_process']
         if len(defect_by_process) > 0:
-            worst_process = defect_by_process.idxmax()
-            if defect_by_process.max() > critical_defects:
-                insights.append(f"🔍 {worst_process} process has highest defects ({defect_by_process.max():.1f}%)")
+            worst_process = max(defect_by_process, key=defect_by_process.get)
+            if defect_by_process[worst_process] > critical_defects:
+                insights.append(f"🔍 {worst_process} process has highest defects ({defect_by_process[worst_process]:.1f}%)")
                 recommendations.append(f"Review and optimize {worst_process} procedures")
     
     if section == 'overview' or section == 'transportation':
-        delays = float((data['DeliveryDelayFlag'].sum() / len(data) * 100))
-        fuel_usage = float(data['FuelUsage_L_per_100km'].mean())
-        transit_spoilage = float(data['SpoilageInTransit_%'].mean())
-        distance = float(data['TransportDistance_km'].mean())
+        delays = m['delays']
+        fuel_usage = m['fuel']
+        transit_spoilage = m['transit_spoilage']
+        distance = m['distance']
         critical_delays = 15
         optimal_fuel = 25
         
@@ -937,10 +2111,10 @@ def generate_farm_insights(farm_name, data, section):
             recommendations.append("Evaluate distribution center locations")
     
     if section == 'overview' or section == 'retail':
-        waste = float(data['WastePercentage_%'].mean())
-        inventory = float(data['RetailInventory_units'].sum())
-        sales_velocity = float(data['SalesVelocity_units_per_day'].mean())
-        pricing_index = float(data['DynamicPricingIndex'].mean())
+        waste = m['waste']
+        inventory = m['total_inventory']
+        sales_velocity = m['sales_velocity']
+        pricing_index = m['pricing_index']
         critical_waste = 12
         
         # Waste management
@@ -955,7 +2129,7 @@ def generate_farm_insights(farm_name, data, section):
         
         # Inventory optimization
         if sales_velocity > 0:
-            days_of_inventory = inventory / (sales_velocity * len(data)) if len(data) > 0 else 0
+            days_of_inventory = inventory / (sales_velocity * cube['records']) if cube['records'] > 0 else 0
             if days_of_inventory > 30:
                 insights.append(f"📦 High inventory levels ({days_of_inventory:.0f} days) - risk of overstocking")
                 recommendations.append("Adjust procurement to match sales velocity")
@@ -973,9 +2147,9 @@ def generate_farm_insights(farm_name, data, section):
             insights.append(f"✅ Good pricing strategy (index: {pricing_index:.2f})")
     
     if section == 'overview' or section == 'consumption':
-        satisfaction = float(data['SatisfactionScore_0_10'].mean())
-        household_waste = float(data['HouseholdWaste_kg'].mean())
-        recipe_accuracy = float(data['RecipeRecommendationAccuracy_%'].mean())
+        satisfaction = m['satisfaction']
+        household_waste = m['household_waste']
+        recipe_accuracy = m['recipe_accuracy']
         
         # Customer satisfaction
         if satisfaction < 7:
@@ -1002,9 +2176,9 @@ def generate_farm_insights(farm_name, data, section):
             insights.append(f"✅ Good recipe accuracy ({recipe_accuracy:.1f}%)")
     
     if section == 'overview' or section == 'waste':
-        segregation = float(data['SegregationAccuracy_%'].mean())
-        upcycling = float(data['UpcyclingRate_%'].mean())
-        biogas = float(data['BiogasOutput_m3'].mean())
+        segregation = m['segregation']
+        upcycling = m['upcycling']
+        biogas = m['biogas']
         
         # Waste segregation
         if segregation < 85:
@@ -1039,7 +2213,7 @@ def generate_farm_insights(farm_name, data, section):
     if len(insights) < 5:
         # Add some general insights if we don't have enough
         if section == 'overview':
-            score = calculate_performance_score_from_data(data)
+            score = cube['score']
             if score > 75:
                 insights.append(f"🏆 Overall performance score: {score:.0f}/100 - excellent")
             elif score > 60:
@@ -1085,263 +2259,100 @@ def generate_farm_insights(farm_name, data, section):
     })
 
 @app.route('/details/all/<stage>')
+@http_cached()
 def view_comparison_details(stage):
     """View comparison details for all farms for a specific stage"""
-    all_farms = load_all_farms_data()
-    
-    stage_fields = {
-        'production': ['BatchID', 'CropType', 'FarmLocation', 'SoilMoisture_%', 'Temperature_C', 'Rainfall_mm', 'Fertilizer_kg_per_ha', 'Yield_tonnes_per_ha', 'PestRiskScore', 'HarvestRobotUptime_%'],
-        'storage': ['BatchID', 'CropType', 'GradingScore', 'StorageTemperature_C', 'Humidity_%', 'SpoilageRate_%', 'PredictedShelfLife_days', 'StorageDays'],
-        'processing': ['BatchID', 'ProcessType', 'PackagingType', 'PackagingSpeed_units_per_min', 'DefectRate_%', 'MachineryUptime_%'],
-        'transportation': ['BatchID', 'TransportMode', 'TransportDistance_km', 'FuelUsage_L_per_100km', 'DeliveryTime_hr', 'DeliveryDelayFlag', 'SpoilageInTransit_%'],
-        'retail': ['BatchID', 'CropType', 'RetailInventory_units', 'SalesVelocity_units_per_day', 'DynamicPricingIndex', 'WastePercentage_%'],
-        'consumption': ['BatchID', 'HouseholdWaste_kg', 'RecipeRecommendationAccuracy_%', 'SatisfactionScore_0_10'],
-        'waste': ['BatchID', 'WasteType', 'SegregationAccuracy_%', 'UpcyclingRate_%', 'BiogasOutput_m3'],
-        'overview': ['BatchID', 'CropType', 'Yield_tonnes_per_ha', 'SpoilageRate_%', 'DefectRate_%', 'WastePercentage_%']
-    }
-
-    fields = stage_fields.get(stage, [])
+    fields = STAGE_FIELDS.get(stage, [])
     if not fields:
         return "Stage not found", 404
 
-    # Aggregate data by farm and create a pivoted table with farms as columns
-    farm_stats = {}
-    for farm_name, data in all_farms.items():
-        farm_data = data[[f for f in fields if f in data.columns]].copy()
-        # Calculate mean for numeric columns, mode for categorical
-        stats = {}
-        for col in farm_data.columns:
-            if farm_data[col].dtype in ['int64', 'float64']:
-                stats[col] = farm_data[col].mean()
-            else:
-                # For categorical, get the most common value
-                stats[col] = farm_data[col].mode()[0] if len(farm_data[col].mode()) > 0 else farm_data[col].iloc[0]
-        farm_stats[farm_name] = stats
-    
-    # Create a DataFrame with metrics as rows and farms as columns
-    metrics_df = pd.DataFrame.from_dict(farm_stats, orient='index').T
-    # Transpose so farms are columns and metrics are rows
-    comparison_df = metrics_df.T
-    comparison_df.index.name = 'Metric'
-    comparison_df = comparison_df.reset_index()
-
-    stage_titles = {
-        'production': 'Production Stage',
-        'storage': 'Storage & Post-Harvest',
-        'processing': 'Processing & Packaging',
-        'transportation': 'Distribution & Transportation',
-        'retail': 'Retail Insights',
-        'consumption': 'Consumption & Household',
-        'waste': 'Waste Management',
-        'overview': 'Dashboard Overview'
-    }
+    def render():
+        # Mean for numeric columns, most common value for the others
+        farm_stats = {}
+        for farm_name, data in load_all_farms_data().items():
+            stats = {}
+            for col in [f for f in fields if f in data.columns]:
+                if pd.api.types.is_numeric_dtype(data[col].dtype):
+                    stats[col] = float(data[col].mean())
+                else:
+                    mode = data[col].mode()
+                    stats[col] = mode[0] if len(mode) > 0 else data[col].iloc[0]
+            farm_stats[farm_name] = stats
+        columns = [f for f in fields if any(f in stats for stats in farm_stats.values())]
+        return get_template_attribute('comparison_details.html', 'comparison_table')(columns, farm_stats)
 
-    stage_title = stage_titles.get(stage, stage.title())
-    
-    # Format numeric values
-    for col in comparison_df.columns:
-        if col != 'Metric':
-            comparison_df[col] = comparison_df[col].apply(lambda x: f"{x:.2f}" if isinstance(x, (int, float)) else str(x))
-    
-    table_html = comparison_df.to_html(classes='details-table', index=False, escape=False)
-    total_records = len(comparison_df)
-
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>All Farms - {stage_title} Comparison</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; padding: 20px; }}
-        .container {{ max-width: 1400px; margin: 0 auto; background: white; border-radius: 12px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); padding: 30px; }}
-        .header {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; border-bottom: 2px solid #1a5f7a; padding-bottom: 15px; }}
-        .header h1 {{ color: #1a5f7a; font-size: 28px; }}
-        .back-btn {{ background: #1a5f7a; color: white; padding: 10px 20px; border: none; border-radius: 12px; cursor: pointer; font-size: 14px; transition: background 0.3s; text-decoration: none; display: inline-block; }}
-        .back-btn:hover {{ background: #0f3a4f; }}
-        .record-info {{ background: #ecf0f1; padding: 15px; border-radius: 12px; margin-bottom: 20px; }}
-        .table-wrapper {{ overflow-x: auto; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        .details-table {{ width: 100%; border-collapse: collapse; font-size: 13px; }}
-        .details-table thead {{ background-color: #1a5f7a; color: white; }}
-        .details-table th {{ padding: 12px; text-align: left; font-weight: 600; position: sticky; top: 0; }}
-        .details-table td {{ padding: 10px 12px; border-bottom: 1px solid #ddd; text-align: left; }}
-        .details-table tbody tr:hover {{ background-color: #f5f5f5; }}
-        .details-table tbody tr:nth-child(even) {{ background-color: #f9f9f9; }}
-        .details-table td:first-child {{ font-weight: 600; color: #1a5f7a; background-color: #f0f8ff; }}
-        .details-table th:first-child {{ background-color: #0f3a4f; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div>
-                <h1>All Farms - {stage_title} Comparison</h1>
-            </div>
-            <a href="/" class="back-btn">← Back to Dashboard</a>
-        </div>
-
-        <div class="record-info">
-            <strong>Total Metrics:</strong> {total_records} | 
-            <strong>View:</strong> Farm Comparison (Farms as Columns)
-        </div>
-
-        <div class="table-wrapper">
-            {table_html}
-        </div>
-    </div>
-</body>
-</html>"""
-
-    return html_content
+    body = render_fragment(('comparison', stage, get_data_version()), render)
+    return render_template('comparison_details.html', stage=stage,
+                           stage_title=STAGE_TITLES.get(stage, stage.title()), body=body)
 
 @app.route('/details/<farm_name>/<stage>')
+@http_cached()
 def view_details(farm_name, stage):
     """View detailed records for each stage with pagination"""
     data = load_farm_data(farm_name)
     if data.empty:
         return f"Farm {farm_name} not found", 404
-    
-    stage_fields = {
-        'production': ['BatchID', 'CropType', 'FarmLocation', 'SoilMoisture_%', 'Temperature_C', 'Rainfall_mm', 'Fertilizer_kg_per_ha', 'Yield_tonnes_per_ha', 'PestRiskScore', 'HarvestRobotUptime_%'],
-        'storage': ['BatchID', 'CropType', 'GradingScore', 'StorageTemperature_C', 'Humidity_%', 'SpoilageRate_%', 'PredictedShelfLife_days', 'StorageDays'],
-        'processing': ['BatchID', 'ProcessType', 'PackagingType', 'PackagingSpeed_units_per_min', 'DefectRate_%', 'MachineryUptime_%'],
-        'transportation': ['BatchID', 'TransportMode', 'TransportDistance_km', 'FuelUsage_L_per_100km', 'DeliveryTime_hr', 'DeliveryDelayFlag', 'SpoilageInTransit_%'],
-        'retail': ['BatchID', 'CropType', 'RetailInventory_units', 'SalesVelocity_units_per_day', 'DynamicPricingIndex', 'WastePercentage_%'],
-        'consumption': ['BatchID', 'HouseholdWaste_kg', 'RecipeRecommendationAccuracy_%', 'SatisfactionScore_0_10'],
-        'waste': ['BatchID', 'WasteType', 'SegregationAccuracy_%', 'UpcyclingRate_%', 'BiogasOutput_m3'],
-        'overview': ['BatchID', 'CropType', 'Yield_tonnes_per_ha', 'SpoilageRate_%', 'DefectRate_%', 'WastePercentage_%']
-    }
 
-    fields = stage_fields.get(stage, [])
+    fields = STAGE_FIELDS.get(stage, [])
     if not fields:
         return "Stage not found", 404
 
-    stage_data = data[[f for f in fields if f in data.columns]].copy()
-
     page = request.args.get('page', 1, type=int)
     per_page = 50
-    total_records = len(stage_data)
-    total_pages = (total_records + per_page - 1) // per_page
-
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    paginated_data = stage_data.iloc[start_idx:end_idx]
-
-    stage_titles = {
-        'production': 'Production Stage',
-        'storage': 'Storage & Post-Harvest',
-        'processing': 'Processing & Packaging',
-        'transportation': 'Distribution & Transportation',
-        'retail': 'Retail Insights',
-        'consumption': 'Consumption & Household',
-        'waste': 'Waste Management',
-        'overview': 'Dashboard Overview'
-    }
 
-    stage_title = stage_titles.get(stage, stage.title())
-    table_html = paginated_data.to_html(classes='details-table', index=False)
+    def render():
+        columns = [f for f in fields if f in data.columns]
+        total_records = len(data)
+        total_pages = (total_records + per_page - 1) // per_page
+        start_idx = max(page - 1, 0) * per_page
+        rows = np.arange(start_idx, min(start_idx + per_page, total_records))
+        records_page = get_template_attribute('details.html', 'records_page')
+        return records_page(columns, _records_json(data, rows, columns), page, per_page, total_records, total_pages)
 
-    pagination_html = ''
-    if page > 1:
-        pagination_html += f'<a href="?page=1">« First</a> <a href="?page={page-1}">‹ Previous</a> '
-    for p in range(max(1, page-2), min(total_pages+1, page+3)):
-        if p == page:
-            pagination_html += f'<span class="current">{p}</span> '
+    body = render_fragment(('details', farm_name, stage, page, get_data_version()), render)
+    return render_template('details.html', farm_name=farm_name, stage=stage,
+                           stage_title=STAGE_TITLES.get(stage, stage.title()), body=body)
+
+_MARKDOWN_BOLD = re.compile(r'\*\*([^*]+)\*\*')
+_MARKDOWN_LIST_ITEM = re.compile(r'^\s*\*\s+(.+)$')
+
+def _markdown_line_to_html(line, in_list):
+    """Convert one line (bold already converted); returns (html_lines, in_list)"""
+    html_lines = []
+    line_stripped = line.strip()
+    
+    # Check if line starts with * (list item) - but not ** (bold)
+    list_match = _MARKDOWN_LIST_ITEM.match(line)
+    if list_match and not line_stripped.startswith('**'):
+        if not in_list:
+            html_lines.append('<ul>')
+            in_list = True
+        # Process the list item content (may contain <strong> tags)
+        item_content = list_match.group(1)
+        html_lines.append(f'<li>{item_content}</li>')
+    else:
+        if in_list:
+            html_lines.append('</ul>')
+            in_list = False
+        if line_stripped:
+            # Regular paragraph - may contain <strong> tags
+            html_lines.append(f'<p>{line}</p>')
         else:
-            pagination_html += f'<a href="?page={p}">{p}</a> '
-    if page < total_pages:
-        pagination_html += f'<a href="?page={page+1}">Next ›</a> <a href="?page={total_pages}">Last »</a>'
-
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{farm_name} - {stage_title}</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; padding: 20px; }}
-        .container {{ max-width: 1400px; margin: 0 auto; background: white; border-radius: 10px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); padding: 30px; }}
-        .header {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; border-bottom: 2px solid #1a5f7a; padding-bottom: 15px; }}
-        .header h1 {{ color: #1a5f7a; font-size: 28px; }}
-        .back-btn {{ background: #1a5f7a; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer; font-size: 14px; transition: background 0.3s; text-decoration: none; display: inline-block; }}
-        .back-btn:hover {{ background: #0f3a4f; }}
-        .record-info {{ background: #ecf0f1; padding: 15px; border-radius: 5px; margin-bottom: 20px; }}
-        .table-wrapper {{ overflow-x: auto; border-radius: 5px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        .details-table {{ width: 100%; border-collapse: collapse; font-size: 14px; }}
-        .details-table thead {{ background-color: #1a5f7a; color: white; }}
-        .details-table th {{ padding: 12px; text-align: left; font-weight: 600; }}
-        .details-table td {{ padding: 10px 12px; border-bottom: 1px solid #ddd; }}
-        .details-table tbody tr:hover {{ background-color: #f5f5f5; }}
-        .details-table tbody tr:nth-child(even) {{ background-color: #f9f9f9; }}
-        .pagination {{ display: flex; justify-content: center; gap: 10px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; }}
-        .pagination a, .pagination span {{ padding: 8px 12px; border: 1px solid #ddd; border-radius: 4px; text-decoration: none; color: #1a5f7a; transition: all 0.2s; }}
-        .pagination a:hover {{ background: #1a5f7a; color: white; }}
-        .pagination .current {{ background: #1a5f7a; color: white; border: 1px solid #1a5f7a; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div>
-                <h1>{farm_name} - {stage_title}</h1>
-            </div>
-            <a href="/" class="back-btn">← Back to Dashboard</a>
-        </div>
-
-        <div class="record-info">
-            <strong>Total Records:</strong> {total_records} | 
-            <strong>Showing:</strong> {start_idx + 1}-{min(end_idx, total_records)} | 
-            <strong>Page:</strong> {page} of {total_pages}
-        </div>
-
-        <div class="table-wrapper">
-            {table_html}
-        </div>
-
-        <div class="pagination">
-            {pagination_html}
-        </div>
-    </div>
-</body>
-</html>"""
-
-    return html_content
+            html_lines.append('<br>')
+    return html_lines, in_list
 
 def convert_markdown_to_html(text):
     """Convert markdown formatting to HTML for better display"""
-    import re
-    
     # First, convert **bold** to <strong>bold</strong> (handle nested cases)
-    text = re.sub(r'\*\*([^*]+)\*\*', r'<strong>\1</strong>', text)
+    text = _MARKDOWN_BOLD.sub(r'<strong>\1</strong>', text)
     
     # Convert * list items to <li> items
-    lines = text.split('\n')
     html_lines = []
     in_list = False
     
-    for line in lines:
-        line_stripped = line.strip()
-        
-        # Check if line starts with * (list item) - but not ** (bold)
-        list_match = re.match(r'^\s*\*\s+(.+)$', line)
-        if list_match and not line_stripped.startswith('**'):
-            if not in_list:
-                html_lines.append('<ul>')
-                in_list = True
-            # Process the list item content (may contain <strong> tags)
-            item_content = list_match.group(1)
-            html_lines.append(f'<li>{item_content}</li>')
-        else:
-            if in_list:
-                html_lines.append('</ul>')
-                in_list = False
-            if line_stripped:
-                # Regular paragraph - may contain <strong> tags
-                html_lines.append(f'<p>{line}</p>')
-            else:
-                html_lines.append('<br>')
+    for line in text.split('\n'):
+        line_html, in_list = _markdown_line_to_html(line, in_list)
+        html_lines.extend(line_html)
     
     if in_list:
         html_lines.append('</ul>')
@@ -1349,84 +2360,92 @@ def convert_markdown_to_html(text):
     result = '\n'.join(html_lines)
     return result
 
+class MarkdownStreamConverter:
+    """
+    Incremental convert_markdown_to_html for streamed text.
+    feed() returns (html, pending): HTML for lines completed so far (to append)
+    and a rendering of the unfinished last line (to show after it until replaced).
+    Bold spanning a line break is only resolved by the final full conversion.
+    """
+    
+    def __init__(self):
+        self.text = ''
+        self._buffer = ''
+        self._in_list = False
+        self._started = False
+    
+    def feed(self, chunk):
+        if not self._started:
+            chunk = chunk.lstrip()  # Match the .strip() of the non-streaming reply
+            if not chunk:
+                return '', ''
+            self._started = True
+        self.text += chunk
+        self._buffer += chunk
+        
+        *lines, self._buffer = self._buffer.split('\n')
+        html_lines = []
+        for line in lines:
+            line_html, self._in_list = _markdown_line_to_html(_MARKDOWN_BOLD.sub(r'<strong>\1</strong>', line), self._in_list)
+            html_lines.extend(line_html)
+        html = ''.join(f'{line}\n' for line in html_lines)
+        
+        pending = ''
+        if self._buffer.strip():
+            pending_html, pending_in_list = _markdown_line_to_html(_MARKDOWN_BOLD.sub(r'<strong>\1</strong>', self._buffer), self._in_list)
+            pending = '\n'.join(pending_html) + ('\n</ul>' if pending_in_list else '')
+        return html, pending
+
+# Farming and project-related keywords
+FARMING_KEYWORDS = [
+    'farm', 'crop', 'yield', 'harvest', 'soil', 'fertilizer', 'irrigation',
+    'livestock', 'cattle', 'chicken', 'pig', 'sheep', 'goat', 'dairy',
+    'spoilage', 'waste', 'storage', 'transport', 'delivery', 'processing',
+    'retail', 'consumption', 'satisfaction', 'defect', 'pest', 'machinery',
+    'uptime', 'delay', 'temperature', 'humidity', 'shelf', 'life',
+    'performance', 'score', 'metric', 'data', 'farma', 'farmb', 'farmc',
+    'farmd', 'tomato', 'potato', 'wheat', 'corn', 'rice', 'vegetable',
+    'fruit', 'grain', 'production', 'supply', 'chain', 'comparison',
+    'compare', 'best', 'worst', 'ranking', 'rank', 'top', 'bottom',
+    'biogas', 'upcycling', 'segregation', 'waste management', 'packaging'
+]
+
+# Off-topic keywords (common non-farming topics)
+OFF_TOPIC_KEYWORDS = [
+    'weather forecast', 'recipe', 'cooking', 'restaurant', 'movie',
+    'music', 'sports', 'politics', 'news', 'stock market', 'cryptocurrency',
+    'bitcoin', 'programming', 'code', 'python', 'javascript', 'html',
+    'css', 'website', 'app development', 'game', 'video game', 'tv show',
+    'celebrity', 'fashion', 'travel', 'vacation', 'hotel', 'flight',
+    'mathematics', 'physics', 'chemistry', 'biology', 'history', 'geography',
+    'philosophy', 'religion', 'medical', 'health advice', 'diagnosis',
+    'legal advice', 'lawyer', 'court', 'investment', 'trading', 'finance',
+    'shopping', 'product review', 'amazon', 'netflix', 'youtube'
+]
+
 def is_off_topic(question):
     """Detect if a question is off-topic (not related to farming or project data)"""
-    question_lower = question.lower().strip()
-    
-    # Farming and project-related keywords
-    farming_keywords = [
-        'farm', 'crop', 'yield', 'harvest', 'soil', 'fertilizer', 'irrigation',
-        'livestock', 'cattle', 'chicken', 'pig', 'sheep', 'goat', 'dairy',
-        'spoilage', 'waste', 'storage', 'transport', 'delivery', 'processing',
-        'retail', 'consumption', 'satisfaction', 'defect', 'pest', 'machinery',
-        'uptime', 'delay', 'temperature', 'humidity', 'shelf', 'life',
-        'performance', 'score', 'metric', 'data', 'farma', 'farmb', 'farmc',
-        'farmd', 'tomato', 'potato', 'wheat', 'corn', 'rice', 'vegetable',
-        'fruit', 'grain', 'production', 'supply', 'chain', 'comparison',
-        'compare', 'best', 'worst', 'ranking', 'rank', 'top', 'bottom',
-        'biogas', 'upcycling', 'segregation', 'waste management', 'packaging'
-    ]
-    
-    # Off-topic keywords (common non-farming topics)
-    off_topic_keywords = [
-        'weather forecast', 'recipe', 'cooking', 'restaurant', 'movie',
-        'music', 'sports', 'politics', 'news', 'stock market', 'cryptocurrency',
-        'bitcoin', 'programming', 'code', 'python', 'javascript', 'html',
-        'css', 'website', 'app development', 'game', 'video game', 'tv show',
-        'celebrity', 'fashion', 'travel', 'vacation', 'hotel', 'flight',
-        'mathematics', 'physics', 'chemistry', 'biology', 'history', 'geography',
-        'philosophy', 'religion', 'medical', 'health advice', 'diagnosis',
-        'legal advice', 'lawyer', 'court', 'investment', 'trading', 'finance',
-        'shopping', 'product review', 'amazon', 'netflix', 'youtube'
-    ]
-    
-    # Check if question contains farming keywords
-    has_farming_keyword = any(keyword in question_lower for keyword in farming_keywords)
-    
-    # Check if question is clearly off-topic
-    is_clearly_off_topic = any(keyword in question_lower for keyword in off_topic_keywords)
-    
-    # If it has farming keywords, it's on-topic
-    if has_farming_keyword:
-        return False
-    
-    # If it's clearly off-topic, refuse it
-    if is_clearly_off_topic:
-        return True
-    
-    # For ambiguous questions (greetings, general questions), allow them
-    # but they'll be handled by the prompt to redirect to farming topics
-    greeting_patterns = [
-        r'^(hi|hello|hey|greetings|howdy|good\s+(morning|afternoon|evening))[\s!?.,]*$',
-        r'^(what|who|where|when|why|how)\s+(are|is|can|do|does|will|would)',
-        r'^(tell\s+me|explain|describe|what\s+is|what\s+are)',
-    ]
-    
-    for pattern in greeting_patterns:
-        if re.match(pattern, question_lower):
-            return False  # Allow greetings and general questions
+    profile = classify_question(question)
     
-    # If question is very short and doesn't match anything, consider it potentially off-topic
-    if len(question.split()) < 3 and not has_farming_keyword:
-        return False  # Let the model handle it, but prompt will guide to farming topics
-    
-    # Default: if no farming keywords and not clearly off-topic, let the model decide
-    # but we'll add strict instructions in the prompt
-    return False
+    # Farming keywords make it on-topic; otherwise refuse only clearly off-topic
+    # questions. Greetings and general or ambiguous questions go through, and
+    # the prompt steers them back to farming.
+    return profile.off_topic and not profile.farming
 
-def create_farmer_prompt(context, question, language='en'):
-    """Create a prompt with expert farmer persona and strict farming-only restrictions"""
-    
-    # Language instructions
-    language_instructions = {
-        'en': 'Respond in English. Use natural, conversational English.',
-        'hi': 'Respond in Hindi (हिंदी). Use natural, conversational Hindi. Write all text in Devanagari script.',
-        'kn': 'Respond in Kannada (ಕನ್ನಡ). Use natural, conversational Kannada. Write all text in Kannada script.'
-    }
-    
-    lang_instruction = language_instructions.get(language, language_instructions['en'])
-    
-    prompt = f"""You are a friendly, experienced, and knowledgeable farmer with decades of hands-on experience in agriculture. You speak in a warm, conversational, and down-to-earth manner - like a neighbor who's always happy to share farming wisdom. You use casual language, occasional farming expressions, and you're genuinely passionate about agriculture.
+# Language instructions
+LANGUAGE_INSTRUCTIONS = {
+    'en': 'Respond in English. Use natural, conversational English.',
+    'hi': 'Respond in Hindi (हिंदी). Use natural, conversational Hindi. Write all text in Devanagari script.',
+    'kn': 'Respond in Kannada (ಕನ್ನಡ). Use natural, conversational Kannada. Write all text in Kannada script.'
+}
+
+# Chatbot prompt context: 'full' sends every farm metric, 'compact' trims the
+# context to LLM_CONTEXT_TOKEN_BUDGET tokens (see prepare_farm_context)
+LLM_CONTEXT_MODE = os.environ.get('LLM_CONTEXT_MODE', 'full').lower()
+LLM_CONTEXT_TOKEN_BUDGET = int(os.environ.get('LLM_CONTEXT_TOKEN_BUDGET', '800'))
+
+# Everything before and after the user's question in the farmer prompt
+FARMER_PROMPT_HEADER = """You are a friendly, experienced, and knowledgeable farmer with decades of hands-on experience in agriculture. You speak in a warm, conversational, and down-to-earth manner - like a neighbor who's always happy to share farming wisdom. You use casual language, occasional farming expressions, and you're genuinely passionate about agriculture.
 
 LANGUAGE INSTRUCTION - CRITICAL:
 {lang_instruction}
@@ -1458,275 +2477,1188 @@ CRITICAL RESTRICTIONS - YOU MUST FOLLOW THESE STRICTLY:
 FARM DATA FROM THIS PROJECT:
 {context}
 
-USER'S QUESTION: {question}
+USER'S QUESTION: """
+FARMER_PROMPT_FOOTER = """
 
 Remember: You are a farmer. You only talk about farming and this project's farm data. Be friendly, conversational, and helpful - but stay strictly within your farming expertise!"""
+
+# The farm context and the per-language prompt prefixes only change with the
+# data, so they are built once per data version and reused across requests
+_prompt_cache = {}  # key -> (data_version, text)
+_prompt_lock = threading.RLock()
+
+def _cached_prompt_text(key, build):
+    version = get_data_version()
+    cached = _prompt_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _prompt_lock:
+        cached = _prompt_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, build())
+            _prompt_cache[key] = cached
+        return cached[1]
+
+def get_llm_context(compact=None):
+    """Farm data context for the LLM (full, or compact within the token budget)"""
+    if compact is None:
+        compact = LLM_CONTEXT_MODE == 'compact'
+    max_tokens = LLM_CONTEXT_TOKEN_BUDGET if compact else None
+    return _cached_prompt_text(
+        ('context', compact),
+        lambda: prepare_farm_context(load_all_farm_cubes(), max_tokens=max_tokens)
+    )
+
+def get_prompt_prefix(language='en', compact=None):
+    """Persona, language instruction and farm context: the prompt up to the user's question"""
+    if language not in LANGUAGE_INSTRUCTIONS:
+        language = 'en'
+    if compact is None:
+        compact = LLM_CONTEXT_MODE == 'compact'
+    return _cached_prompt_text(
+        ('prefix', language, compact),
+        lambda: FARMER_PROMPT_HEADER.format(
+            lang_instruction=LANGUAGE_INSTRUCTIONS[language],
+            context=get_llm_context(compact)
+        )
+    )
+
+def create_farmer_prompt(question, language='en', compact=None):
+    """Create a prompt with expert farmer persona and strict farming-only restrictions"""
+    return "".join((get_prompt_prefix(language, compact), question, FARMER_PROMPT_FOOTER))
+
+# --- Chatbot Response Cache ---
+# Farmers ask the same questions over and over, so successful LLM answers are
+# cached on (normalized question, language, data version). Entries expire
+# after CHATBOT_CACHE_TTL seconds and the least recently used entry is evicted
+# beyond CHATBOT_CACHE_SIZE. With CHATBOT_CACHE_SIMILARITY > 0, a question whose
+# word set overlaps a cached one at least that much (Jaccard) is a near hit.
+CHATBOT_CACHE_SIZE = int(os.environ.get('CHATBOT_CACHE_SIZE', '512'))
+CHATBOT_CACHE_TTL = float(os.environ.get('CHATBOT_CACHE_TTL', '3600'))
+CHATBOT_CACHE_SIMILARITY = float(os.environ.get('CHATBOT_CACHE_SIMILARITY', '0'))
+
+# Rule-based fast path: questions whose intent scores at least this confidence
+# (see score_question_intent) skip the LLM; set above 1 to always use the LLM.
+# The rule-based answers are English-only, so other languages go to the LLM.
+CHATBOT_FAST_PATH_THRESHOLD = float(os.environ.get('CHATBOT_FAST_PATH_THRESHOLD', '0.8'))
+CHATBOT_FAST_PATH_LANGUAGES = ['en']
+
+# Which LLM answers chatbot questions: a name in LLM_BACKENDS ('gemini'), or
+# 'stub' for an offline stand-in that answers from the farm data without any
+# network access
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini').lower()
+
+_response_cache = OrderedDict()  # (question, language, version) -> {'response', 'tokens', 'stored_at'}
+_response_cache_lock = threading.Lock()
+_response_cache_stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0}
+
+def normalize_question(question):
+    """Lowercase, drop punctuation (including । and other Indic marks) and collapse whitespace"""
+    text = ''.join(
+        ' ' if unicodedata.category(ch)[0] in ('P', 'S') else ch
+        for ch in question.lower()
+    )
+    return ' '.join(text.split())
+
+def _token_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def get_cached_response(question, language, version):
+    """Cached chatbot response for a question, or None (updates hit/miss counters)"""
+    normalized = normalize_question(question)
+    key = (normalized, language, version)
+    now = time.time()
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is not None and now - entry['stored_at'] > CHATBOT_CACHE_TTL:
+            del _response_cache[key]
+            _response_cache_stats['expired'] += 1
+            entry = None
+        if entry is not None:
+            _response_cache.move_to_end(key)
+            _response_cache_stats['hits'] += 1
+            return entry['response']
+        
+        if CHATBOT_CACHE_SIMILARITY > 0:
+            tokens = frozenset(normalized.split())
+            best_key, best_score = None, CHATBOT_CACHE_SIMILARITY
+            for other_key, other in _response_cache.items():
+                if other_key[1:] != (language, version) or now - other['stored_at'] > CHATBOT_CACHE_TTL:
+                    continue
+                score = _token_similarity(tokens, other['tokens'])
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is not None:
+                _response_cache.move_to_end(best_key)
+                _response_cache_stats['near_hits'] += 1
+                return _response_cache[best_key]['response']
+        
+        _response_cache_stats['misses'] += 1
+        return None
+
+def store_cached_response(question, language, version, response):
+    normalized = normalize_question(question)
+    key = (normalized, language, version)
+    with _response_cache_lock:
+        _response_cache[key] = {
+            'response': response,
+            'tokens': frozenset(normalized.split()),
+            'stored_at': time.time()
+        }
+        _response_cache.move_to_end(key)
+        _response_cache_stats['stores'] += 1
+        while len(_response_cache) > CHATBOT_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+            _response_cache_stats['evictions'] += 1
+
+def clear_response_cache():
+    with _response_cache_lock:
+        _response_cache.clear()
+
+def response_cache_stats():
+    with _response_cache_lock:
+        stats = dict(_response_cache_stats)
+        stats['size'] = len(_response_cache)
+    lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['hits'] + stats['near_hits']) / lookups, 3) if lookups else 0.0
+    return stats
+
+def _stub_llm_response(question, language):
+    """Offline LLM stand-in: answers from the farm data via the rule-based responder"""
+    return answer_question(question, load_all_farm_cubes())
+
+@app.route('/api/chatbot/cache', methods=['GET'])
+def chatbot_cache_stats():
+    """Hit/miss metrics for the chatbot response cache, plus LLM client call counters"""
+    stats = response_cache_stats()
+    if _llm_client is not None:
+        stats['llm'] = _llm_client.stats()
+    return jsonify(stats)
+
+# Language-specific canned replies
+CHATBOT_GREETINGS = {
+    'en': 'Howdy! I\'m here to help you with questions about farming and our farm data. What would you like to know?',
+    'hi': 'नमस्ते! मैं खेती और हमारे फार्म डेटा के बारे में प्रश्नों में आपकी मदद करने के लिए यहाँ हूँ। आप क्या जानना चाहेंगे?',
+    'kn': 'ನಮಸ್ಕಾರ! ನಾನು ಕೃಷಿ ಮತ್ತು ನಮ್ಮ ಫಾರ್ಮ್ ಡೇಟಾದ ಬಗ್ಗೆ ಪ್ರಶ್ನೆಗಳಿಗೆ ಸಹಾಯ ಮಾಡಲು ಇಲ್ಲಿದ್ದೇನೆ. ನೀವು ಏನು ತಿಳಿಯಲು ಬಯಸುತ್ತೀರಿ?'
+}
+
+CHATBOT_REFUSALS = {
+    'en': 'Well, I appreciate your question, but I\'m a farmer through and through - I only talk about farming, crops, livestock, and the data from our farms here. I\'d be happy to help you with anything related to our food supply chain, yields, spoilage, waste management, or farm performance though!',
+    'hi': 'अच्छा, मैं आपके प्रश्न की सराहना करता हूँ, लेकिन मैं पूरी तरह से एक किसान हूँ - मैं केवल खेती, फसलों, पशुधन, और हमारे फार्मों के डेटा के बारे में बात करता हूँ। हालाँकि, मैं हमारे खाद्य आपूर्ति श्रृंखला, उपज, खराबी, अपशिष्ट प्रबंधन, या फार्म प्रदर्शन से संबंधित किसी भी चीज़ में आपकी मदद करने में खुशी होगी!',
+    'kn': 'ಸರಿ, ನಾನು ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಮೆಚ್ಚುತ್ತೇನೆ, ಆದರೆ ನಾನು ಸಂಪೂರ್ಣವಾಗಿ ರೈತನಾಗಿದ್ದೇನೆ - ನಾನು ಕೇವಲ ಕೃಷಿ, ಬೆಳೆಗಳು, ಪಶುಸಂಪತ್ತು ಮತ್ತು ನಮ್ಮ ಫಾರ್ಮ್ಗಳ ಡೇಟಾದ ಬಗ್ಗೆ ಮಾತನಾಡುತ್ತೇನೆ. ಆದಾಗ್ಯೂ, ನಮ್ಮ ಆಹಾರ ಸರಬರಾಜು ಸರಪಳಿ, ಇಳುವರಿ, ಕೆಡುವಿಕೆ, ತ್ಯಾಜ್ಯ ನಿರ್ವಹಣೆ, ಅಥವಾ ಫಾರ್ಮ್ ಕಾರ್ಯಕ್ಷಮತೆಗೆ ಸಂಬಂಧಿಸಿದ ಯಾವುದೇ ವಿಷಯದಲ್ಲಿ ನಿಮಗೆ ಸಹಾಯ ಮಾಡಲು ನನಗೆ ಸಂತೋಷವಾಗುತ್ತದೆ!'
+}
+
+CHATBOT_KEY_MISSING = {
+        'en': 'I\'m sorry, but the Gemini API key isn\'t configured. Please set the GEMINI_API_KEY environment variable.',
+        'hi': 'मुझे खेद है, लेकिन Gemini API कुंजी कॉन्फ़िगर नहीं की गई है। कृपया GEMINI_API_KEY environment variable सेट करें।',
+        'kn': 'ಕ್ಷಮಿಸಿ, ಆದರೆ Gemini API ಕೀ ಕಾನ್ಫಿಗರ್ ಮಾಡಲಾಗಿಲ್ಲ. ದಯವಿಟ್ಟು GEMINI_API_KEY environment variable ಅನ್ನು ಹೊಂದಿಸಿ.'
+    }
+
+def _read_chatbot_request(data=None):
+    """(question, language) from a chatbot POST body (the current Flask request's by default)"""
+    if data is None:
+        data = request.json
+    question = data.get('message', '').strip()
+    language = data.get('language', 'en').lower()  # Default to English
+    
+    # Validate language
+    valid_languages = ['en', 'hi', 'kn']
+    if language not in valid_languages:
+        language = 'en'
+    return question, language
+
+def _chatbot_local_response(question, language, data_version):
+    """
+    Reply that doesn't need Gemini (greeting, refusal, rule-based answer, cached
+    answer, offline stub, missing API key), or None if the question goes to Gemini.
+    """
+    if not question:
+        return CHATBOT_GREETINGS.get(language, CHATBOT_GREETINGS['en'])
+    
+    # Check if question is off-topic
+    if is_off_topic(question):
+        return CHATBOT_REFUSALS.get(language, CHATBOT_REFUSALS['en'])
+    
+    # Pure data-lookup questions are answered locally from the aggregate cube
+    if language in CHATBOT_FAST_PATH_LANGUAGES and score_question_intent(question) >= CHATBOT_FAST_PATH_THRESHOLD:
+        return convert_markdown_to_html(answer_question(question, load_all_farm_cubes()))
+    
+    # Serve repeated questions from the response cache
+    cached_response = get_cached_response(question, language, data_version)
+    if cached_response is not None:
+        return cached_response
+    
+    if LLM_BACKEND == 'stub':
+        response_text = convert_markdown_to_html(_stub_llm_response(question, language))
+        store_cached_response(question, language, data_version, response_text)
+        return response_text
+    
+    if not os.environ.get('GEMINI_API_KEY'):
+        return CHATBOT_KEY_MISSING.get(language, CHATBOT_KEY_MISSING['en'])
+    return None
+
+# ---------------------------------------------------------------------------
+# LLM client
+#
+# One process-wide client talks to the Gemini REST API over a pooled
+# requests.Session. Every call has a deadline (LLM_TIMEOUT seconds, covering
+# retries), at most LLM_MAX_CONCURRENCY calls are in flight at once (callers
+# wait up to LLM_QUEUE_TIMEOUT seconds for a slot, then get LLMBusyError), and
+# connection errors, timeouts, 429s and 5xx responses are retried with full
+# jitter. GEMINI_API_BASE points the client at another server (e.g. a local
+# fake speaking the same REST protocol), and LLM_BACKENDS maps LLM_BACKEND
+# names to backend classes.
+# ---------------------------------------------------------------------------
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta').rstrip('/')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '30'))
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', '5'))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '4'))
+LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '5'))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', '0.5'))
+
+LLM_GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'maxOutputTokens': 1000,  # Increased for more detailed responses
+}
+
+# Upstream statuses worth another attempt
+LLM_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """An LLM call failed; `retryable` marks transient failures"""
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+class LLMBusyError(LLMError):
+    """No concurrency slot freed up within LLM_QUEUE_TIMEOUT"""
+
+class LLMTimeoutError(LLMError):
+    """The call's deadline passed"""
+
+class GeminiBackend:
+    """Gemini generateContent / streamGenerateContent over a pooled HTTP session"""
+    
+    def __init__(self, api_base=None, model=None, pool_size=None):
+        self.api_base = (api_base or GEMINI_API_BASE).rstrip('/')
+        self.model = model or GEMINI_MODEL
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or LLM_MAX_CONCURRENCY,
+            max_retries=0  # Retries are handled by LLMClient, within the deadline
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def _post(self, method, prompt, timeout, **kwargs):
+        url = f"{self.api_base}/models/{self.model}:{method}"
+        body = {
+            'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+            'generationConfig': LLM_GENERATION_CONFIG
+        }
+        headers = {'x-goog-api-key': os.environ.get('GEMINI_API_KEY', '')}
+        try:
+            response = self.session.post(
+                url, json=body, headers=headers,
+                timeout=(min(LLM_CONNECT_TIMEOUT, timeout), timeout), **kwargs
+            )
+        except requests.Timeout as e:
+            raise LLMTimeoutError(f'Gemini did not respond in time ({e})', retryable=True) from e
+        except requests.ConnectionError as e:
+            raise LLMError(f'Could not reach Gemini ({e})', retryable=True) from e
+        if response.status_code != 200:
+            try:
+                message = response.json()['error']['message']
+            except Exception:
+                message = response.text[:200]
+            response.close()
+            raise LLMError(
+                f'Gemini returned HTTP {response.status_code}: {message}',
+                retryable=response.status_code in LLM_RETRY_STATUSES
+            )
+        return response
+    
+    @staticmethod
+    def _candidate_text(payload):
+        """Text of the first candidate (empty when it was blocked or has no parts)"""
+        candidates = payload.get('candidates') or []
+        if not candidates:
+            return ''
+        parts = (candidates[0].get('content') or {}).get('parts') or []
+        return ''.join(part.get('text', '') for part in parts)
+    
+    def generate(self, prompt, timeout):
+        response = self._post('generateContent', prompt, timeout)
+        return self._candidate_text(response.json())
+    
+    def stream(self, prompt, timeout):
+        """Yield text chunks; `timeout` bounds the connect and each read"""
+        response = self._post('streamGenerateContent', prompt, timeout, params={'alt': 'sse'}, stream=True)
+        try:
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                text = self._candidate_text(json.loads(line[5:]))
+                if text:
+                    yield text
+        except requests.Timeout as e:
+            raise LLMTimeoutError(f'Gemini stalled mid-response ({e})') from e
+        except requests.ConnectionError as e:
+            raise LLMError(f'Lost the connection to Gemini ({e})') from e
+        finally:
+            response.close()
+
+LLM_BACKENDS = {
+    'gemini': GeminiBackend,
+}
+
+class LLMClient:
+    """
+    Deadlines, bounded concurrency and retries around an LLM backend.
+    A backend provides generate(prompt, timeout) -> str and
+    stream(prompt, timeout) -> iterator of str.
+    """
     
-    return prompt
+    def __init__(self, backend, max_concurrency=None, queue_timeout=None, timeout=None,
+                 max_retries=None, retry_base_delay=None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+        self.queue_timeout = LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.timeout = timeout or LLM_TIMEOUT
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base_delay = LLM_RETRY_BASE_DELAY if retry_base_delay is None else retry_base_delay
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'in_flight': 0, 'retries': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+    
+    def _count(self, name, delta=1):
+        with self._stats_lock:
+            self._stats[name] += delta
+    
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['max_concurrency'] = self.max_concurrency
+        return stats
+    
+    def _acquire(self, deadline):
+        wait = min(self.queue_timeout, max(deadline - time.monotonic(), 0))
+        if not self._slots.acquire(timeout=wait):
+            self._count('rejected')
+            raise LLMBusyError('Too many chatbot requests in flight', retryable=True)
+        self._count('calls')
+        self._count('in_flight')
+    
+    def _release(self):
+        self._count('in_flight', -1)
+        self._slots.release()
+    
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count('timeouts')
+            raise LLMTimeoutError(f'No reply from the LLM within {self.timeout:.0f}s')
+        return remaining
+    
+    def _backoff(self, attempt, deadline, error):
+        """Sleep before the next attempt, or re-raise if out of attempts or time"""
+        delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)  # Full jitter
+        if not error.retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            if isinstance(error, LLMTimeoutError):
+                self._count('timeouts')
+            else:
+                self._count('errors')
+            raise error
+        self._count('retries')
+        time.sleep(delay)
+    
+    def generate(self, prompt, timeout=None):
+        """Full reply text for a prompt"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._acquire(deadline)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return self.backend.generate(prompt, self._remaining(deadline))
+                except LLMError as e:
+                    self._backoff(attempt, deadline, e)
+                    attempt += 1
+        finally:
+            self._release()
+    
+    def stream(self, prompt, timeout=None):
+        """
+        Yield reply text chunks. Failures before the first chunk are retried;
+        once text has been yielded the stream can't be replayed, so errors
+        propagate. The concurrency slot is held until the generator finishes
+        or is closed.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._acquire(deadline)
+        try:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    for text in self.backend.stream(prompt, self._remaining(deadline)):
+                        started = True
+                        yield text
+                        self._remaining(deadline)
+                    return
+                except LLMError as e:
+                    if started:
+                        self._count('errors')
+                        raise
+                    self._backoff(attempt, deadline, e)
+                    attempt += 1
+        finally:
+            self._release()
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client():
+    """Process-wide LLM client for LLM_BACKEND, created on first use"""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                backend_class = LLM_BACKENDS.get(LLM_BACKEND)
+                if backend_class is None:
+                    raise LLMError(f"Unknown LLM_BACKEND '{LLM_BACKEND}' (expected one of: {', '.join(sorted(LLM_BACKENDS))})")
+                _llm_client = LLMClient(backend_class())
+    return _llm_client
+
+def set_llm_client(client):
+    """Replace the process-wide LLM client (e.g. with one around a fake backend); returns the old one"""
+    global _llm_client
+    with _llm_client_lock:
+        previous, _llm_client = _llm_client, client
+    return previous
+
+# Reply when Gemini comes back empty
+CHATBOT_EMPTY_RESPONSE = 'Hmm, I didn\'t get a proper response. Could you try rephrasing your question about the farms?'
+
+def _finish_chatbot_response(question, language, data_version, response_text):
+    """HTML reply for the LLM's markdown text, cached for next time (or the empty-reply message)"""
+    response_text = response_text.strip()
+    if not response_text:
+        return CHATBOT_EMPTY_RESPONSE
+    # Convert markdown formatting to HTML
+    response_html = convert_markdown_to_html(response_text)
+    store_cached_response(question, language, data_version, response_html)
+    return response_html
+
+def _chatbot_error_message(error):
+    if isinstance(error, LLMBusyError):
+        return 'Whew, lots of folks are asking me things right now. Give me a moment and ask again!'
+    if isinstance(error, LLMTimeoutError):
+        return 'Sorry, that took me too long to think through. Could you try asking again?'
+    error_msg = str(error)
+    if 'API_KEY' in error_msg or 'api key' in error_msg.lower():
+        return 'There\'s an issue with the API key. Please check your GEMINI_API_KEY environment variable.'
+    return f'Sorry, I ran into a technical issue: {error_msg}. Could you try asking again?'
 
 @app.route('/api/chatbot', methods=['POST'])
 def chatbot():
     """AI Chatbot endpoint that answers questions about farms and metrics using Gemini API"""
     try:
-        data = request.json
-        question = data.get('message', '').strip()
-        language = data.get('language', 'en').lower()  # Default to English
-        
-        # Validate language
-        valid_languages = ['en', 'hi', 'kn']
-        if language not in valid_languages:
-            language = 'en'
-        
-        # Get language-specific greetings
-        greetings = {
-            'en': 'Howdy! I\'m here to help you with questions about farming and our farm data. What would you like to know?',
-            'hi': 'नमस्ते! मैं खेती और हमारे फार्म डेटा के बारे में प्रश्नों में आपकी मदद करने के लिए यहाँ हूँ। आप क्या जानना चाहेंगे?',
-            'kn': 'ನಮಸ್ಕಾರ! ನಾನು ಕೃಷಿ ಮತ್ತು ನಮ್ಮ ಫಾರ್ಮ್ ಡೇಟಾದ ಬಗ್ಗೆ ಪ್ರಶ್ನೆಗಳಿಗೆ ಸಹಾಯ ಮಾಡಲು ಇಲ್ಲಿದ್ದೇನೆ. ನೀವು ಏನು ತಿಳಿಯಲು ಬಯಸುತ್ತೀರಿ?'
-        }
-        
-        refusal_messages = {
-            'en': 'Well, I appreciate your question, but I\'m a farmer through and through - I only talk about farming, crops, livestock, and the data from our farms here. I\'d be happy to help you with anything related to our food supply chain, yields, spoilage, waste management, or farm performance though!',
-            'hi': 'अच्छा, मैं आपके प्रश्न की सराहना करता हूँ, लेकिन मैं पूरी तरह से एक किसान हूँ - मैं केवल खेती, फसलों, पशुधन, और हमारे फार्मों के डेटा के बारे में बात करता हूँ। हालाँकि, मैं हमारे खाद्य आपूर्ति श्रृंखला, उपज, खराबी, अपशिष्ट प्रबंधन, या फार्म प्रदर्शन से संबंधित किसी भी चीज़ में आपकी मदद करने में खुशी होगी!',
-            'kn': 'ಸರಿ, ನಾನು ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಮೆಚ್ಚುತ್ತೇನೆ, ಆದರೆ ನಾನು ಸಂಪೂರ್ಣವಾಗಿ ರೈತನಾಗಿದ್ದೇನೆ - ನಾನು ಕೇವಲ ಕೃಷಿ, ಬೆಳೆಗಳು, ಪಶುಸಂಪತ್ತು ಮತ್ತು ನಮ್ಮ ಫಾರ್ಮ್ಗಳ ಡೇಟಾದ ಬಗ್ಗೆ ಮಾತನಾಡುತ್ತೇನೆ. ಆದಾಗ್ಯೂ, ನಮ್ಮ ಆಹಾರ ಸರಬರಾಜು ಸರಪಳಿ, ಇಳುವರಿ, ಕೆಡುವಿಕೆ, ತ್ಯಾಜ್ಯ ನಿರ್ವಹಣೆ, ಅಥವಾ ಫಾರ್ಮ್ ಕಾರ್ಯಕ್ಷಮತೆಗೆ ಸಂಬಂಧಿಸಿದ ಯಾವುದೇ ವಿಷಯದಲ್ಲಿ ನಿಮಗೆ ಸಹಾಯ ಮಾಡಲು ನನಗೆ ಸಂತೋಷವಾಗುತ್ತದೆ!'
-        }
-        
-        if not question:
-            return jsonify({'response': greetings.get(language, greetings['en'])})
-        
-        # Check if question is off-topic
-        if is_off_topic(question):
-            return jsonify({
-                'response': refusal_messages.get(language, refusal_messages['en'])
-            })
+        question, language = _read_chatbot_request()
+        data_version = get_data_version()
         
-        # Load all farm data for context
-        all_farms = load_all_farms_data()
-        
-        # Prepare context with farm data
-        context = prepare_farm_context(all_farms)
-        
-        # Initialize Gemini API
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if not api_key:
-            error_messages = {
-                'en': 'I\'m sorry, but the Gemini API key isn\'t configured. Please set the GEMINI_API_KEY environment variable.',
-                'hi': 'मुझे खेद है, लेकिन Gemini API कुंजी कॉन्फ़िगर नहीं की गई है। कृपया GEMINI_API_KEY environment variable सेट करें।',
-                'kn': 'ಕ್ಷಮಿಸಿ, ಆದರೆ Gemini API ಕೀ ಕಾನ್ಫಿಗರ್ ಮಾಡಲಾಗಿಲ್ಲ. ದಯವಿಟ್ಟು GEMINI_API_KEY environment variable ಅನ್ನು ಹೊಂದಿಸಿ.'
-            }
-            return jsonify({
-                'response': error_messages.get(language, error_messages['en'])
-            })
+        local_response = _chatbot_local_response(question, language, data_version)
+        if local_response is not None:
+            return jsonify({'response': local_response})
         
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
-            # Create system prompt with farmer persona and language
-            system_prompt = create_farmer_prompt(context, question, language)
+            # Create system prompt with farmer persona and language (farm context is cached per data version)
+            system_prompt = create_farmer_prompt(question, language)
             
             # Generate response
-            response = model.generate_content(
-                system_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=1000,  # Increased for more detailed responses
-                )
-            )
-            
-            response_text = response.text.strip() if response.text else ''
-            
-            if response_text:
-                # Convert markdown formatting to HTML
-                response_text = convert_markdown_to_html(response_text)
-                return jsonify({'response': response_text})
-            else:
-                return jsonify({
-                    'response': 'Hmm, I didn\'t get a proper response. Could you try rephrasing your question about the farms?'
-                })
+            response_text = get_llm_client().generate(system_prompt)
+            return jsonify({'response': _finish_chatbot_response(question, language, data_version, response_text)})
                 
         except Exception as e:
-            error_msg = str(e)
-            if 'API_KEY' in error_msg or 'api key' in error_msg.lower():
-                return jsonify({
-                    'response': 'There\'s an issue with the API key. Please check your GEMINI_API_KEY environment variable.'
-                })
-            return jsonify({
-                'response': f'Sorry, I ran into a technical issue: {error_msg}. Could you try asking again?'
-            })
+            return jsonify({'response': _chatbot_error_message(e)})
             
     except Exception as e:
         return jsonify({'response': f'Well, I hit a snag there: {str(e)}. Mind trying again?'})
 
-# COMMENTED OUT: AI4Bharat Indic-TTS models for Kannada (requires TTS library installation)
-# Will use gTTS for Kannada instead until TTS library is properly set up
-# 
-# Initialize AI4Bharat Indic-TTS models for Kannada only
-# _tts_model = None
-# _tts_lock = threading.Lock()
-# 
-# def get_ai4bharat_tts():
-#     """Get or create AI4Bharat Indic-TTS model for Kannada (thread-safe)"""
-#     global _tts_model
-#     
-#     if _tts_model is None:
-#         with _tts_lock:
-#             if _tts_model is None:
-#                 try:
-#                     print("Loading AI4Bharat Indic-TTS for Kannada...")
-#                     
-#                     # Check if Indic-TTS is set up
-#                     try:
-#                         # Try to import and use AI4Bharat Indic-TTS
-#                         import sys
-#                         import os
-#                         
-#                         # Check if Indic-TTS directory exists
-#                         indic_tts_path = os.path.join(os.getcwd(), 'Indic-TTS')
-#                         if not os.path.exists(indic_tts_path):
-#                             print("Indic-TTS not found. Please clone: git clone https://github.com/AI4Bharat/Indic-TTS.git")
-#                             print("Then follow setup instructions in the repo.")
-#                             return None
-#                         
-#                         # Add Indic-TTS to path
-#                         if indic_tts_path not in sys.path:
-#                             sys.path.insert(0, indic_tts_path)
-#                         
-#                         # Import TTS module from Indic-TTS
-#                         from TTS.bin.synthesize import Synthesizer
-#                         from TTS.utils.io import load_checkpoint
-#                         from TTS.utils.audio import AudioProcessor
-#                         import json
-#                         
-#                         # Load Kannada model (assuming models are in Indic-TTS directory)
-#                         # Note: The folder is "fastptich" (typo in Indic-TTS repo), not "fastpitch"
-#                         kannada_model_path = os.path.join(indic_tts_path, 'Kannada', 'fastptich', 'best_model.pth')
-#                         kannada_config_path = os.path.join(indic_tts_path, 'Kannada', 'config.json')
-#                         kannada_vocoder_path = os.path.join(indic_tts_path, 'Kannada', 'hifigan', 'best_model.pth')
-#                         kannada_vocoder_config_path = os.path.join(indic_tts_path, 'Kannada', 'hifigan', 'config.json')
-#                         
-#                         if not os.path.exists(kannada_model_path):
-#                             print(f"Kannada model not found at {kannada_model_path}")
-#                             print("Please download Kannada models from AI4Bharat Indic-TTS repository")
-#                             return None
-#                         
-#                         # Load synthesizer
-#                         _tts_model = Synthesizer(
-#                             model_path=kannada_model_path,
-#                             config_path=kannada_config_path,
-#                             vocoder_path=kannada_vocoder_path,
-#                             vocoder_config_path=kannada_vocoder_config_path
-#                         )
-#                         
-#                         print("AI4Bharat Indic-TTS for Kannada loaded successfully!")
-#                         
-#                     except ImportError as e:
-#                         print(f"Failed to import Indic-TTS: {e}")
-#                         print("Please ensure Indic-TTS is set up correctly.")
-#                         print("Clone: git clone https://github.com/AI4Bharat/Indic-TTS.git")
-#                         return None
-#                     except Exception as e:
-#                         print(f"Failed to load AI4Bharat Indic-TTS: {e}")
-#                         import traceback
-#                         traceback.print_exc()
-#                         return None
-#                         
-#                 except Exception as e:
-#                     print(f"Error initializing AI4Bharat Indic-TTS: {e}")
-#                     return None
-#     return _tts_model
+# Keep proxies (nginx) from buffering or caching the event stream
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
 
-@app.route('/api/tts', methods=['POST'])
-def text_to_speech():
-    """Generate audio from text using gTTS for Kannada (AI4Bharat Indic-TTS commented out)"""
+def _sse_event(event, payload):
+    """One Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """
+    Streaming variant of /api/chatbot (Server-Sent Events).
+    'delta' events carry {'html': newly completed HTML, 'pending': HTML for the
+    line still being written}; the final 'done' event carries the complete HTML,
+    identical to what /api/chatbot would return.
+    """
     try:
+        question, language = _read_chatbot_request()
+    except Exception as e:
+        return jsonify({'response': f'Well, I hit a snag there: {str(e)}. Mind trying again?'})
+    data_version = get_data_version()
+    
+    def generate():
+        # Send a first frame right away so the client sees the response start
+        yield ": stream open\n\n"
+        try:
+            local_response = _chatbot_local_response(question, language, data_version)
+            if local_response is not None:
+                yield _sse_event('done', {'html': local_response})
+                return
+            
+            converter = MarkdownStreamConverter()
+            for text in get_llm_client().stream(create_farmer_prompt(question, language)):
+                html, pending = converter.feed(text)
+                yield _sse_event('delta', {'html': html, 'pending': pending})
+            
+            yield _sse_event('done', {'html': _finish_chatbot_response(question, language, data_version, converter.text)})
+        except Exception as e:
+            yield _sse_event('done', {'html': _chatbot_error_message(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+# gTTS rejects longer input
+TTS_MAX_CHARS = 5000
+
+# Language code mapping
+TTS_LANGUAGES = {
+    'en': 'en',
+    'hi': 'hi',
+    'kn': 'kn'
+}
+
+# Synthesized audio is cached by content: the key is a hash of the backend,
+# language and cleaned text, so a given key always names the same MP3 and
+# browsers may keep it forever. Recently used clips stay in memory (up to
+# TTS_CACHE_MEMORY_MB); every clip is also written to TTS_CACHE_DIR (up to
+# TTS_CACHE_DISK_MB, least recently used removed first; '' disables the disk tier).
+TTS_CACHE_MEMORY_MB = float(os.environ.get('TTS_CACHE_MEMORY_MB', '32'))
+TTS_CACHE_DISK_MB = float(os.environ.get('TTS_CACHE_DISK_MB', '256'))
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', 'tts_cache')
+TTS_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Long text is split at sentence boundaries and the pieces are synthesized in
+# parallel (at most TTS_PARALLEL_CHUNKS gTTS calls at once, process-wide), then
+# streamed in order. The first chunk is kept to one gTTS request (gTTS sends
+# text in pieces of at most 100 characters) so it is ready quickly.
+TTS_PARALLEL_CHUNKS = int(os.environ.get('TTS_PARALLEL_CHUNKS', '4'))
+TTS_FIRST_CHUNK_CHARS = 100
+TTS_CHUNK_CHARS = 300
+
+# Sentence ends: Latin punctuation plus the danda (।) and double danda (॥)
+# used in Hindi and Kannada text
+_TTS_SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+')
+
+class TTSRequestError(ValueError):
+    """The TTS request has nothing to speak (answered with HTTP 400)"""
+
+def _read_tts_request(data=None):
+    """(clean_text, language) from a TTS POST body (the current Flask request's by default)"""
+    if data is None:
         data = request.json
-        text = data.get('text', '').strip()
-        language = data.get('language', 'en').lower()
-        
-        # COMMENTED OUT: AI4Bharat Indic-TTS for Kannada
-        # Only handle Kannada via API - English and Hindi use browser TTS
-        # if language != 'kn':
-        #     return jsonify({'error': 'This endpoint is only for Kannada. Use browser TTS for English and Hindi.'}), 400
+    text = data.get('text', '').strip()
+    language = data.get('language', 'en').lower()
+    
+    # COMMENTED OUT: AI4Bharat Indic-TTS for Kannada
+    # Only handle Kannada via API - English and Hindi use browser TTS
+    # if language != 'kn':
+    #     return jsonify({'error': 'This endpoint is only for Kannada. Use browser TTS for English and Hindi.'}), 400
+    
+    # Any language in TTS_LANGUAGES can use this endpoint (others are spoken as English)
+    if not text:
+        raise TTSRequestError('No text provided')
+    
+    clean_text = clean_tts_text(text)
+    if not clean_text:
+        raise TTSRequestError('No text content after cleaning')
+    return clean_text, language
+
+def clean_tts_text(text):
+    """Text as it is spoken (and cached): HTML tags removed, whitespace collapsed, length capped"""
+    # Remove HTML tags for clean speech
+    clean_text = re.sub(r'<[^>]*>', ' ', text)
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    
+    # Limit text length for faster processing
+    if len(clean_text) > TTS_MAX_CHARS:
+        clean_text = clean_text[:TTS_MAX_CHARS] + "..."
+    return clean_text
+
+def _split_long_text(text, limit):
+    """Break text longer than `limit` at a comma, else a space, else mid-word"""
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind(',', 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(' ', 0, limit)
+        if cut <= 0:
+            cut = limit - 1
+        pieces.append(text[:cut + 1].strip())
+        text = text[cut + 1:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+def split_tts_text(clean_text):
+    """
+    Cleaned text as synthesis chunks, in order: split into sentences, long
+    sentences broken up, then packed back together up to TTS_CHUNK_CHARS
+    (TTS_FIRST_CHUNK_CHARS for the first chunk)
+    """
+    pieces = []
+    for sentence in _TTS_SENTENCE_END.split(clean_text):
+        pieces.extend(_split_long_text(sentence, TTS_CHUNK_CHARS))
+    if pieces and len(pieces[0]) > TTS_FIRST_CHUNK_CHARS:
+        pieces[:1] = _split_long_text(pieces[0], TTS_FIRST_CHUNK_CHARS)
+    
+    chunks = []
+    current = ''
+    for piece in pieces:
+        limit = TTS_CHUNK_CHARS if chunks else TTS_FIRST_CHUNK_CHARS
+        if current and len(current) + 1 + len(piece) > limit:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+# ---------------------------------------------------------------------------
+# TTS backends
+#
+# TTS_BACKEND picks the synthesizer behind /api/tts: 'gtts' (Google Translate's
+# TTS service, the default) or 'indic' (AI4Bharat Indic-TTS FastPitch + HiFi-GAN
+# models run locally on the CPU, so speech doesn't depend on an external
+# service). A backend provides synthesize(text, language) -> MP3 bytes and
+# warm() (load whatever the first request would otherwise wait for).
+# ---------------------------------------------------------------------------
+TTS_BACKEND = os.environ.get('TTS_BACKEND', 'gtts').lower()
+
+# Local Indic-TTS models: <TTS_LOCAL_MODEL_DIR>/<language>/fastpitch/{best_model.pth,config.json}
+# and .../<language>/hifigan/{best_model.pth,config.json}, as in the Indic-TTS release archives
+TTS_LOCAL_MODEL_DIR = os.environ.get('TTS_LOCAL_MODEL_DIR', os.path.join('Indic-TTS', 'models'))
+TTS_LOCAL_LANGUAGES = [lang.strip() for lang in os.environ.get('TTS_LOCAL_LANGUAGES', 'kn,hi,en').split(',') if lang.strip()]
+TTS_LOCAL_SPEAKER = os.environ.get('TTS_LOCAL_SPEAKER', 'female')
+# Preloaded synthesizers per language, and CPU threads each may use. torch's
+# intra-op thread count is process-wide, so budget pool size x threads <= cores.
+TTS_LOCAL_POOL_SIZE = int(os.environ.get('TTS_LOCAL_POOL_SIZE', '2'))
+TTS_LOCAL_THREADS = int(os.environ.get('TTS_LOCAL_THREADS', '2'))
+# Requests arriving within TTS_LOCAL_BATCH_WAIT seconds of each other are
+# handed to one synthesizer together (up to TTS_LOCAL_BATCH_SIZE). Only a
+# synthesizer with batched inference (tts_batch) gains from this; Coqui's runs
+# them one after another.
+TTS_LOCAL_BATCH_SIZE = int(os.environ.get('TTS_LOCAL_BATCH_SIZE', '4'))
+TTS_LOCAL_BATCH_WAIT = float(os.environ.get('TTS_LOCAL_BATCH_WAIT', '0.02'))
+# Longest a request waits for a local synthesis (including queueing)
+TTS_LOCAL_TIMEOUT = float(os.environ.get('TTS_LOCAL_TIMEOUT', '60'))
+
+class TTSBackendError(RuntimeError):
+    """The configured TTS backend can't synthesize (missing library or model)"""
+
+class GTTSBackend:
+    """Google Translate's TTS service via gTTS (one HTTPS call per 100 characters)"""
+    name = 'gtts'
+    
+    def warm(self):
+        from gtts import gTTS  # noqa: F401 - import cost only
+    
+    def synthesize(self, text, language):
+        from gtts import gTTS
         
-        # Now using gTTS for Kannada (and any language that calls this endpoint)
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
+        # Generate audio using gTTS
+        tts = gTTS(text=text, lang=TTS_LANGUAGES.get(language, 'en'), slow=False, tld='com')
         
-        # Remove HTML tags for clean speech
-        clean_text = re.sub(r'<[^>]*>', ' ', text)
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+        # Save directly to memory buffer (faster than file I/O)
+        audio_buffer = io.BytesIO()
+        tts.write_to_fp(audio_buffer)
+        return audio_buffer.getvalue()
+
+def _load_indic_synthesizer(language):
+    """One Indic-TTS synthesizer (FastPitch acoustic model + HiFi-GAN vocoder) for a language, on the CPU"""
+    model_dir = os.path.join(TTS_LOCAL_MODEL_DIR, language)
+    paths = {
+        'tts_checkpoint': os.path.join(model_dir, 'fastpitch', 'best_model.pth'),
+        'tts_config_path': os.path.join(model_dir, 'fastpitch', 'config.json'),
+        'vocoder_checkpoint': os.path.join(model_dir, 'hifigan', 'best_model.pth'),
+        'vocoder_config': os.path.join(model_dir, 'hifigan', 'config.json'),
+    }
+    missing = [path for path in paths.values() if not os.path.exists(path)]
+    if missing:
+        raise TTSBackendError(
+            f"Indic-TTS model for '{language}' not found ({missing[0]}). Download the release archive "
+            f"from https://github.com/AI4Bharat/Indic-TTS and unpack it under {TTS_LOCAL_MODEL_DIR}/"
+        )
+    try:
+        # Imported on first use: torch and the Coqui TTS package are slow to import
+        import torch
+        from TTS.utils.synthesizer import Synthesizer
+    except ImportError as e:
+        raise TTSBackendError(f"Local TTS needs the Coqui TTS package and torch ({e})") from e
+    torch.set_num_threads(TTS_LOCAL_THREADS)
+    return Synthesizer(use_cuda=False, **paths)
+
+def _wav_to_mp3(wav, sample_rate):
+    """Encode float samples in [-1, 1] as mono MP3 (pydub + ffmpeg), matching gTTS's output format"""
+    from pydub import AudioSegment
+    samples = np.clip(np.asarray(wav, dtype=np.float32), -1.0, 1.0)
+    pcm = (samples * 32767).astype('<i2').tobytes()
+    segment = AudioSegment(data=pcm, sample_width=2, frame_rate=int(sample_rate), channels=1)
+    audio_buffer = io.BytesIO()
+    segment.export(audio_buffer, format='mp3', bitrate='64k')
+    return audio_buffer.getvalue()
+
+class _SynthesizerPool:
+    """
+    `size` worker threads per language, each owning one preloaded synthesizer.
+    A worker takes the oldest queued request plus any others that arrive within
+    `batch_wait` (up to `batch_size`). A synthesizer with `tts_batch` synthesizes
+    them as one batch; Coqui's Synthesizer has no batched inference, so it runs
+    them back to back and gets no batching speedup. Only real batched calls are
+    counted as `batches`; the rest are counted as `unbatched` requests.
+    """
+    
+    def __init__(self, language, load, size, batch_size, batch_wait):
+        self.language = language
+        self._load = load
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self.error = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'largest_batch': 0, 'unbatched': 0}
+        for index in range(size):
+            threading.Thread(target=self._work, name=f'tts-{language}-{index}', daemon=True).start()
+    
+    def wait_ready(self, timeout=None):
+        """Block until one synthesizer is loaded; raises if loading failed"""
+        self._ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
+    
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+    
+    def submit(self, text):
+        future = Future()
+        with self._stats_lock:
+            self._stats['requests'] += 1
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            self._queue.put((text, future))
+        return future
+    
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._batch_wait
+        while len(batch) < self._batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _work(self):
+        try:
+            synthesizer = self._load(self.language)
+        except Exception as e:
+            self.error = e if isinstance(e, TTSBackendError) else TTSBackendError(f"Could not load the '{self.language}' TTS model: {e}")
+            self._ready.set()
+            # Fail whatever is queued now and anything submitted later
+            while True:
+                _, future = self._queue.get()
+                future.set_exception(self.error)
+        self._ready.set()
         
-        if not clean_text:
-            return jsonify({'error': 'No text content after cleaning'}), 400
+        while True:
+            batch = [(text, future) for text, future in self._next_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            batched = hasattr(synthesizer, 'tts_batch')
+            with self._stats_lock:
+                if batched:
+                    self._stats['batches'] += 1
+                    self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+                else:
+                    self._stats['unbatched'] += len(batch)
+            try:
+                if batched:
+                    wavs = synthesizer.tts_batch(texts, speaker_name=TTS_LOCAL_SPEAKER)
+                else:
+                    # Coqui's Synthesizer has no batched inference: run the requests
+                    # back to back on this warm instance (no batching speedup)
+                    wavs = [synthesizer.tts(text, speaker_name=TTS_LOCAL_SPEAKER) for text in texts]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), wav in zip(batch, wavs):
+                try:
+                    future.set_result(_wav_to_mp3(wav, synthesizer.output_sample_rate))
+                except Exception as e:
+                    future.set_exception(e)
+
+class IndicTTSBackend:
+    """AI4Bharat Indic-TTS models on the local CPU, with a warm pool of synthesizers per language"""
+    name = 'indic'
+    
+    def __init__(self, load_synthesizer=None, pool_size=None, batch_size=None, batch_wait=None):
+        self._load = load_synthesizer or _load_indic_synthesizer
+        self.pool_size = pool_size or TTS_LOCAL_POOL_SIZE
+        self.batch_size = batch_size or TTS_LOCAL_BATCH_SIZE
+        self.batch_wait = TTS_LOCAL_BATCH_WAIT if batch_wait is None else batch_wait
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+    
+    def _pool(self, language):
+        language = language if language in TTS_LANGUAGES else 'en'
+        if language not in TTS_LOCAL_LANGUAGES:
+            raise TTSBackendError(f"No local TTS model configured for '{language}' (TTS_LOCAL_LANGUAGES={','.join(TTS_LOCAL_LANGUAGES)})")
+        with self._pools_lock:
+            pool = self._pools.get(language)
+            if pool is None:
+                pool = self._pools[language] = _SynthesizerPool(language, self._load, self.pool_size, self.batch_size, self.batch_wait)
+        return pool
+    
+    def warm(self):
+        """Load the synthesizer pools for every configured language"""
+        pools = [self._pool(language) for language in TTS_LOCAL_LANGUAGES]
+        for pool in pools:
+            pool.wait_ready()
+    
+    def synthesize(self, text, language):
+        return self._pool(language).submit(text).result(timeout=TTS_LOCAL_TIMEOUT)
+    
+    def stats(self):
+        with self._pools_lock:
+            return {language: pool.stats() for language, pool in self._pools.items()}
+
+TTS_BACKENDS = {
+    'gtts': GTTSBackend,
+    'indic': IndicTTSBackend,
+}
+
+_tts_backend = None
+_tts_backend_lock = threading.Lock()
+
+def get_tts_backend():
+    """Process-wide TTS backend for TTS_BACKEND, created on first use"""
+    global _tts_backend
+    if _tts_backend is None:
+        with _tts_backend_lock:
+            if _tts_backend is None:
+                backend_class = TTS_BACKENDS.get(TTS_BACKEND)
+                if backend_class is None:
+                    raise TTSBackendError(f"Unknown TTS_BACKEND '{TTS_BACKEND}' (expected one of: {', '.join(sorted(TTS_BACKENDS))})")
+                _tts_backend = backend_class()
+    return _tts_backend
+
+def synthesize_speech(clean_text, language):
+    """MP3 bytes for the text from the configured TTS backend"""
+    start_time = time.time()
+    backend = get_tts_backend()
+    audio_data = backend.synthesize(clean_text, language)
+    
+    generation_time = time.time() - start_time
+    print(f"TTS generation ({backend.name}) took {generation_time:.2f}s for {language} ({len(clean_text)} chars)")
+    return audio_data
+
+_tts_memory_cache = OrderedDict()  # key -> MP3 bytes, least recently used first
+_tts_memory_bytes = 0
+_tts_disk_bytes = None  # Total size of TTS_CACHE_DIR, scanned on first write
+_tts_cache_lock = threading.Lock()
+_tts_inflight = {}  # key -> lock held while that clip is being synthesized
+_tts_cache_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+
+def tts_cache_key(clean_text, language):
+    """Content address of the audio for cleaned text in a language"""
+    language = language if language in TTS_LANGUAGES else 'en'
+    digest = hashlib.sha256(f"{TTS_BACKEND}\n{language}\n{clean_text}".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+def _tts_disk_path(key):
+    return os.path.join(TTS_CACHE_DIR, f'{key}.mp3')
+
+def _remember_tts_audio(key, audio_data):
+    """Put a clip in the memory tier, evicting the least recently used beyond the budget"""
+    global _tts_memory_bytes
+    with _tts_cache_lock:
+        if key in _tts_memory_cache:
+            _tts_memory_cache.move_to_end(key)
+            return
+        _tts_memory_cache[key] = audio_data
+        _tts_memory_bytes += len(audio_data)
+        while _tts_memory_bytes > TTS_CACHE_MEMORY_MB * 1024 * 1024 and len(_tts_memory_cache) > 1:
+            _, evicted = _tts_memory_cache.popitem(last=False)
+            _tts_memory_bytes -= len(evicted)
+            _tts_cache_stats['evictions'] += 1
+
+def _read_tts_disk(key):
+    if not TTS_CACHE_DIR:
+        return None
+    path = _tts_disk_path(key)
+    try:
+        with open(path, 'rb') as f:
+            audio_data = f.read()
+        os.utime(path)  # mtime doubles as last-used time for disk eviction
+        return audio_data
+    except OSError:
+        return None
+
+def _write_tts_disk(key, audio_data):
+    """Persist a clip (atomically), then trim the directory to TTS_CACHE_DISK_MB"""
+    global _tts_disk_bytes
+    if not TTS_CACHE_DIR:
+        return
+    try:
+        os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+        path = _tts_disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(audio_data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"TTS cache: could not write {key}: {e}")
+        return
+    
+    with _tts_cache_lock:
+        if _tts_disk_bytes is None:
+            _tts_disk_bytes = sum(entry.stat().st_size for entry in os.scandir(TTS_CACHE_DIR) if entry.name.endswith('.mp3'))
+        else:
+            _tts_disk_bytes += len(audio_data)
+        if _tts_disk_bytes <= TTS_CACHE_DISK_MB * 1024 * 1024:
+            return
+        # Over budget: drop least recently used clips down to 90% of the budget
+        entries = sorted(
+            (entry for entry in os.scandir(TTS_CACHE_DIR) if entry.name.endswith('.mp3')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= TTS_CACHE_DISK_MB * 1024 * 1024 * 0.9:
+                break
+            if entry.name == f'{key}.mp3':
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+                _tts_cache_stats['disk_evictions'] += 1
+            except OSError:
+                pass
+        _tts_disk_bytes = total
+
+def get_cached_speech(key):
+    """Cached MP3 bytes for a key (memory, then disk), or None"""
+    with _tts_cache_lock:
+        audio_data = _tts_memory_cache.get(key)
+        if audio_data is not None:
+            _tts_memory_cache.move_to_end(key)
+            _tts_cache_stats['memory_hits'] += 1
+            return audio_data
+    audio_data = _read_tts_disk(key)
+    if audio_data is not None:
+        with _tts_cache_lock:
+            _tts_cache_stats['disk_hits'] += 1
+        _remember_tts_audio(key, audio_data)
+    return audio_data
+
+def _store_speech(key, audio_data):
+    _remember_tts_audio(key, audio_data)
+    _write_tts_disk(key, audio_data)
+
+_tts_pool = None
+_tts_pool_lock = threading.Lock()
+
+def _get_tts_pool():
+    global _tts_pool
+    if _tts_pool is None:
+        with _tts_pool_lock:
+            if _tts_pool is None:
+                _tts_pool = ThreadPoolExecutor(TTS_PARALLEL_CHUNKS, thread_name_prefix='tts')
+    return _tts_pool
+
+def _synthesize_chunks(chunks, language):
+    """Yield each chunk's MP3 in order; chunks are synthesized (or fetched from the cache) in parallel"""
+    futures = [_get_tts_pool().submit(get_speech, chunk, language, False) for chunk in chunks]
+    try:
+        for future in futures:
+            yield future.result()[1]
+    finally:
+        # Stop work nobody will read (client went away, or a chunk failed)
+        for future in futures:
+            future.cancel()
+
+def get_speech(clean_text, language, chunked=True):
+    """(key, MP3 bytes) for cleaned text, synthesizing and caching on a miss"""
+    key = tts_cache_key(clean_text, language)
+    audio_data = get_cached_speech(key)
+    if audio_data is not None:
+        return key, audio_data
+    
+    # Concurrent requests for the same clip wait for one synthesis
+    with _tts_cache_lock:
+        key_lock = _tts_inflight.setdefault(key, threading.Lock())
+    with key_lock:
+        audio_data = get_cached_speech(key)
+        if audio_data is None:
+            with _tts_cache_lock:
+                _tts_cache_stats['misses'] += 1
+            try:
+                chunks = split_tts_text(clean_text) if chunked else [clean_text]
+                if len(chunks) > 1:
+                    # MP3 frames are self-contained, so clips concatenate cleanly
+                    audio_data = b''.join(_synthesize_chunks(chunks, language))
+                else:
+                    audio_data = synthesize_speech(clean_text, language)
+            finally:
+                with _tts_cache_lock:
+                    _tts_inflight.pop(key, None)
+            _store_speech(key, audio_data)
+    return key, audio_data
+
+def stream_speech(clean_text, language):
+    """
+    Yield the MP3 for cleaned text chunk by chunk, as soon as each chunk (and
+    every chunk before it) is ready; the whole clip is cached once complete
+    """
+    key = tts_cache_key(clean_text, language)
+    audio_data = get_cached_speech(key)
+    if audio_data is not None:
+        yield audio_data
+        return
+    
+    chunks = split_tts_text(clean_text)
+    if len(chunks) == 1:
+        yield get_speech(clean_text, language)[1]
+        return
+    
+    with _tts_cache_lock:
+        _tts_cache_stats['misses'] += 1
+    parts = []
+    for part in _synthesize_chunks(chunks, language):
+        parts.append(part)
+        yield part
+    _store_speech(key, b''.join(parts))
+
+def clear_tts_cache():
+    """Empty the memory tier (the disk tier is left in place)"""
+    global _tts_memory_bytes
+    with _tts_cache_lock:
+        _tts_memory_cache.clear()
+        _tts_memory_bytes = 0
+
+def tts_cache_stats():
+    with _tts_cache_lock:
+        stats = dict(_tts_cache_stats)
+        stats['memory_entries'] = len(_tts_memory_cache)
+        stats['memory_bytes'] = _tts_memory_bytes
+        stats['disk_bytes'] = _tts_disk_bytes
+    lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+    return stats
+
+def tts_response_headers(key):
+    """Headers for a cached clip: it never changes, so clients may keep it for good"""
+    return {
+        'Content-Type': 'audio/mpeg',
+        'ETag': f'"{key}"',
+        'Cache-Control': f'public, max-age={TTS_CACHE_MAX_AGE}, immutable',
+        'Content-Location': f'/api/tts/audio/{key}'
+    }
+
+def tts_stream_headers(key):
+    """Headers for audio streamed while it is synthesized: not reusable as-is
+    (a failed chunk truncates it); replays use the cached clip at Content-Location"""
+    return {
+        'Content-Type': 'audio/mpeg',
+        'Cache-Control': 'no-store',
+        'Content-Location': f'/api/tts/audio/{key}',
+        'X-Accel-Buffering': 'no'
+    }
+
+def _iterate_after(first, rest):
+    try:
+        yield first
+        yield from rest
+    finally:
+        rest.close()
+
+def warm_tts_cache():
+    """Load the TTS backend, then synthesize the canned chatbot replies (greetings, refusals) ahead of the first click"""
+    get_tts_backend().warm()
+    for phrases in (CHATBOT_GREETINGS, CHATBOT_REFUSALS):
+        for language, text in phrases.items():
+            get_speech(clean_tts_text(text), language)
+
+def _tts_audio_response(key, audio_data):
+    """MP3 response for a clip, or 304 if the client already holds this ETag"""
+    headers = tts_response_headers(key)
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+        response.headers.update({name: value for name, value in headers.items() if name != 'Content-Type'})
+        return response
+    response = send_file(
+        io.BytesIO(audio_data),
+        mimetype='audio/mpeg',
+        as_attachment=False,
+        download_name='speech.mp3',
+        etag=False
+    )
+    response.headers.update(headers)
+    return response
+
+@app.route('/api/tts', methods=['POST'])
+def text_to_speech():
+    """Generate audio from text with the configured TTS backend (gTTS or local Indic-TTS)"""
+    try:
+        try:
+            clean_text, language = _read_tts_request()
+        except TTSRequestError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Limit text length for faster processing
-        max_length = 5000  # gTTS limit
-        if len(clean_text) > max_length:
-            clean_text = clean_text[:max_length] + "..."
+        # A client replaying audio it already has needs no synthesis at all
+        key = tts_cache_key(clean_text, language)
+        if request.if_none_match.contains(key):
+            return _tts_audio_response(key, b'')
         
         try:
-            start_time = time.time()
-            
-            # COMMENTED OUT: AI4Bharat Indic-TTS approach
-            # synthesizer = get_ai4bharat_tts()
-            # if synthesizer is None:
-            #     return jsonify({
-            #         'error': 'AI4Bharat Indic-TTS not available. Please set up Indic-TTS: git clone https://github.com/AI4Bharat/Indic-TTS.git'
-            #     }), 500
-            # 
-            # # Generate audio using AI4Bharat Indic-TTS
-            # temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            # temp_file.close()
-            # 
-            # try:
-            #     # Synthesize Kannada text
-            #     wav = synthesizer.tts(clean_text)
-            #     synthesizer.save_wav(wav, temp_file.name)
-            #     
-            #     # Read the generated audio file
-            #     with open(temp_file.name, 'rb') as f:
-            #         audio_data = f.read()
-            #     
-            #     # Clean up temp file
-            #     os.unlink(temp_file.name)
-            #     
-            #     generation_time = time.time() - start_time
-            #     print(f"AI4Bharat TTS generation took {generation_time:.2f}s for Kannada ({len(clean_text)} chars)")
-            
-            # Using gTTS for Kannada (and other languages if needed)
-            from gtts import gTTS
-            
-            # Language code mapping
-            lang_map = {
-                'en': 'en',
-                'hi': 'hi',
-                'kn': 'kn'
-            }
-            tts_lang = lang_map.get(language, 'en')
+            audio_data = get_cached_speech(key)
+            if audio_data is None and len(split_tts_text(clean_text)) > 1:
+                # Long text: stream each chunk as soon as it is ready. The first
+                # chunk is synthesized before responding so a failure still gets
+                # a JSON error.
+                audio_stream = stream_speech(clean_text, language)
+                first_part = next(audio_stream)
+                return Response(_iterate_after(first_part, audio_stream), headers=tts_stream_headers(key))
             
-            # Generate audio using gTTS
-            tts = gTTS(text=clean_text, lang=tts_lang, slow=False, tld='com')
-            
-            # Save directly to memory buffer (faster than file I/O)
-            audio_buffer = io.BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            
-            generation_time = time.time() - start_time
-            print(f"TTS generation (gTTS) took {generation_time:.2f}s for {language} ({len(clean_text)} chars)")
-            
-            # Return audio file
-            response = send_file(
-                audio_buffer,
-                mimetype='audio/mpeg',
-                as_attachment=False,
-                download_name='speech.mp3'
-            )
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            response.headers['Content-Type'] = 'audio/mpeg'
-            return response
+            if audio_data is None:
+                key, audio_data = get_speech(clean_text, language)
+            return _tts_audio_response(key, audio_data)
             
         except Exception as e:
             print(f"TTS error: {str(e)}")
@@ -1737,164 +3669,358 @@ def text_to_speech():
     except Exception as e:
         return jsonify({'error': f'TTS error: {str(e)}'}), 500
 
-def prepare_farm_context(all_farms):
-    """Prepare comprehensive farm data context from CSV datasets"""
-    context = []
-    for farm_name, data in all_farms.items():
-        if data.empty:
-            continue
-            
-        score = calculate_performance_score_from_data(data)
-        
-        # Core Performance Metrics
-        yield_val = float(data['Yield_tonnes_per_ha'].mean())
-        spoilage = float(data['SpoilageRate_%'].mean())
-        defects = float(data['DefectRate_%'].mean())
-        waste = float(data['WastePercentage_%'].mean())
-        satisfaction = float(data['SatisfactionScore_0_10'].mean())
-        pest_risk = float(data['PestRiskScore'].mean())
-        machinery_uptime = float(data['MachineryUptime_%'].mean())
-        harvest_uptime = float(data['HarvestRobotUptime_%'].mean())
-        
-        # Production Metrics
-        soil_moisture = float(data['SoilMoisture_%'].mean())
-        temperature = float(data['Temperature_C'].mean())
-        rainfall = float(data['Rainfall_mm'].mean())
-        fertilizer = float(data['Fertilizer_kg_per_ha'].mean())
-        
-        # Storage Metrics
-        storage_temp = float(data['StorageTemperature_C'].mean())
-        humidity = float(data['Humidity_%'].mean())
-        shelf_life = float(data['PredictedShelfLife_days'].mean())
-        storage_days = float(data['StorageDays'].mean())
-        grading_score = data['GradingScore'].mode()[0] if not data['GradingScore'].mode().empty else 'N/A'
-        
-        # Processing Metrics
-        process_types = data['ProcessType'].value_counts().to_dict()
-        packaging_types = data['PackagingType'].value_counts().to_dict()
-        packaging_speed = float(data['PackagingSpeed_units_per_min'].mean())
-        
-        # Transportation Metrics
-        transport_modes = data['TransportMode'].value_counts().to_dict()
-        avg_distance = float(data['TransportDistance_km'].mean())
-        fuel_usage = float(data['FuelUsage_L_per_100km'].mean())
-        delivery_time = float(data['DeliveryTime_hr'].mean())
-        delay_percentage = float((data['DeliveryDelayFlag'].sum() / len(data)) * 100)
-        spoilage_in_transit = float(data['SpoilageInTransit_%'].mean())
-        
-        # Retail Metrics
-        inventory = float(data['RetailInventory_units'].mean())
-        sales_velocity = float(data['SalesVelocity_units_per_day'].mean())
-        pricing_index = float(data['DynamicPricingIndex'].mean())
-        
-        # Consumption Metrics
-        household_waste = float(data['HouseholdWaste_kg'].mean())
-        recipe_accuracy = float(data['RecipeRecommendationAccuracy_%'].mean())
-        
-        # Waste Management Metrics
-        waste_types = data['WasteType'].value_counts().to_dict()
-        segregation_accuracy = float(data['SegregationAccuracy_%'].mean())
-        upcycling_rate = float(data['UpcyclingRate_%'].mean())
-        biogas_output = float(data['BiogasOutput_m3'].mean())
-        
-        # Get crop types and their detailed metrics for this farm
-        crop_yields = data.groupby('CropType')['Yield_tonnes_per_ha'].mean().to_dict()
-        crop_spoilage = data.groupby('CropType')['SpoilageRate_%'].mean().to_dict()
-        crop_waste = data.groupby('CropType')['WastePercentage_%'].mean().to_dict()
-        crop_defects = data.groupby('CropType')['DefectRate_%'].mean().to_dict()
-        
-        # Build comprehensive context
-        context.append(f"=== {farm_name} (Performance Score: {score:.0f}/100) ===")
-        context.append(f"OVERALL METRICS: Yield:{yield_val:.1f}t/ha | Spoilage:{spoilage:.1f}% | Defects:{defects:.1f}% | Waste:{waste:.1f}% | Satisfaction:{satisfaction:.1f}/10")
-        context.append(f"PRODUCTION: Soil Moisture:{soil_moisture:.1f}% | Temp:{temperature:.1f}°C | Rainfall:{rainfall:.1f}mm | Fertilizer:{fertilizer:.1f}kg/ha | Pest Risk:{pest_risk:.1f} | Machinery Uptime:{machinery_uptime:.1f}% | Harvest Robot Uptime:{harvest_uptime:.1f}%")
-        context.append(f"STORAGE: Temp:{storage_temp:.1f}°C | Humidity:{humidity:.1f}% | Shelf Life:{shelf_life:.1f} days | Storage Days:{storage_days:.1f} | Grading:{grading_score}")
-        context.append(f"PROCESSING: Main Process Types:{', '.join([f'{k}({v})' for k,v in list(process_types.items())[:3]])} | Packaging Types:{', '.join([f'{k}({v})' for k,v in list(packaging_types.items())[:3]])} | Packaging Speed:{packaging_speed:.0f} units/min")
-        context.append(f"TRANSPORTATION: Modes:{', '.join([f'{k}({v})' for k,v in list(transport_modes.items())[:3]])} | Avg Distance:{avg_distance:.1f}km | Fuel:{fuel_usage:.1f}L/100km | Delivery Time:{delivery_time:.1f}hr | Delays:{delay_percentage:.1f}% | Spoilage in Transit:{spoilage_in_transit:.2f}%")
-        context.append(f"RETAIL: Inventory:{inventory:.0f} units | Sales Velocity:{sales_velocity:.0f} units/day | Pricing Index:{pricing_index:.2f}")
-        context.append(f"CONSUMPTION: Household Waste:{household_waste:.2f}kg | Recipe Accuracy:{recipe_accuracy:.1f}%")
-        context.append(f"WASTE MANAGEMENT: Types:{', '.join([f'{k}({v})' for k,v in list(waste_types.items())[:3]])} | Segregation:{segregation_accuracy:.1f}% | Upcycling:{upcycling_rate:.1f}% | Biogas:{biogas_output:.1f}m³")
-        context.append(f"CROP BREAKDOWN:")
-        for crop in crop_yields.keys():
-            context.append(f"  - {crop}: Yield:{crop_yields[crop]:.1f}t/ha | Spoilage:{crop_spoilage.get(crop,0):.1f}% | Waste:{crop_waste.get(crop,0):.1f}% | Defects:{crop_defects.get(crop,0):.1f}%")
-        context.append("")  # Empty line between farms
-    
-    return "\n".join(context)
-
-def answer_question(question, all_farms):
-    """Answer questions based on farm data"""
-    question_lower = question.lower()
-    
+@app.route('/api/tts/audio/<key>', methods=['GET'])
+def tts_audio(key):
+    """A previously synthesized clip by its content key (see Content-Location on /api/tts)"""
+    if request.if_none_match.contains(key):
+        return _tts_audio_response(key, b'')
+    audio_data = get_cached_speech(key)
+    if audio_data is None:
+        return jsonify({'error': 'Audio not found (it may have been evicted from the cache)'}), 404
+    return _tts_audio_response(key, audio_data)
+
+@app.route('/api/tts/cache', methods=['GET'])
+def tts_cache_stats_endpoint():
+    """Hit/miss metrics for the TTS audio cache"""
+    return jsonify(tts_cache_stats())
+
+# Context line priorities for the compact (token-budgeted) form: lower
+# priorities are kept first when the full context doesn't fit the budget
+CONTEXT_PRIORITY_CORE = 0       # farm header, overall metrics
+CONTEXT_PRIORITY_CROPS = 1      # per-crop breakdown
+CONTEXT_PRIORITY_STAGES = 2     # production and storage
+CONTEXT_PRIORITY_LOGISTICS = 3  # processing, transportation, retail
+CONTEXT_PRIORITY_DETAIL = 4     # consumption and waste management
+
+def estimate_tokens(text):
+    """Rough LLM token count (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+def _farm_context_lines(farm_name, cube):
+    """[(priority, line)] describing one farm for the LLM context"""
+    lines = []
+    m = cube['metrics']
+    score = cube['score']
+    
+    # Core Performance Metrics
+    yield_val = m['yield']
+    spoilage = m['spoilage']
+    defects = m['defects']
+    waste = m['waste']
+    satisfaction = m['satisfaction']
+    pest_risk = m['pest_risk']
+    machinery_uptime = m['machinery_uptime']
+    harvest_uptime = m['harvest_uptime']
+    
+    # Production Metrics
+    soil_moisture = m['soil_moisture']
+    temperature = m['temperature']
+    rainfall = m['rainfall']
+    fertilizer = m['fertilizer']
+    
+    # Storage Metrics
+    storage_temp = m['storage_temp']
+    humidity = m['humidity']
+    shelf_life = m['shelf_life']
+    storage_days = m['storage_days']
+    grading_score = cube['grading_mode'] if cube['grading_mode'] is not None else 'N/A'
+    
+    # Processing Metrics
+    process_types = cube['value_counts'].get('ProcessType', {})
+    packaging_types = cube['value_counts'].get('PackagingType', {})
+    packaging_speed = m['packaging_speed']
+    
+    # Transportation Metrics
+    transport_modes = cube['value_counts'].get('TransportMode', {})
+    avg_distance = m['distance']
+    fuel_usage = m['fuel']
+    delivery_time = m['delivery_time']
+    delay_percentage = m['delays']
+    spoilage_in_transit = m['transit_spoilage']
+    
+    # Retail Metrics
+    inventory = m['inventory']
+    sales_velocity = m['sales_velocity']
+    pricing_index = m['pricing_index']
+    
+    # Consumption Metrics
+    household_waste = m['household_waste']
+    recipe_accuracy = m['recipe_accuracy']
+    
+    # Waste Management Metrics
+    waste_types = cube['value_counts'].get('WasteType', {})
+    segregation_accuracy = m['segregation']
+    upcycling_rate = m['upcycling']
+    biogas_output = m['biogas']
+    
+    # Get crop types and their detailed metrics for this farm
+    crop_metrics = sorted(cube['crops'].values(), key=lambda c: c['label'])
+    crop_yields = {c['label']: c['yield'] for c in crop_metrics}
+    crop_spoilage = {c['label']: c['spoilage'] for c in crop_metrics}
+    crop_waste = {c['label']: c['waste'] for c in crop_metrics}
+    crop_defects = {c['label']: c['defects'] for c in crop_metrics}
+    
+    # Build comprehensive context
+    lines.append((CONTEXT_PRIORITY_CORE, f"=== {farm_name} (Performance Score: {score:.0f}/100) ==="))
+    lines.append((CONTEXT_PRIORITY_CORE, f"OVERALL METRICS: Yield:{yield_val:.1f}t/ha | Spoilage:{spoilage:.1f}% | Defects:{defects:.1f}% | Waste:{waste:.1f}% | Satisfaction:{satisfaction:.1f}/10"))
+    lines.append((CONTEXT_PRIORITY_STAGES, f"PRODUCTION: Soil Moisture:{soil_moisture:.1f}% | Temp:{temperature:.1f}°C | Rainfall:{rainfall:.1f}mm | Fertilizer:{fertilizer:.1f}kg/ha | Pest Risk:{pest_risk:.1f} | Machinery Uptime:{machinery_uptime:.1f}% | Harvest Robot Uptime:{harvest_uptime:.1f}%"))
+    lines.append((CONTEXT_PRIORITY_STAGES, f"STORAGE: Temp:{storage_temp:.1f}°C | Humidity:{humidity:.1f}% | Shelf Life:{shelf_life:.1f} days | Storage Days:{storage_days:.1f} | Grading:{grading_score}"))
+    lines.append((CONTEXT_PRIORITY_LOGISTICS, f"PROCESSING: Main Process Types:{', '.join([f'{k}({v})' for k,v in list(process_types.items())[:3]])} | Packaging Types:{', '.join([f'{k}({v})' for k,v in list(packaging_types.items())[:3]])} | Packaging Speed:{packaging_speed:.0f} units/min"))
+    lines.append((CONTEXT_PRIORITY_LOGISTICS, f"TRANSPORTATION: Modes:{', '.join([f'{k}({v})' for k,v in list(transport_modes.items())[:3]])} | Avg Distance:{avg_distance:.1f}km | Fuel:{fuel_usage:.1f}L/100km | Delivery Time:{delivery_time:.1f}hr | Delays:{delay_percentage:.1f}% | Spoilage in Transit:{spoilage_in_transit:.2f}%"))
+    lines.append((CONTEXT_PRIORITY_LOGISTICS, f"RETAIL: Inventory:{inventory:.0f} units | Sales Velocity:{sales_velocity:.0f} units/day | Pricing Index:{pricing_index:.2f}"))
+    lines.append((CONTEXT_PRIORITY_DETAIL, f"CONSUMPTION: Household Waste:{household_waste:.2f}kg | Recipe Accuracy:{recipe_accuracy:.1f}%"))
+    lines.append((CONTEXT_PRIORITY_DETAIL, f"WASTE MANAGEMENT: Types:{', '.join([f'{k}({v})' for k,v in list(waste_types.items())[:3]])} | Segregation:{segregation_accuracy:.1f}% | Upcycling:{upcycling_rate:.1f}% | Biogas:{biogas_output:.1f}m³"))
+    lines.append((CONTEXT_PRIORITY_CROPS, f"CROP BREAKDOWN:"))
+    for crop in crop_yields.keys():
+        lines.append((CONTEXT_PRIORITY_CROPS, f"  - {crop}: Yield:{crop_yields[crop]:.1f}t/ha | Spoilage:{crop_spoilage.get(crop,0):.1f}% | Waste:{crop_waste.get(crop,0):.1f}% | Defects:{crop_defects.get(crop,0):.1f}%"))
+    lines.append((CONTEXT_PRIORITY_CORE, ""))  # Empty line between farms
+
+    return lines
+
+def prepare_farm_context(all_cubes, max_tokens=None):
+    """
+    Prepare comprehensive farm data context from the aggregate cube.
+    With `max_tokens`, drop the least important sections (across all farms)
+    until the context fits; the core metrics are always kept.
+    """
+    lines = []
+    for farm_name, cube in all_cubes.items():
+        lines.extend(_farm_context_lines(farm_name, cube))
+    
+    if max_tokens is None:
+        return "\n".join(line for _, line in lines)
+    
+    levels = sorted(set(priority for priority, _ in lines), reverse=True)
+    for level in levels:
+        context = "\n".join(line for priority, line in lines if priority <= level)
+        if estimate_tokens(context) <= max_tokens:
+            return context
+    return context
+
+# Farm names as they appear in questions -> the farm they refer to
+FARM_SUMMARY_KEYWORDS = {
+    'farma': 'FarmA', 'farm a': 'FarmA',
+    'farmb': 'FarmB', 'farm b': 'FarmB',
+    'farmc': 'FarmC', 'farm c': 'FarmC',
+    'farmd': 'FarmD', 'farm d': 'FarmD',
+}
+
+# Intents the rule-based answerer recognizes, in priority order: (intent, keywords).
+# The first matching intent decides the answer.
+QUESTION_INTENTS = [
     # Farm performance questions
-    if any(word in question_lower for word in ['best', 'top', 'highest', 'excellent', 'performing']):
-        return get_best_farm_info(all_farms)
-    
-    if any(word in question_lower for word in ['worst', 'lowest', 'poor', 'needs attention', 'worst performing']):
-        return get_worst_farm_info(all_farms)
-    
+    ('best_farm', ['best', 'top', 'highest', 'excellent', 'performing']),
+    ('worst_farm', ['worst', 'lowest', 'poor', 'needs attention', 'worst performing']),
     # Specific farm questions
-    for farm_name in ['farma', 'farm a', 'farb', 'farm b', 'farc', 'farm c', 'farmd', 'farm d']:
-        if farm_name in question_lower:
-            actual_farm = 'FarmA' if 'a' in farm_name else 'FarmB' if 'b' in farm_name else 'FarmC' if 'c' in farm_name else 'FarmD'
-            return get_farm_summary(actual_farm, all_farms.get(actual_farm))
-    
+    ('farm_summary', list(FARM_SUMMARY_KEYWORDS)),
     # Metric-specific questions
-    if any(word in question_lower for word in ['yield', 'production']):
-        return get_yield_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['spoilage', 'spoil']):
-        return get_spoilage_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['waste']):
-        return get_waste_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['satisfaction', 'customer']):
-        return get_satisfaction_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['pest', 'pest risk']):
-        return get_pest_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['machinery', 'uptime', 'downtime']):
-        return get_machinery_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['defect', 'defects']):
-        return get_defect_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['delay', 'delivery']):
-        return get_delay_comparison(all_farms)
-    
-    if any(word in question_lower for word in ['storage', 'temperature', 'humidity']):
-        return get_storage_comparison(all_farms)
-    
+    ('yield', ['yield', 'production']),
+    ('spoilage', ['spoilage', 'spoil']),
+    ('waste', ['waste']),
+    ('satisfaction', ['satisfaction', 'customer']),
+    ('pest', ['pest', 'pest risk']),
+    ('machinery', ['machinery', 'uptime', 'downtime']),
+    ('defects', ['defect', 'defects']),
+    ('delays', ['delay', 'delivery']),
+    ('storage', ['storage', 'temperature', 'humidity']),
     # Comparison questions
-    if any(word in question_lower for word in ['compare', 'comparison', 'difference']):
-        return get_general_comparison(all_farms)
-    
+    ('comparison', ['compare', 'comparison', 'difference']),
     # Score questions
-    if any(word in question_lower for word in ['score', 'performance score', 'rating']):
-        return get_performance_scores(all_farms)
-    
+    ('scores', ['score', 'performance score', 'rating']),
     # General help
-    if any(word in question_lower for word in ['help', 'what can', 'how can', 'what do you']):
+    ('help', ['help', 'what can', 'how can', 'what do you']),
+]
+
+# Intents that only shape another intent ("compare spoilage") rather than
+# competing with it when deciding how confident the routing is
+MODIFIER_INTENTS = {'comparison', 'scores', 'help'}
+
+# Words that mean the question needs reasoning or advice, not a data lookup
+OPEN_ENDED_MARKERS = [
+    'why', 'should', 'recommend', 'suggest', 'advice', 'advise', 'explain',
+    'improve', 'reduce', 'increase', 'what if', 'predict', 'forecast', 'price',
+    'grow', 'plant', 'season', 'profit', 'plan', 'strategy', 'cause'
+]
+
+# Every keyword the chatbot routes on (FARMING_KEYWORDS, OFF_TOPIC_KEYWORDS,
+# OPEN_ENDED_MARKERS and the QUESTION_INTENTS keywords) is matched in a single
+# pass by one regex. The regex is shaped like a trie (alternatives share
+# prefixes), so the engine branches on each next character instead of trying
+# every keyword, and it sits inside a lookahead so a match is attempted at
+# every position. At each position it reports the longest keyword; the
+# shorter keywords starting there are exactly its prefixes, looked up in
+# _QUESTION_KEYWORD_PREFIXES. The result is the same as testing each keyword
+# with `in`.
+#
+# Substring matches only decide the topic (is_off_topic) and the open-ended
+# check. An intent keyword counts only as a whole word, optionally with a plural
+# "s"/"es" ("yields", "defects"), so "stop spraying" doesn't read as "top" and
+# gets a confident rule-based answer.
+
+QuestionProfile = namedtuple('QuestionProfile', ['farming', 'off_topic', 'open_ended', 'intents', 'farms'])
+
+_WORD_CHAR = re.compile(r'\w')
+_WORD_END = re.compile(r'(?!\w)')
+_PLURAL_WORD_END = re.compile(r'(?:e?s)?(?!\w)')
+
+def _intent_keyword_end(keyword):
+    """What has to follow an intent keyword: a word end, after an optional plural unless the last word is one letter ("farm a")"""
+    return _PLURAL_WORD_END if len(keyword.split()[-1]) > 1 else _WORD_END
+
+def _trie_pattern(words):
+    """Regex source matching the longest of `words` at the current position"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+    
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+        if not branches:
+            return ''
+        pattern = '(?:' + '|'.join(branches) + ')' if len(branches) > 1 else branches[0]
+        # A word ends here: the longer continuations are optional (greedy, so longest wins)
+        return f'(?:{pattern})?' if '' in node else pattern
+    
+    return build(trie)
+
+def _compile_question_matcher():
+    keywords = set(FARMING_KEYWORDS) | set(OFF_TOPIC_KEYWORDS) | set(OPEN_ENDED_MARKERS)
+    # keyword -> [(intent priority, keyword priority within the intent)]
+    intent_keywords = {}
+    for intent_index, (_, intent_words) in enumerate(QUESTION_INTENTS):
+        for keyword_index, keyword in enumerate(intent_words):
+            keywords.add(keyword)
+            intent_keywords.setdefault(keyword, []).append((intent_index, keyword_index))
+    pattern = re.compile('(?=(' + _trie_pattern(keywords) + '))')
+    prefixes = {keyword: frozenset(other for other in keywords if keyword.startswith(other)) for keyword in keywords}
+    word_ends = {keyword: _intent_keyword_end(keyword) for keyword in intent_keywords}
+    return pattern, prefixes, intent_keywords, word_ends
+
+(_QUESTION_KEYWORD_PATTERN, _QUESTION_KEYWORD_PREFIXES,
+ _QUESTION_INTENT_KEYWORDS, _QUESTION_INTENT_WORD_ENDS) = _compile_question_matcher()
+_FARMING_KEYWORD_SET = frozenset(FARMING_KEYWORDS)
+_OFF_TOPIC_KEYWORD_SET = frozenset(OFF_TOPIC_KEYWORDS)
+_OPEN_ENDED_MARKER_SET = frozenset(OPEN_ENDED_MARKERS)
+
+def _scan_question(question):
+    """(routing keywords that occur as substrings, intent keywords that occur as whole words)"""
+    text = question.lower()
+    found, words = set(), set()
+    for match in _QUESTION_KEYWORD_PATTERN.finditer(text):
+        start = match.start()
+        keywords = _QUESTION_KEYWORD_PREFIXES[match.group(1)]
+        found |= keywords
+        if start and _WORD_CHAR.match(text, start - 1):
+            continue  # Starts mid-word
+        for keyword in keywords:
+            word_end = _QUESTION_INTENT_WORD_ENDS.get(keyword)
+            if word_end is not None and word_end.match(text, start + len(keyword)):
+                words.add(keyword)
+    return found, words
+
+def find_question_keywords(question):
+    """Set of routing keywords that occur in the question (case-insensitive substrings)"""
+    return _scan_question(question)[0]
+
+@lru_cache(maxsize=1024)
+def classify_question(question):
+    """
+    Topic and intents of a question in one keyword pass, cached per question
+    (the chatbot checks the topic, the fast-path confidence and the answer in turn).
+    intents is [(intent, matched keyword)] in QUESTION_INTENTS order; the keyword
+    is the intent's first listed keyword that occurs as a whole word. farms are
+    the farms named in the question.
+    """
+    found, words = _scan_question(question)
+    best = {}  # intent index -> keyword index
+    for keyword in words:
+        for intent_index, keyword_index in _QUESTION_INTENT_KEYWORDS.get(keyword, ()):
+            if keyword_index < best.get(intent_index, len(QUESTION_INTENTS[intent_index][1])):
+                best[intent_index] = keyword_index
+    intents = tuple(
+        (QUESTION_INTENTS[intent_index][0], QUESTION_INTENTS[intent_index][1][keyword_index])
+        for intent_index, keyword_index in sorted(best.items())
+    )
+    return QuestionProfile(
+        farming=not found.isdisjoint(_FARMING_KEYWORD_SET),
+        off_topic=not found.isdisjoint(_OFF_TOPIC_KEYWORD_SET),
+        open_ended=not found.isdisjoint(_OPEN_ENDED_MARKER_SET),
+        intents=intents,
+        farms=tuple(sorted({FARM_SUMMARY_KEYWORDS[keyword] for keyword in words if keyword in FARM_SUMMARY_KEYWORDS}))
+    )
+
+def match_question_intents(question):
+    """[(intent, matched keyword)] for every intent whose keywords appear in the question as words"""
+    return list(classify_question(question).intents)
+
+def score_question_intent(question):
+    """
+    How confidently the rule-based answerer can handle a question, from 0 to 1.
+    Full confidence needs exactly one data intent, no advice-style wording and a short question.
+    """
+    profile = classify_question(question)
+    matches = profile.intents
+    if not matches or matches[0][0] == 'help':
+        return 0.0
+    
+    specific = {intent for intent, _ in matches if intent not in MODIFIER_INTENTS}
+    confidence = 1.0
+    if len(specific) > 1:
+        confidence -= 0.3 * (len(specific) - 1)  # e.g. "highest yield on farm a" is ambiguous
+    if len(profile.farms) > 1:
+        confidence -= 0.3 * (len(profile.farms) - 1)  # "farm a vs farm b" isn't one farm's summary
+    if profile.open_ended:
+        confidence -= 0.5
+    if len(question.split()) > 12:
+        confidence -= 0.2
+    return max(0.0, confidence)
+
+def answer_question(question, all_cubes):
+    """Answer questions based on farm data"""
+    matches = classify_question(question).intents
+    if not matches:
+        # Default response with suggestions
+        return f"I understand you're asking about: '{question}'. Here's what I can help with:\n\n" + get_help_message()
+    
+    intent, keyword = matches[0]
+    if intent == 'farm_summary':
+        farm_name = FARM_SUMMARY_KEYWORDS[keyword]
+        return get_farm_summary(farm_name, all_cubes.get(farm_name))
+    if intent == 'help':
         return get_help_message()
     
-    # Default response with suggestions
-    return f"I understand you're asking about: '{question}'. Here's what I can help with:\n\n" + get_help_message()
+    answerers = {
+        'best_farm': get_best_farm_info,
+        'worst_farm': get_worst_farm_info,
+        'yield': get_yield_comparison,
+        'spoilage': get_spoilage_comparison,
+        'waste': get_waste_comparison,
+        'satisfaction': get_satisfaction_comparison,
+        'pest': get_pest_comparison,
+        'machinery': get_machinery_comparison,
+        'defects': get_defect_comparison,
+        'delays': get_delay_comparison,
+        'storage': get_storage_comparison,
+        'comparison': get_general_comparison,
+        'scores': get_performance_scores,
+    }
+    return answerers[intent](all_cubes)
 
-def get_best_farm_info(all_farms):
+def get_best_farm_info(all_cubes):
     """Get information about the best performing farm"""
-    scores = {}
-    for farm_name, data in all_farms.items():
-        score = calculate_performance_score_from_data(data)
-        scores[farm_name] = score
+    scores = {farm_name: cube['score'] for farm_name, cube in all_cubes.items()}
     
     best_farm = max(scores, key=scores.get)
     best_score = scores[best_farm]
-    data = all_farms[best_farm]
+    m = all_cubes[best_farm]['metrics']
     
-    yield_val = float(data['Yield_tonnes_per_ha'].mean())
-    spoilage = float(data['SpoilageRate_%'].mean())
-    waste = float(data['WastePercentage_%'].mean())
-    satisfaction = float(data['SatisfactionScore_0_10'].mean())
+    yield_val = m['yield']
+    spoilage = m['spoilage']
+    waste = m['waste']
+    satisfaction = m['satisfaction']
     
     return f"🏆 {best_farm} is the best performing farm with a score of {best_score:.1f}/100!\n\n" \
            f"Key metrics:\n" \
@@ -1904,21 +4030,18 @@ def get_best_farm_info(all_farms):
            f"• Customer Satisfaction: {satisfaction:.1f}/10\n\n" \
            f"This farm demonstrates excellent performance across multiple metrics."
 
-def get_worst_farm_info(all_farms):
+def get_worst_farm_info(all_cubes):
     """Get information about the worst performing farm"""
-    scores = {}
-    for farm_name, data in all_farms.items():
-        score = calculate_performance_score_from_data(data)
-        scores[farm_name] = score
+    scores = {farm_name: cube['score'] for farm_name, cube in all_cubes.items()}
     
     worst_farm = min(scores, key=scores.get)
     worst_score = scores[worst_farm]
-    data = all_farms[worst_farm]
+    m = all_cubes[worst_farm]['metrics']
     
-    yield_val = float(data['Yield_tonnes_per_ha'].mean())
-    spoilage = float(data['SpoilageRate_%'].mean())
-    waste = float(data['WastePercentage_%'].mean())
-    satisfaction = float(data['SatisfactionScore_0_10'].mean())
+    yield_val = m['yield']
+    spoilage = m['spoilage']
+    waste = m['waste']
+    satisfaction = m['satisfaction']
     
     return f"⚠️ {worst_farm} needs attention with a score of {worst_score:.1f}/100.\n\n" \
            f"Key metrics:\n" \
@@ -1928,21 +4051,22 @@ def get_worst_farm_info(all_farms):
            f"• Customer Satisfaction: {satisfaction:.1f}/10\n\n" \
            f"Recommendations: Focus on reducing spoilage and waste, improving yield, and enhancing customer satisfaction."
 
-def get_farm_summary(farm_name, data):
+def get_farm_summary(farm_name, cube):
     """Get summary for a specific farm"""
-    if data is None or data.empty:
+    if cube is None:
         return f"Sorry, I couldn't find data for {farm_name}."
     
-    score = calculate_performance_score_from_data(data)
-    yield_val = float(data['Yield_tonnes_per_ha'].mean())
-    spoilage = float(data['SpoilageRate_%'].mean())
-    defects = float(data['DefectRate_%'].mean())
-    waste = float(data['WastePercentage_%'].mean())
-    satisfaction = float(data['SatisfactionScore_0_10'].mean())
-    pest_risk = float(data['PestRiskScore'].mean())
-    machinery_uptime = float(data['MachineryUptime_%'].mean())
+    m = cube['metrics']
+    score = cube['score']
+    yield_val = m['yield']
+    spoilage = m['spoilage']
+    defects = m['defects']
+    waste = m['waste']
+    satisfaction = m['satisfaction']
+    pest_risk = m['pest_risk']
+    machinery_uptime = m['machinery_uptime']
     
-    status = "Excellent" if score >= 80 else "Good" if score >= 65 else "Average" if score >= 50 else "Needs Attention"
+    status = performance_status(score)
     
     return f"📊 {farm_name} Summary:\n\n" \
            f"Performance Score: {score:.1f}/100 ({status})\n\n" \
@@ -1954,13 +4078,13 @@ def get_farm_summary(farm_name, data):
            f"• Customer Satisfaction: {satisfaction:.1f}/10\n" \
            f"• Pest Risk: {pest_risk:.1f}\n" \
            f"• Machinery Uptime: {machinery_uptime:.1f}%\n\n" \
-           f"Total Records: {len(data)}"
+           f"Total Records: {cube['records']}"
 
-def get_yield_comparison(all_farms):
+def get_yield_comparison(all_cubes):
     """Compare yields across farms"""
     yields = {}
-    for farm_name, data in all_farms.items():
-        yields[farm_name] = float(data['Yield_tonnes_per_ha'].mean())
+    for farm_name, cube in all_cubes.items():
+        yields[farm_name] = cube['metrics']['yield']
     
     sorted_farms = sorted(yields.items(), key=lambda x: x[1], reverse=True)
     response = "🌱 Yield Comparison (tonnes/ha):\n\n"
@@ -1974,11 +4098,11 @@ def get_yield_comparison(all_farms):
     
     return response
 
-def get_spoilage_comparison(all_farms):
+def get_spoilage_comparison(all_cubes):
     """Compare spoilage rates"""
     spoilage = {}
-    for farm_name, data in all_farms.items():
-        spoilage[farm_name] = float(data['SpoilageRate_%'].mean())
+    for farm_name, cube in all_cubes.items():
+        spoilage[farm_name] = cube['metrics']['spoilage']
     
     sorted_farms = sorted(spoilage.items(), key=lambda x: x[1])
     response = "❄️ Spoilage Rate Comparison (%):\n\n"
@@ -1992,11 +4116,11 @@ def get_spoilage_comparison(all_farms):
     
     return response
 
-def get_waste_comparison(all_farms):
+def get_waste_comparison(all_cubes):
     """Compare waste percentages"""
     waste = {}
-    for farm_name, data in all_farms.items():
-        waste[farm_name] = float(data['WastePercentage_%'].mean())
+    for farm_name, cube in all_cubes.items():
+        waste[farm_name] = cube['metrics']['waste']
     
     sorted_farms = sorted(waste.items(), key=lambda x: x[1])
     response = "♻️ Waste Comparison (%):\n\n"
@@ -2010,11 +4134,11 @@ def get_waste_comparison(all_farms):
     
     return response
 
-def get_satisfaction_comparison(all_farms):
+def get_satisfaction_comparison(all_cubes):
     """Compare customer satisfaction"""
     satisfaction = {}
-    for farm_name, data in all_farms.items():
-        satisfaction[farm_name] = float(data['SatisfactionScore_0_10'].mean())
+    for farm_name, cube in all_cubes.items():
+        satisfaction[farm_name] = cube['metrics']['satisfaction']
     
     sorted_farms = sorted(satisfaction.items(), key=lambda x: x[1], reverse=True)
     response = "👥 Customer Satisfaction Comparison (/10):\n\n"
@@ -2028,11 +4152,11 @@ def get_satisfaction_comparison(all_farms):
     
     return response
 
-def get_pest_comparison(all_farms):
+def get_pest_comparison(all_cubes):
     """Compare pest risk scores"""
     pest = {}
-    for farm_name, data in all_farms.items():
-        pest[farm_name] = float(data['PestRiskScore'].mean())
+    for farm_name, cube in all_cubes.items():
+        pest[farm_name] = cube['metrics']['pest_risk']
     
     sorted_farms = sorted(pest.items(), key=lambda x: x[1])
     response = "🐛 Pest Risk Comparison:\n\n"
@@ -2046,11 +4170,11 @@ def get_pest_comparison(all_farms):
     
     return response
 
-def get_machinery_comparison(all_farms):
+def get_machinery_comparison(all_cubes):
     """Compare machinery uptime"""
     uptime = {}
-    for farm_name, data in all_farms.items():
-        uptime[farm_name] = float(data['MachineryUptime_%'].mean())
+    for farm_name, cube in all_cubes.items():
+        uptime[farm_name] = cube['metrics']['machinery_uptime']
     
     sorted_farms = sorted(uptime.items(), key=lambda x: x[1], reverse=True)
     response = "⚙️ Machinery Uptime Comparison (%):\n\n"
@@ -2064,11 +4188,11 @@ def get_machinery_comparison(all_farms):
     
     return response
 
-def get_defect_comparison(all_farms):
+def get_defect_comparison(all_cubes):
     """Compare defect rates"""
     defects = {}
-    for farm_name, data in all_farms.items():
-        defects[farm_name] = float(data['DefectRate_%'].mean())
+    for farm_name, cube in all_cubes.items():
+        defects[farm_name] = cube['metrics']['defects']
     
     sorted_farms = sorted(defects.items(), key=lambda x: x[1])
     response = "🔧 Defect Rate Comparison (%):\n\n"
@@ -2082,11 +4206,11 @@ def get_defect_comparison(all_farms):
     
     return response
 
-def get_delay_comparison(all_farms):
+def get_delay_comparison(all_cubes):
     """Compare delivery delays"""
     delays = {}
-    for farm_name, data in all_farms.items():
-        delays[farm_name] = float((data['DeliveryDelayFlag'].sum() / len(data) * 100))
+    for farm_name, cube in all_cubes.items():
+        delays[farm_name] = cube['metrics']['delays']
     
     sorted_farms = sorted(delays.items(), key=lambda x: x[1])
     response = "🚚 Delivery Delay Comparison (%):\n\n"
@@ -2100,13 +4224,13 @@ def get_delay_comparison(all_farms):
     
     return response
 
-def get_storage_comparison(all_farms):
+def get_storage_comparison(all_cubes):
     """Compare storage conditions"""
     response = "❄️ Storage Conditions Comparison:\n\n"
-    for farm_name, data in all_farms.items():
-        temp = float(data['StorageTemperature_C'].mean())
-        humidity = float(data['Humidity_%'].mean())
-        spoilage = float(data['SpoilageRate_%'].mean())
+    for farm_name, cube in all_cubes.items():
+        temp = cube['metrics']['storage_temp']
+        humidity = cube['metrics']['humidity']
+        spoilage = cube['metrics']['spoilage']
         response += f"{farm_name}:\n"
         response += f"  • Temperature: {temp:.1f}°C\n"
         response += f"  • Humidity: {humidity:.1f}%\n"
@@ -2114,32 +4238,27 @@ def get_storage_comparison(all_farms):
     
     return response
 
-def get_general_comparison(all_farms):
+def get_general_comparison(all_cubes):
     """Get general comparison of all farms"""
-    scores = {}
-    for farm_name, data in all_farms.items():
-        scores[farm_name] = calculate_performance_score_from_data(data)
+    scores = {farm_name: cube['score'] for farm_name, cube in all_cubes.items()}
     
     sorted_farms = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     response = "📊 Overall Farm Comparison:\n\n"
     response += "Performance Scores:\n"
     for farm, score in sorted_farms:
-        status = "Excellent" if score >= 80 else "Good" if score >= 65 else "Average" if score >= 50 else "Needs Attention"
-        response += f"• {farm}: {score:.1f}/100 ({status})\n"
+        response += f"• {farm}: {score:.1f}/100 ({performance_status(score)})\n"
     
     return response
 
-def get_performance_scores(all_farms):
+def get_performance_scores(all_cubes):
     """Get performance scores for all farms"""
-    scores = {}
-    for farm_name, data in all_farms.items():
-        scores[farm_name] = calculate_performance_score_from_data(data)
+    scores = {farm_name: cube['score'] for farm_name, cube in all_cubes.items()}
     
     sorted_farms = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     response = "📈 Performance Scores:\n\n"
     for farm, score in sorted_farms:
-        status = "Excellent ✅" if score >= 80 else "Good ✅" if score >= 65 else "Average ⚠️" if score >= 50 else "Needs Attention ❌"
-        response += f"• {farm}: {score:.1f}/100 - {status}\n"
+        status = performance_status(score)
+        response += f"• {farm}: {score:.1f}/100 - {status} {PERFORMANCE_STATUS_ICONS[status]}\n"
     
     return response
 
@@ -2153,19 +4272,33 @@ def get_help_message():
            "• Storage: 'Storage conditions', 'Temperature comparison'\n\n" \
            "Just ask me anything about the farms!"
 
-def calculate_performance_score_from_data(data):
-    """Calculate performance score from farm data"""
-    yield_score = min(20, (float(data['Yield_tonnes_per_ha'].mean()) / 10) * 20)
-    spoilage_score = max(0, 15 - (float(data['SpoilageRate_%'].mean()) / 2))
-    defect_score = max(0, 15 - (float(data['DefectRate_%'].mean()) / 0.5))
-    delay_score = max(0, 10 - (float(data['DeliveryDelayFlag'].sum() / len(data) * 100) / 2))
-    waste_score = max(0, 10 - (float(data['WastePercentage_%'].mean()) / 2))
-    satisfaction_score = (float(data['SatisfactionScore_0_10'].mean()) / 10) * 15
-    pest_score = max(0, 10 - (float(data['PestRiskScore'].mean()) / 10))
-    uptime_score = (float(data['MachineryUptime_%'].mean()) / 100) * 5
+def calculate_performance_score(metrics):
+    """
+    Calculate performance score from a farm's aggregate metrics. This is the one
+    score every view reports (cube['score']): overview, insights and chatbot.
+    """
+    yield_score = min(20, (metrics['yield'] / 10) * 20)
+    spoilage_score = max(0, 15 - (metrics['spoilage'] / 2))
+    defect_score = max(0, 15 - (metrics['defects'] / 0.5))
+    delay_score = max(0, 10 - (metrics['delays'] / 2))
+    waste_score = max(0, 10 - (metrics['waste'] / 2))
+    satisfaction_score = (metrics['satisfaction'] / 10) * 15
+    pest_score = max(0, 10 - (metrics['pest_risk'] / 10))
+    uptime_score = (metrics['machinery_uptime'] / 100) * 5
     
     total = yield_score + spoilage_score + defect_score + delay_score + waste_score + satisfaction_score + pest_score + uptime_score
     return min(100, max(0, total))
+
+# Score bands, as the dashboard colors them (getPerformanceClass in index.html)
+PERFORMANCE_STATUS_ICONS = {'Excellent': '✅', 'Good': '✅', 'Average': '⚠️', 'Needs Attention': '❌'}
+
+def performance_status(score):
+    """Label of a performance score's band"""
+    return "Excellent" if score >= 80 else "Good" if score >= 65 else "Average" if score >= 50 else "Needs Attention"
+
+def calculate_performance_score_from_data(data):
+    """Calculate performance score from farm data"""
+    return build_farm_cube(build_farm_aggregates(data))['score']
 # --- Model Loading (Runs once at startup) ---
 # Define the crops for which you have models
 CROPS = ['wheat', 'corn', 'lettuce', 'tomato']  # Base crop names
@@ -2173,11 +4306,28 @@ MODEL_PATH = 'models/'
 # Placeholder for the loaded models
 trained_models = {}
 model_lambdas = {}  # Store Box-Cox lambda values
+model_signatures = {}  # (mtime_ns, size) of the .pkl each loaded model came from
+_model_lock = threading.RLock()
 
-def load_models():
-    """Load all trained SARIMA models into memory, handling Box-Cox transformations."""
-    for crop in CROPS:
-        model_file = os.path.join(MODEL_PATH, f'sarima_{crop}_price_model.pkl')
+# How models get loaded at startup:
+#   'background' - a daemon thread loads them while the app starts serving (default)
+#   'eager'      - load before the module finishes importing
+#   'lazy'       - load each crop's model the first time it is forecast
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'background').lower()
+
+def _model_file(crop):
+    return os.path.join(MODEL_PATH, f'sarima_{crop}_price_model.pkl')
+
+def _load_model(crop):
+    """Load one crop's SARIMA model (and Box-Cox lambda) into trained_models."""
+    # joblib and the pickled pmdarima/statsmodels classes are only imported here
+    import joblib
+    
+    model_file = _model_file(crop)
+    with _model_lock:
+        signature = _farm_file_signature(model_file)
+        if crop in model_signatures and model_signatures[crop] == signature:
+            return  # Already loaded (e.g. by the background loader)
         
         if os.path.exists(model_file):
             print(f"Loading model for {crop} from {model_file}...")
@@ -2204,54 +4354,158 @@ def load_models():
             print(f"WARNING: Model file not found for {crop} at {model_file}")
             trained_models[crop] = None
             model_lambdas[crop] = None
+        model_signatures[crop] = signature
+
+def load_models():
+    """Load all trained SARIMA models into memory, handling Box-Cox transformations."""
+    for crop in CROPS:
+        _load_model(crop)
+
+def start_model_loading(mode=None):
+    """Kick off model loading according to MODEL_LOADING (see above)"""
+    mode = mode or MODEL_LOADING
+    if mode == 'eager':
+        load_models()
+    elif mode == 'background':
+        threading.Thread(target=load_models, name='model-loader', daemon=True).start()
+    # 'lazy': get_price_forecast loads each model on first use
+
+start_model_loading()
+
+# --- Forecast Service ---
+# A crop's forecast only changes when its .pkl changes, so each crop is
+# predicted once at the largest horizon asked for so far and shorter horizons
+# are served as slices (SARIMA forecasts and intervals for step h don't depend
+# on the total horizon). Entries are keyed on the model file signature.
+DEFAULT_FORECAST_MONTHS = 6
+FORECAST_ALPHA = 0.05
+_forecast_cache = {}  # crop -> {'signature', 'months', 'dates', 'prices', 'lower_ci', 'upper_ci'}
+_forecast_lock = threading.Lock()
+
+def _compute_forecast(crop, months):
+    """Run one predict and return price-space arrays (inverse Box-Cox applied)"""
+    from scipy.special import inv_boxcox
+    
+    model = trained_models[crop]
+    forecast_values, conf_int = model.predict(
+        n_periods=months, 
+        return_conf_int=True, 
+        alpha=FORECAST_ALPHA
+    )
+    # predict() can hand back read-only arrays, so always work on copies
+    prices = np.array(forecast_values, dtype=float)
+    lower = np.array(conf_int[:, 0], dtype=float)
+    upper = np.array(conf_int[:, 1], dtype=float)
+    
+    lam = model_lambdas.get(crop)
+    if lam is not None:
+        prices = inv_boxcox(prices, lam)
+        lower = inv_boxcox(lower, lam)
+        upper = inv_boxcox(upper, lam)
+    
+    last_date = model.arima_res_.data.dates[-1]
+    dates = pd.date_range(start=last_date, periods=months + 1, freq='MS')[1:]
+    
+    for arr in (prices, lower, upper):
+        arr.setflags(write=False)
+    return {'months': months, 'dates': dates, 'prices': prices, 'lower_ci': lower, 'upper_ci': upper}
+
+def get_price_forecast(crop_name, months=DEFAULT_FORECAST_MONTHS):
+    """
+    Forecast `months` periods of prices for a crop.
+    Returns a dict with 'dates' (DatetimeIndex) and read-only 'prices', 'lower_ci',
+    'upper_ci' arrays, or None if the crop has no loaded model.
+    """
+    crop = crop_name.lower()
+    if crop not in CROPS:
+        return None
+    if months < 1:
+        raise ValueError(f"months must be at least 1, got {months}")
+    
+    signature = _farm_file_signature(_model_file(crop))
+    entry = _forecast_cache.get(crop)
+    if entry is None or entry['signature'] != signature or entry['months'] < months:
+        with _forecast_lock:
+            entry = _forecast_cache.get(crop)
+            if entry is None or entry['signature'] != signature or entry['months'] < months:
+                if model_signatures.get(crop) != signature:
+                    # Model retrained since it was loaded
+                    _load_model(crop)
+                if trained_models.get(crop) is None:
+                    return None
+                horizon = max(months, DEFAULT_FORECAST_MONTHS)
+                if entry is not None and entry['signature'] == signature:
+                    horizon = max(horizon, entry['months'])
+                entry = _compute_forecast(crop, horizon)
+                entry['signature'] = signature
+                _forecast_cache[crop] = entry
+    
+    if entry['months'] == months:
+        return entry
+    return {
+        'months': months,
+        'dates': entry['dates'][:months],
+        'prices': entry['prices'][:months],
+        'lower_ci': entry['lower_ci'][:months],
+        'upper_ci': entry['upper_ci'][:months]
+    }
 
-# Load models when the application starts
-load_models() 
+def get_price_forecasts(months=DEFAULT_FORECAST_MONTHS, crops=None):
+    """Forecasts for several crops at once; a crop maps to None if its forecast fails."""
+    forecasts = {}
+    for crop in (crops or CROPS):
+        try:
+            forecasts[crop] = get_price_forecast(crop, months)
+        except Exception as e:
+            print(f"Error generating forecast for {crop}: {e}")
+            forecasts[crop] = None
+    return forecasts
+
+def clear_forecast_cache():
+    """Drop memoized forecasts (they are also invalidated when a .pkl changes)"""
+    with _forecast_lock:
+        _forecast_cache.clear()
+
+def _data_file_signatures():
+    """[(name, (mtime_ns, size) or None)] for every farm CSV and model file"""
+    parts = [(farm, _farm_file_signature(file_path)) for farm, file_path in FARM_FILES.items()]
+    parts += [(crop, _farm_file_signature(_model_file(crop))) for crop in CROPS]
+    return parts
+
+def get_data_version(signatures=None):
+    """
+    Short hash of the farm CSV and model file signatures.
+    Anything derived only from those files can be cached under this key.
+    """
+    if signatures is None:
+        signatures = _data_file_signatures()
+    return hashlib.sha1(repr(signatures).encode()).hexdigest()[:16]
 
 # --- New API Endpoint: Price Prediction (Updated for Box-Cox) ---
 @app.route('/api/prediction/price/<crop_name>', methods=['GET'])
+@http_cached()
 def predict_price(crop_name):
     """
     Predicts the crop price for the next 6 months using a loaded SARIMA model.
     Query parameters: ?months=N (default is 6)
-    Applies inverse Box-Cox transformation if the model was trained with Box-Cox.
+    Served from the forecast service, which applies the inverse Box-Cox transformation.
     """
     crop_name = crop_name.lower()
     
-    # 1. Input Validation and Model Check
-    if crop_name not in trained_models:
-        return jsonify({"error": f"Model for crop '{crop_name}' not found. Available: {list(trained_models.keys())}"}), 404
-    
-    fitted_model = trained_models[crop_name]
-    
-    if fitted_model is None:
-        return jsonify({"error": f"Model for crop '{crop_name}' could not be loaded."}), 500
+    # 1. Input Validation (the model itself is loaded on demand by the forecast service)
+    if crop_name not in CROPS:
+        return jsonify({"error": f"Model for crop '{crop_name}' not found. Available: {CROPS}"}), 404
 
     try:
         # Get forecast length from query string (default to 6 months)
         forecast_months = int(request.args.get('months', 6))
         
-        # Perform the Forecast
-        forecast_results = fitted_model.predict(
-            n_periods=forecast_months, 
-            return_conf_int=True, 
-            alpha=0.05
-        )
-        
-        forecast_values = forecast_results[0]
-        conf_int = forecast_results[1]
-        
-        # Apply inverse Box-Cox transformation if lambda is available
-        lam = model_lambdas.get(crop_name)
-        if lam is not None:
-            from scipy.special import inv_boxcox
-            forecast_values = inv_boxcox(forecast_values, lam)
-            conf_int[:, 0] = inv_boxcox(conf_int[:, 0], lam)
-            conf_int[:, 1] = inv_boxcox(conf_int[:, 1], lam)
-        
-        # Generate the Date Index
-        last_date = fitted_model.arima_res_.data.dates[-1] 
-        forecast_index = pd.date_range(start=last_date, periods=forecast_months + 1, freq='MS')[1:]
+        forecast = get_price_forecast(crop_name, forecast_months)
+        if forecast is None:
+            return jsonify({"error": f"Model for crop '{crop_name}' could not be loaded."}), 500
+        forecast_index = forecast['dates']
+        forecast_values = forecast['prices']
+        conf_int = np.column_stack((forecast['lower_ci'], forecast['upper_ci']))
 
         # Format the Output for JSON (Display calculated prices)
         forecast_data = [
@@ -2279,6 +4533,7 @@ def predict_price(crop_name):
 
 # --- HTML Endpoint: Display all price predictions with graphs ---
 @app.route('/api/prediction/price', methods=['GET'])
+@http_cached()
 def predict_price_all():
     """
     Displays price predictions for all trained crops in an HTML page with interactive graphs.
@@ -2287,326 +4542,30 @@ def predict_price_all():
     try:
         forecast_months = int(request.args.get('months', 6))
         
-        # Collect forecast data for all crops with trained models
-        all_forecasts = {}
-        for crop in trained_models.keys():
-            if trained_models[crop] is None:
+        crop_forecast = get_template_attribute('price_predictions.html', 'crop_forecast')
+        
+        def render(crop, forecast):
+            return crop_forecast(crop.capitalize(), {
+                "dates": [date.strftime('%Y-%m-%d') for date in forecast['dates']],
+                "prices": [float(round(price, 2)) for price in forecast['prices']],
+                "lower_ci": [float(round(value, 2)) for value in forecast['lower_ci']],
+                "upper_ci": [float(round(value, 2)) for value in forecast['upper_ci']],
+            })
+        
+        # One section per crop with a trained model, cached on (crop, horizon, model file signature)
+        sections = []
+        for crop, forecast in get_price_forecasts(forecast_months).items():
+            if forecast is None:
+                if trained_models.get(crop) is not None:
+                    sections.append(crop_forecast(crop.capitalize(), None))
                 continue
-            
-            try:
-                model = trained_models[crop]
-                
-                # Perform the Forecast
-                forecast_results = model.predict(
-                    n_periods=forecast_months, 
-                    return_conf_int=True, 
-                    alpha=0.05
-                )
-                
-                forecast_values = forecast_results[0]
-                conf_int = forecast_results[1]
-                
-                # Apply inverse Box-Cox transformation if lambda is available
-                lam = model_lambdas.get(crop)
-                if lam is not None:
-                    from scipy.special import inv_boxcox
-                    forecast_values = inv_boxcox(forecast_values, lam)
-                    conf_int[:, 0] = inv_boxcox(conf_int[:, 0], lam)
-                    conf_int[:, 1] = inv_boxcox(conf_int[:, 1], lam)
-                
-                # Generate the Date Index
-                last_date = model.arima_res_.data.dates[-1] 
-                forecast_index = pd.date_range(start=last_date, periods=forecast_months + 1, freq='MS')[1:]
-                
-                # Format the Output
-                forecast_data = {
-                    "dates": [date.strftime('%Y-%m-%d') for date in forecast_index],
-                    "prices": [float(round(price, 2)) for price in forecast_values],
-                    "lower_ci": [float(round(conf_int[i, 0], 2)) for i in range(len(forecast_values))],
-                    "upper_ci": [float(round(conf_int[i, 1], 2)) for i in range(len(forecast_values))],
-                }
-                
-                all_forecasts[crop.capitalize()] = forecast_data
-                
-            except Exception as e:
-                print(f"Error generating forecast for {crop}: {e}")
-                all_forecasts[crop.capitalize()] = None
+            key = ('forecast', crop, forecast_months, _farm_file_signature(_model_file(crop)))
+            sections.append(render_fragment(key, lambda: render(crop, forecast)))
         
-        if not all_forecasts:
+        if not sections:
             return "<h1>No trained models available</h1>", 404
         
-        # Generate HTML with Chart.js graphs
-        html_content = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Price Predictions - All Crops</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js@3.9.1/dist/chart.min.js"></script>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { 
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-            min-height: 100vh; 
-            padding: 30px 20px; 
-        }
-        .container { 
-            max-width: 1200px; 
-            margin: 0 auto; 
-        }
-        .header { 
-            text-align: center; 
-            color: white; 
-            margin-bottom: 40px; 
-        }
-        .header h1 { 
-            font-size: 36px; 
-            margin-bottom: 10px; 
-        }
-        .header p { 
-            font-size: 16px; 
-            opacity: 0.9; 
-        }
-        .crop-section { 
-            background: white; 
-            border-radius: 12px; 
-            padding: 30px; 
-            margin-bottom: 30px; 
-            box-shadow: 0 8px 32px rgba(0,0,0,0.2); 
-        }
-        .crop-title { 
-            font-size: 24px; 
-            font-weight: bold; 
-            color: #1a5f7a; 
-            margin-bottom: 20px; 
-            padding-bottom: 10px; 
-            border-bottom: 3px solid #667eea; 
-        }
-        .chart-wrapper { 
-            position: relative; 
-            height: 400px; 
-            margin-bottom: 20px; 
-        }
-        .forecast-table { 
-            width: 100%; 
-            border-collapse: collapse; 
-            margin-top: 20px; 
-            font-size: 14px; 
-        }
-        .forecast-table thead { 
-            background-color: #1a5f7a; 
-            color: white; 
-        }
-        .forecast-table th { 
-            padding: 12px; 
-            text-align: left; 
-            font-weight: 600; 
-        }
-        .forecast-table td { 
-            padding: 10px 12px; 
-            border-bottom: 1px solid #ddd; 
-        }
-        .forecast-table tbody tr:hover { 
-            background-color: #f5f5f5; 
-        }
-        .forecast-table tbody tr:nth-child(even) { 
-            background-color: #f9f9f9; 
-        }
-        .back-btn { 
-            display: inline-block; 
-            background: white; 
-            color: #667eea; 
-            padding: 12px 24px; 
-            border: none; 
-            border-radius: 12px; 
-            cursor: pointer; 
-            font-size: 14px; 
-            font-weight: 600; 
-            text-decoration: none; 
-            transition: all 0.3s; 
-            margin-top: 10px; 
-        }
-        .back-btn:hover { 
-            background: #f0f0f0; 
-            transform: translateY(-2px); 
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15); 
-        }
-        .no-data { 
-            color: #e74c3c; 
-            text-align: center; 
-            padding: 20px; 
-            background-color: #fadbd8; 
-            border-radius: 8px; 
-            margin-bottom: 20px; 
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📊 Price Predictions</h1>
-            <p>6-Month Forecast with 95% Confidence Intervals (₹/quintal)</p>
-            <a href="/" class="back-btn">← Back to Dashboard</a>
-        </div>
-"""
-        
-        # Add each crop's forecast section
-        for crop_name, forecast_data in all_forecasts.items():
-            if forecast_data is None:
-                html_content += f"""
-        <div class="crop-section">
-            <div class="crop-title">{crop_name}</div>
-            <div class="no-data">Unable to generate forecast for {crop_name}</div>
-        </div>
-"""
-                continue
-            
-            chart_id = f"chart_{crop_name.lower().replace(' ', '_')}"
-            dates = forecast_data['dates']
-            prices = forecast_data['prices']
-            lower_ci = forecast_data['lower_ci']
-            upper_ci = forecast_data['upper_ci']
-            
-            # Use raw calculated values directly
-            
-            html_content += f"""
-        <div class="crop-section">
-            <div class="crop-title">{crop_name}</div>
-            <div class="chart-wrapper">
-                <canvas id="{chart_id}"></canvas>
-            </div>
-            <table class="forecast-table">
-                <thead>
-                    <tr>
-                        <th>Date</th>
-                        <th>Predicted Price (₹/quintal)</th>
-                        <th>Lower CI (₹/quintal)</th>
-                        <th>Upper CI (₹/quintal)</th>
-                    </tr>
-                </thead>
-                <tbody>
-"""
-            
-            for i, date in enumerate(dates):
-                html_content += f"""
-                    <tr>
-                        <td>{date}</td>
-                        <td>{prices[i]:,.2f}</td>
-                        <td>{lower_ci[i]:,.2f}</td>
-                        <td>{upper_ci[i]:,.2f}</td>
-                    </tr>
-"""
-            
-            html_content += """
-                </tbody>
-            </table>
-        </div>
-"""
-            
-            # Add Chart.js script for this crop
-            html_content += f"""
-    <script>
-        const ctx_{chart_id} = document.getElementById('{chart_id}').getContext('2d');
-        new Chart(ctx_{chart_id}, {{
-            type: 'line',
-            data: {{
-                labels: {dates},
-                datasets: [
-                    {{
-                        label: 'Predicted Price',
-                        data: {prices},
-                        borderColor: '#667eea',
-                        backgroundColor: 'rgba(102, 126, 234, 0.1)',
-                        borderWidth: 3,
-                        fill: false,
-                        tension: 0.4,
-                        pointRadius: 6,
-                        pointBackgroundColor: '#667eea',
-                        pointBorderColor: '#fff',
-                        pointBorderWidth: 2,
-                        pointHoverRadius: 8
-                    }},
-                    {{
-                        label: 'Upper Confidence Interval (95%)',
-                        data: {upper_ci},
-                        borderColor: '#e74c3c',
-                        borderWidth: 1,
-                        borderDash: [5, 5],
-                        fill: false,
-                        tension: 0.4,
-                        pointRadius: 0,
-                        pointHoverRadius: 0
-                    }},
-                    {{
-                        label: 'Lower Confidence Interval (95%)',
-                        data: {lower_ci},
-                        borderColor: '#e74c3c',
-                        borderWidth: 1,
-                        borderDash: [5, 5],
-                        fill: false,
-                        tension: 0.4,
-                        pointRadius: 0,
-                        pointHoverRadius: 0
-                    }}
-                ]
-            }},
-            options: {{
-                responsive: true,
-                maintainAspectRatio: false,
-                plugins: {{
-                    legend: {{
-                        display: true,
-                        position: 'top',
-                        labels: {{
-                            font: {{ size: 12, weight: 'bold' }},
-                            padding: 15,
-                            usePointStyle: true
-                        }}
-                    }},
-                    title: {{
-                        display: false
-                    }}
-                }},
-                scales: {{
-                    y: {{
-                        beginAtZero: false,
-                        ticks: {{
-                            callback: function(value) {{
-                                return '₹' + value.toLocaleString('en-IN');
-                            }},
-                            font: {{ size: 11 }}
-                        }},
-                        title: {{
-                            display: true,
-                            text: 'Price (₹/quintal)',
-                            font: {{ size: 12, weight: 'bold' }}
-                        }}
-                    }},
-                    x: {{
-                        ticks: {{
-                            font: {{ size: 11 }}
-                        }},
-                        title: {{
-                            display: true,
-                            text: 'Date',
-                            font: {{ size: 12, weight: 'bold' }}
-                        }}
-                    }}
-                }}
-            }}
-        }});
-    </script>
-"""
-        
-        html_content += """
-    </div>
-</body>
-</html>
-"""
-        
-        return html_content
+        return render_template('price_predictions.html', forecast_months=forecast_months, sections=sections)
     
     except Exception as e:
         app.logger.error(f"Error in predict_price_all: {e}")
@@ -2621,22 +4580,11 @@ def get_average_crop_price(crop_name, months=6):
     Get average predicted price for a crop over next 6 months.
     """
     try:
-        if crop_name.lower() not in trained_models:
-            return None
-        
-        model = trained_models[crop_name.lower()]
-        if model is None:
+        forecast = get_price_forecast(crop_name, months)
+        if forecast is None:
             return None
         
-        forecast_results = model.predict(n_periods=months, return_conf_int=True, alpha=0.05)
-        forecast_values = forecast_results[0]
-        
-        # Apply inverse Box-Cox transformation if needed
-        lam = model_lambdas.get(crop_name.lower())
-        if lam is not None:
-            forecast_values = inv_boxcox(forecast_values, lam)
-        
-        return float(np.mean(forecast_values))
+        return float(np.mean(forecast['prices']))
     except Exception as e:
         print(f"Error predicting price for {crop_name}: {e}")
         return None
@@ -2647,65 +4595,89 @@ def get_farm_crop_history(farm_name):
     Get historical data for each crop grown on a farm.
     Returns: dict with crop names as keys and their performance metrics as values.
     """
-    data = load_farm_data(farm_name)
-    if data.empty:
+    cube = get_farm_cube(farm_name)
+    if cube is None:
         return {}
     
     farm_crop_metrics = {}
     
     for crop in CROPS:
-        crop_data = data[data['CropType'].str.lower() == crop.lower()]
+        crop_metrics = cube['crops'].get(crop.lower())
         
-        if not crop_data.empty:
+        if crop_metrics is not None:
             farm_crop_metrics[crop] = {
-                'avg_yield': float(crop_data['Yield_tonnes_per_ha'].mean()),
-                'avg_spoilage': float(crop_data['SpoilageRate_%'].mean()),
-                'avg_defects': float(crop_data['DefectRate_%'].mean()),
-                'avg_shelf_life': float(crop_data['PredictedShelfLife_days'].mean()),
-                'avg_pest_risk': float(crop_data['PestRiskScore'].mean()),
-                'records_count': len(crop_data),
-                'last_grown': crop_data['HarvestDate'].max() if 'HarvestDate' in crop_data.columns else None
+                'avg_yield': crop_metrics['yield'],
+                'avg_spoilage': crop_metrics['spoilage'],
+                'avg_defects': crop_metrics['defects'],
+                'avg_shelf_life': crop_metrics['shelf_life'],
+                'avg_pest_risk': crop_metrics['pest_risk'],
+                'records_count': crop_metrics['records'],
+                'last_grown': crop_metrics['last_harvest']
             }
     
     return farm_crop_metrics
 
 
-def calculate_crop_profitability_score(farm_name, crop_name):
+# --- Crop Allocation Engine ---
+# Fallback prices (₹/quintal) when a crop has no usable forecast
+DEFAULT_CROP_PRICES = {
+    'wheat': 2200,
+    'corn': 1800,
+    'lettuce': 1200,
+    'tomato': 1500
+}
+DEFAULT_CROP_PRICE = 1500
+
+# Industry averages used for crops a farm has never grown
+CROP_INDUSTRY_AVERAGES = {
+    'yield': 6.0,
+    'spoilage': 10.0,
+    'defects': 5.0,
+    'shelf_life': 14.0,
+    'pest_risk': 30.0
+}
+
+def get_crop_price(crop_name):
+    """Predicted 6-month average price for a crop, falling back to the default price"""
+    price = get_average_crop_price(crop_name)
+    if price is None or price == 0:
+        price = DEFAULT_CROP_PRICES.get(crop_name.lower(), DEFAULT_CROP_PRICE)
+    return price
+
+
+def build_allocation_features(farms, crops, cubes=None):
     """
-    Calculate a profitability score for a crop on a specific farm.
-    Considers: predicted price, historical yield, spoilage, defects, and shelf life.
-    Higher score = more profitable.
+    Build farm x crop feature matrices from the aggregate cubes in one pass.
+    Returns ({feature: array of shape (len(farms), len(crops))}, experienced) where
+    `experienced` marks the pairs the farm has history for; the other pairs hold
+    industry averages.
     """
-    # Get predicted price
-    avg_price = get_average_crop_price(crop_name)
-    if avg_price is None or avg_price == 0:
-        # Use default price based on crop type if prediction fails
-        default_prices = {
-            'wheat': 2200,
-            'corn': 1800,
-            'lettuce': 1200,
-            'tomato': 1500
-        }
-        avg_price = default_prices.get(crop_name.lower(), 1500)
-    
-    # Get farm's historical performance with this crop
-    farm_metrics = get_farm_crop_history(farm_name)
-    crop_metrics = farm_metrics.get(crop_name.lower(), {})
-    
-    # If farm hasn't grown this crop before, use industry averages
-    if not crop_metrics:
-        yield_score = 6.0  # Industry average
-        spoilage_score = 10.0  # Industry average
-        defect_score = 5.0  # Industry average
-        shelf_life_score = 14.0  # Industry average
-        pest_risk_score = 30.0  # Industry average
-    else:
-        yield_score = crop_metrics.get('avg_yield', 6.0)
-        spoilage_score = crop_metrics.get('avg_spoilage', 10.0)
-        defect_score = crop_metrics.get('avg_defects', 5.0)
-        shelf_life_score = crop_metrics.get('avg_shelf_life', 14.0)
-        pest_risk_score = crop_metrics.get('avg_pest_risk', 30.0)
+    shape = (len(farms), len(crops))
+    features = {name: np.full(shape, default) for name, default in CROP_INDUSTRY_AVERAGES.items()}
+    experienced = np.zeros(shape, dtype=bool)
+    crop_index = {crop.lower(): j for j, crop in enumerate(crops)}
+    
+    for i, farm in enumerate(farms):
+        cube = cubes.get(farm) if cubes is not None else get_farm_cube(farm)
+        if cube is None:
+            continue
+        for crop, crop_metrics in cube['crops'].items():
+            j = crop_index.get(crop)
+            if j is None:
+                continue
+            experienced[i, j] = True
+            for name, matrix in features.items():
+                matrix[i, j] = crop_metrics[name]
     
+    return features, experienced
+
+
+def score_allocation_matrix(prices, features):
+    """
+    Profitability score for every farm-crop pair.
+    Considers: predicted price, historical yield, spoilage, defects, shelf life and pest risk.
+    `prices` has one entry per crop; higher score = more profitable.
+    """
     # Profitability calculation:
     # - Higher price = better
     # - Higher yield = better
@@ -2714,15 +4686,15 @@ def calculate_crop_profitability_score(farm_name, crop_name):
     # - Longer shelf life = better
     # - Lower pest risk = better
     
-    price_factor = (avg_price / 1000) * 30  # Price impact (normalized to ~1000 range)
-    yield_factor = yield_score * 2  # Yield impact
-    spoilage_factor = (20 - spoilage_score) * 1.5  # Negative impact
-    defect_factor = (10 - defect_score) * 2  # Negative impact
-    shelf_life_factor = shelf_life_score * 0.8  # Storage efficiency
-    pest_risk_factor = (50 - pest_risk_score) * 0.5  # Health risk mitigation
+    price_factor = (np.asarray(prices, dtype=float) / 1000) * 30  # Price impact (normalized to ~1000 range)
+    yield_factor = features['yield'] * 2  # Yield impact
+    spoilage_factor = (20 - features['spoilage']) * 1.5  # Negative impact
+    defect_factor = (10 - features['defects']) * 2  # Negative impact
+    shelf_life_factor = features['shelf_life'] * 0.8  # Storage efficiency
+    pest_risk_factor = (50 - features['pest_risk']) * 0.5  # Health risk mitigation
     
     total_score = (
-        price_factor +
+        price_factor[np.newaxis, :] +
         yield_factor +
         spoilage_factor +
         defect_factor +
@@ -2730,13 +4702,46 @@ def calculate_crop_profitability_score(farm_name, crop_name):
         pest_risk_factor
     )
     
-    return max(0, total_score)  # Ensure non-negative
+    return np.fmax(total_score, 0)  # Ensure non-negative (missing metrics score 0)
+
+
+def solve_crop_allocation(scores, max_farms_per_crop=None):
+    """
+    Assign crops to farms so the total score is maximal (Hungarian method).
+    Each crop goes to at most `max_farms_per_crop` farms; by default farms are
+    spread evenly, i.e. one farm per crop when there are no more farms than crops.
+    Returns the crop column for each farm, or -1 if the farm gets no crop.
+    """
+    from scipy.optimize import linear_sum_assignment
+    
+    n_farms, n_crops = scores.shape
+    assignment = np.full(n_farms, -1)
+    if n_farms == 0 or n_crops == 0:
+        return assignment
+    if max_farms_per_crop is None:
+        max_farms_per_crop = -(-n_farms // n_crops)
+    
+    # One column per (crop, slot) so a crop can take several farms
+    slots = np.repeat(scores, max_farms_per_crop, axis=1)
+    rows, cols = linear_sum_assignment(slots, maximize=True)
+    assignment[rows] = cols // max_farms_per_crop
+    return assignment
+
+
+def calculate_crop_profitability_score(farm_name, crop_name):
+    """
+    Calculate a profitability score for a crop on a specific farm.
+    Higher score = more profitable.
+    """
+    features, _ = build_allocation_features([farm_name], [crop_name])
+    return float(score_allocation_matrix([get_crop_price(crop_name)], features)[0, 0])
 
 
 def optimize_crop_allocation():
     """
     Optimize crop allocation across all farms to prevent overlap.
-    Uses a greedy algorithm to allocate crops to farms that score highest for each crop.
+    Scores every farm-crop pair at once and solves the assignment optimally,
+    maximizing total profitability across farms.
     
     Returns: dict with farm names as keys and recommended crop as value.
     """
@@ -2744,50 +4749,21 @@ def optimize_crop_allocation():
         farms = list(FARM_FILES.keys())
         crops = CROPS
         
-        # Calculate profitability scores for each farm-crop combination
-        allocation_matrix = {}
-        for farm in farms:
-            allocation_matrix[farm] = {}
-            for crop in crops:
-                try:
-                    score = calculate_crop_profitability_score(farm, crop)
-                    allocation_matrix[farm][crop] = score
-                except Exception as e:
-                    print(f"Error calculating score for {farm}-{crop}: {e}")
-                    allocation_matrix[farm][crop] = 0
+        prices = [get_crop_price(crop) for crop in crops]
+        features, _ = build_allocation_features(farms, crops)
+        scores = score_allocation_matrix(prices, features)
+        assignment = solve_crop_allocation(scores)
         
-        # Greedy allocation: assign each crop to the farm that benefits most
         allocations = {}
-        remaining_crops = set(crops)
-        allocated_farms = set()
-        
-        # Create a ranking of all farm-crop combinations
-        rankings = []
-        for farm in farms:
-            for crop in crops:
-                rankings.append({
-                    'farm': farm,
-                    'crop': crop,
-                    'score': allocation_matrix[farm][crop]
-                })
-        
-        # Sort by score (descending)
-        rankings.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Allocate greedily
-        for ranking in rankings:
-            farm = ranking['farm']
-            crop = ranking['crop']
-            
-            # Allocate if both farm and crop are still available
-            if farm not in allocated_farms and crop in remaining_crops:
-                allocations[farm] = {
-                    'crop': crop,
-                    'score': ranking['score'],
-                    'crop_scores': allocation_matrix[farm]
-                }
-                allocated_farms.add(farm)
-                remaining_crops.remove(crop)
+        for i, farm in enumerate(farms):
+            j = assignment[i]
+            if j < 0:
+                continue
+            allocations[farm] = {
+                'crop': crops[j],
+                'score': float(scores[i, j]),
+                'crop_scores': dict(zip(crops, scores[i].tolist()))
+            }
         
         return allocations
     except Exception as e:
@@ -2797,7 +4773,127 @@ def optimize_crop_allocation():
         return {}
 
 
+# --- Allocation Result Cache ---
+# The allocation depends only on the farm CSVs and the price models, so it is
+# solved once per data version and every recommendation response (per-farm and
+# all-farm) is a lookup into the stored result.
+_allocation_cache = {'version': None, 'result': None}
+_allocation_lock = threading.Lock()
+
+def _build_farm_recommendation(farm_name, optimal_allocation, crop_prices):
+    """Per-farm recommendation payload for one allocation"""
+    farm_recommendation = optimal_allocation[farm_name]
+    recommended_crop = farm_recommendation['crop']
+    
+    # Get detailed metrics for the recommended crop
+    avg_price = crop_prices[recommended_crop]
+    
+    farm_metrics = get_farm_crop_history(farm_name)
+    crop_metrics = farm_metrics.get(recommended_crop.lower(), {})
+    
+    # Calculate profit potential (based on yield, price, and efficiency)
+    if crop_metrics:
+        expected_yield = crop_metrics.get('avg_yield', 6.0)
+        estimated_profit_per_ha = (expected_yield * avg_price) if avg_price else 0
+        profit_confidence = 'High'
+        experience_level = 'Experienced'
+    else:
+        expected_yield = 6.0  # Industry average
+        estimated_profit_per_ha = (expected_yield * avg_price) if avg_price else 0
+        profit_confidence = 'Medium'
+        experience_level = 'New'
+    
+    # Get other farms' recommendations for context
+    other_recommendations = {}
+    for other_farm in FARM_FILES.keys():
+        if other_farm != farm_name and other_farm in optimal_allocation:
+            other_recommendations[other_farm] = optimal_allocation[other_farm]['crop']
+    
+    # Reasoning for recommendation
+    reasoning = []
+    if crop_metrics:
+        reasoning.append(f"Your farm has strong track record with {recommended_crop.title()} (avg yield: {crop_metrics.get('avg_yield', 0):.1f}t/ha)")
+    else:
+        reasoning.append(f"{recommended_crop.title()} shows excellent market potential")
+    
+    reasoning.append(f"Predicted average price: ₹{avg_price:.2f}/quintal")
+    reasoning.append(f"Profitability score: {farm_recommendation['score']:.1f} (out of 100)")
+    
+    if other_recommendations:
+        other_crops = [v for k, v in other_recommendations.items() if v != recommended_crop]
+        if other_crops:
+            reasoning.append(f"Unique choice - prevents market overlap with other farms growing {', '.join(other_crops)}")
+    
+    return {
+        'farm': farm_name,
+        'recommended_crop': recommended_crop.title(),
+        'recommendation_score': round(farm_recommendation['score'], 2),
+        'predicted_price': round(avg_price, 2) if avg_price else 0,
+        'expected_yield_tonnes_per_ha': round(expected_yield, 2),
+        'estimated_profit_per_ha': round(estimated_profit_per_ha, 2),
+        'profit_confidence': profit_confidence,
+        'experience_level': experience_level,
+        'crop_comparison': {
+            'prices': {crop: round(price, 2) for crop, price in crop_prices.items()},
+            'profitability_scores': {crop: round(score, 2) for crop, score in farm_recommendation['crop_scores'].items()}
+        },
+        'reasoning': reasoning,
+        'other_farm_recommendations': other_recommendations,
+        'optimization_note': 'Allocation optimized across all farms to prevent market saturation'
+    }
+
+def _build_crop_allocation(version):
+    optimal_allocation = optimize_crop_allocation()
+    crop_prices = {crop: get_crop_price(crop) for crop in CROPS}
+    
+    farms = {}
+    summary = {}
+    for farm_name in FARM_FILES.keys():
+        if farm_name not in optimal_allocation:
+            continue
+        farm_rec = optimal_allocation[farm_name]
+        farms[farm_name] = _build_farm_recommendation(farm_name, optimal_allocation, crop_prices)
+        summary[farm_name] = {
+            'recommended_crop': farm_rec['crop'].title(),
+            'profitability_score': round(farm_rec['score'], 2),
+            'predicted_price': round(crop_prices[farm_rec['crop']], 2)
+        }
+    
+    return {
+        'version': version,
+        'allocation': optimal_allocation,
+        'crop_prices': crop_prices,
+        'farms': farms,
+        'recommendations': summary
+    }
+
+def get_crop_allocation():
+    """
+    Current cross-farm allocation with every farm's recommendation payload.
+    Solved once per data version; failed (empty) allocations are not cached.
+    """
+    version = get_data_version()
+    cached = _allocation_cache['result']
+    if cached is not None and cached['version'] == version:
+        return cached
+    
+    with _allocation_lock:
+        cached = _allocation_cache['result']
+        if cached is not None and cached['version'] == version:
+            return cached
+        result = _build_crop_allocation(version)
+        if result['allocation']:
+            _allocation_cache['result'] = result
+        return result
+
+def clear_allocation_cache():
+    """Drop the stored allocation (it is also replaced when the data version changes)"""
+    with _allocation_lock:
+        _allocation_cache['result'] = None
+
+
 @app.route('/api/farm/<farm_name>/crop-recommendation', methods=['GET'])
+@http_cached()
 def get_crop_recommendation(farm_name):
     """
     Get personalized crop recommendation for a farm to maximize profit.
@@ -2809,103 +4905,19 @@ def get_crop_recommendation(farm_name):
             return jsonify({'error': f'Farm {farm_name} not found'}), 404
         
         # Validate farm data exists
-        farm_data = load_farm_data(farm_name)
-        if farm_data.empty:
+        if get_farm_cube(farm_name) is None:
             return jsonify({'error': f'No data available for {farm_name}'}), 404
         
         # Get optimal allocation for all farms
-        optimal_allocation = optimize_crop_allocation()
+        allocation = get_crop_allocation()
         
-        if not optimal_allocation:
+        if not allocation['allocation']:
             return jsonify({'error': 'Unable to calculate allocations for any farms'}), 500
         
-        if farm_name not in optimal_allocation:
+        if farm_name not in allocation['farms']:
             return jsonify({'error': f'Unable to calculate recommendation for {farm_name}'}), 500
         
-        farm_recommendation = optimal_allocation[farm_name]
-        recommended_crop = farm_recommendation['crop']
-        
-        # Get detailed metrics for the recommended crop
-        avg_price = get_average_crop_price(recommended_crop)
-        if avg_price is None:
-            default_prices = {
-                'wheat': 2200,
-                'corn': 1800,
-                'lettuce': 1200,
-                'tomato': 1500
-            }
-            avg_price = default_prices.get(recommended_crop.lower(), 1500)
-        
-        farm_metrics = get_farm_crop_history(farm_name)
-        crop_metrics = farm_metrics.get(recommended_crop.lower(), {})
-        
-        # Get all crop prices for comparison
-        crop_prices = {}
-        crop_scores = {}
-        for crop in CROPS:
-            price = get_average_crop_price(crop)
-            if price is None:
-                default_prices = {
-                    'wheat': 2200,
-                    'corn': 1800,
-                    'lettuce': 1200,
-                    'tomato': 1500
-                }
-                price = default_prices.get(crop.lower(), 1500)
-            score = calculate_crop_profitability_score(farm_name, crop)
-            crop_prices[crop] = round(price, 2)
-            crop_scores[crop] = round(score, 2)
-        
-        # Calculate profit potential (based on yield, price, and efficiency)
-        if crop_metrics:
-            expected_yield = crop_metrics.get('avg_yield', 6.0)
-            estimated_profit_per_ha = (expected_yield * avg_price) if avg_price else 0
-            profit_confidence = 'High'
-            experience_level = 'Experienced'
-        else:
-            expected_yield = 6.0  # Industry average
-            estimated_profit_per_ha = (expected_yield * avg_price) if avg_price else 0
-            profit_confidence = 'Medium'
-            experience_level = 'New'
-        
-        # Get other farms' recommendations for context
-        other_recommendations = {}
-        for other_farm in FARM_FILES.keys():
-            if other_farm != farm_name and other_farm in optimal_allocation:
-                other_recommendations[other_farm] = optimal_allocation[other_farm]['crop']
-        
-        # Reasoning for recommendation
-        reasoning = []
-        if crop_metrics:
-            reasoning.append(f"Your farm has strong track record with {recommended_crop.title()} (avg yield: {crop_metrics.get('avg_yield', 0):.1f}t/ha)")
-        else:
-            reasoning.append(f"{recommended_crop.title()} shows excellent market potential")
-        
-        reasoning.append(f"Predicted average price: ₹{avg_price:.2f}/quintal")
-        reasoning.append(f"Profitability score: {farm_recommendation['score']:.1f} (out of 100)")
-        
-        if other_recommendations:
-            other_crops = [v for k, v in other_recommendations.items() if v != recommended_crop]
-            if other_crops:
-                reasoning.append(f"Unique choice - prevents market overlap with other farms growing {', '.join(other_crops)}")
-        
-        return jsonify({
-            'farm': farm_name,
-            'recommended_crop': recommended_crop.title(),
-            'recommendation_score': round(farm_recommendation['score'], 2),
-            'predicted_price': round(avg_price, 2) if avg_price else 0,
-            'expected_yield_tonnes_per_ha': round(expected_yield, 2),
-            'estimated_profit_per_ha': round(estimated_profit_per_ha, 2),
-            'profit_confidence': profit_confidence,
-            'experience_level': experience_level,
-            'crop_comparison': {
-                'prices': crop_prices,
-                'profitability_scores': crop_scores
-            },
-            'reasoning': reasoning,
-            'other_farm_recommendations': other_recommendations,
-            'optimization_note': 'Allocation optimized across all farms to prevent market saturation'
-        })
+        return jsonify(allocation['farms'][farm_name])
     
     except Exception as e:
         app.logger.error(f"Error in crop recommendation for {farm_name}: {e}")
@@ -2915,38 +4927,19 @@ def get_crop_recommendation(farm_name):
 
 
 @app.route('/api/farm/crop-recommendations-all', methods=['GET'])
+@http_cached()
 def get_all_crop_recommendations():
     """
     Get crop recommendations for all farms with cross-farm optimization.
     """
     try:
-        optimal_allocation = optimize_crop_allocation()
+        allocation = get_crop_allocation()
         
-        if not optimal_allocation:
+        if not allocation['allocation']:
             return jsonify({'error': 'Unable to calculate allocations'}), 500
         
-        recommendations = {}
-        for farm_name in FARM_FILES.keys():
-            if farm_name in optimal_allocation:
-                farm_rec = optimal_allocation[farm_name]
-                price = get_average_crop_price(farm_rec['crop'])
-                if price is None:
-                    default_prices = {
-                        'wheat': 2200,
-                        'corn': 1800,
-                        'lettuce': 1200,
-                        'tomato': 1500
-                    }
-                    price = default_prices.get(farm_rec['crop'].lower(), 1500)
-                
-                recommendations[farm_name] = {
-                    'recommended_crop': farm_rec['crop'].title(),
-                    'profitability_score': round(farm_rec['score'], 2),
-                    'predicted_price': round(price, 2)
-                }
-        
         return jsonify({
-            'recommendations': recommendations,
+            'recommendations': allocation['recommendations'],
             'optimization_type': 'cross-farm-optimized',
             'note': 'Each farm is assigned a unique crop to maximize market advantage'
         })
@@ -2958,5 +4951,78 @@ def get_all_crop_recommendations():
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+# --- Warmup & Health Checks ---
+# The warmup runs the expensive first-request work up front, stage by stage,
+# so the worker only reports ready once requests are served from warm caches.
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') != '0'
+_warmup_state = {'status': 'pending', 'stages': {}, 'data_version': None, 'started_at': None, 'finished_at': None}
+_warmup_lock = threading.Lock()
+
+def _run_warmup_stage(name, func):
+    start = time.perf_counter()
+    try:
+        func()
+        stage = {'ok': True}
+    except Exception as e:
+        print(f"Warmup stage '{name}' failed: {e}")
+        stage = {'ok': False, 'error': str(e)}
+    stage['ms'] = round((time.perf_counter() - start) * 1000, 1)
+    _warmup_state['stages'][name] = stage
+    return stage['ok']
+
+def warmup():
+    """
+    Preload everything the first request would otherwise pay for:
+    farm data store -> aggregate cubes -> record indexes -> SARIMA models -> forecasts -> crop allocation,
+    then (without holding up readiness) the canned chatbot TTS clips.
+    Records per-stage timings in _warmup_state; returns True if every stage succeeded.
+    """
+    with _warmup_lock:
+        _warmup_state.update(status='warming', stages={}, started_at=datetime.now().isoformat(timespec='seconds'), finished_at=None)
+        # The data store builds each farm's aggregates as it loads, so the
+        # 'aggregates' stage mostly measures the cube lookups
+        stages = [
+            ('data_store', load_all_farms_data),
+            ('aggregates', load_all_farm_cubes),
+            ('record_index', load_all_record_indexes),
+            ('models', load_models),
+            ('forecasts', get_price_forecasts),
+            ('allocation', get_crop_allocation),
+        ]
+        ok = True
+        for name, func in stages:
+            ok = _run_warmup_stage(name, func) and ok
+        
+        _warmup_state['data_version'] = get_data_version()
+        _warmup_state['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        _warmup_state['status'] = 'ready' if ok else 'degraded'
+        total = sum(stage['ms'] for stage in _warmup_state['stages'].values())
+        print(f"Warmup {_warmup_state['status']} in {total:.0f} ms: " +
+              ", ".join(f"{name}={stage['ms']:.0f}ms" for name, stage in _warmup_state['stages'].items()))
+        
+        # Canned TTS clips need the TTS service, so they are prepared after the
+        # app is marked ready and a failure here doesn't affect readiness
+        _run_warmup_stage('tts', warm_tts_cache)
+        return ok
+
+def start_warmup():
+    """Run warmup() in a background thread so the worker can answer /healthz meanwhile"""
+    threading.Thread(target=warmup, name='warmup', daemon=True).start()
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once warmup has completed every stage, 503 before that (or if a stage failed)"""
+    state = dict(_warmup_state)
+    state['stages'] = dict(state['stages'])
+    return jsonify(state), 200 if state['status'] == 'ready' else 503
+
+if WARMUP_ON_START:
+    start_warmup()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5003) 
\ No newline at end of file
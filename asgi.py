@@ -0,0 +1,368 @@
+"""
+ASGI entry point: the dashboard with an asyncio path for the slow routes.
+
+/api/chatbot, /api/chatbot/stream and /api/tts spend seconds waiting on Gemini
+and Google's TTS service, while the dashboard routes are short CPU work. Under
+a plain WSGI server a handful of slow chatbot calls can hold every worker
+thread. Served from here, those three routes run on an asyncio event loop and
+every other request goes to the Flask app on its own thread pool, so waiting
+I/O never takes a dashboard thread:
+
+    uvicorn asgi:app --port 5003
+
+The Gemini client (requests) and gTTS are blocking libraries, so each outbound
+call runs on a dedicated I/O thread pool (ASYNC_IO_THREADS). A request that
+is queued for an LLM slot waits on the event loop and does not hold a thread.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import app as dashboard
+from app import (
+    LLMBusyError, SSE_HEADERS, TTSRequestError, MarkdownStreamConverter,
+    _chatbot_error_message, _chatbot_local_response, _finish_chatbot_response, _read_chatbot_request,
+    _read_tts_request, _sse_event, create_farmer_prompt, get_cached_speech, get_data_version, get_llm_client, get_speech,
+    split_tts_text, stream_speech, tts_cache_key, tts_response_headers, tts_stream_headers
+)
+
+# Threads for blocking outbound calls (Gemini, gTTS)
+ASYNC_IO_THREADS = int(os.environ.get('ASYNC_IO_THREADS', '64'))
+# Threads for Flask requests and other CPU work (data loads, rule-based answers)
+ASYNC_APP_THREADS = int(os.environ.get('ASYNC_APP_THREADS', '8'))
+# Chunks a streaming producer may run ahead of a slow client
+STREAM_BUFFER_CHUNKS = 16
+
+_io_executor = ThreadPoolExecutor(ASYNC_IO_THREADS, thread_name_prefix='async-io')
+_app_executor = ThreadPoolExecutor(ASYNC_APP_THREADS, thread_name_prefix='async-app')
+
+# Event-loop side of the LLM concurrency cap (sized from the shared client)
+_llm_slots = None
+
+def _llm_semaphore():
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(get_llm_client().max_concurrency)
+    return _llm_slots
+
+async def _acquire_llm_slot():
+    """Wait on the loop (not in a thread) for an LLM slot, up to the client's queue timeout"""
+    try:
+        await asyncio.wait_for(_llm_semaphore().acquire(), get_llm_client().queue_timeout)
+    except asyncio.TimeoutError:
+        raise LLMBusyError('Too many chatbot requests in flight', retryable=True) from None
+
+def _run_in(executor, func, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+async def _iterate_in_thread(executor, produce, *args):
+    """
+    Async iterator over the items of produce(*args), which is created, consumed
+    and closed on a single executor thread (Flask's stream_with_context and
+    similar generators must not hop threads). The producer runs at most
+    STREAM_BUFFER_CHUNKS items ahead, and is closed early if the consumer stops.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    credits = threading.Semaphore(STREAM_BUFFER_CHUNKS)
+    stopped = threading.Event()
+
+    def put(entry):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, entry)
+        except RuntimeError:
+            stopped.set()  # Event loop already closed
+
+    def pump():
+        iterable = None
+        outcome = None
+        try:
+            iterable = produce(*args)
+            for item in iterable:
+                while not credits.acquire(timeout=0.5):
+                    if stopped.is_set():
+                        return
+                if stopped.is_set():
+                    return
+                put(('item', item))
+        except BaseException as e:
+            outcome = e
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+            put(('end', outcome))
+
+    loop.run_in_executor(executor, pump)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == 'end':
+                if value is not None:
+                    raise value
+                return
+            credits.release()
+            yield value
+    finally:
+        stopped.set()
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+async def _send_response(send, status, headers, body):
+    headers = list(headers) + [('Content-Length', len(body))]
+    await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await _send_response(send, status, [('Content-Type', 'application/json')], body)
+
+async def _send_not_modified(send, headers):
+    headers = [(name, value) for name, value in headers.items() if name != 'Content-Type']
+    await send({'type': 'http.response.start', 'status': 304, 'headers': _encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': b''})
+
+def _request_header(scope, name):
+    name = name.lower().encode('latin-1')
+    values = [value.decode('latin-1') for header, value in scope.get('headers', []) if header == name]
+    return ', '.join(values) if values else None
+
+def _etag_matches(scope, etag):
+    """True if the request's If-None-Match names this (strong) ETag or is '*'"""
+    header = _request_header(scope, 'If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+def _parse_json(body):
+    return json.loads(body) if body else {}
+
+# ---------------------------------------------------------------------------
+# Async routes (same request/response contract as the Flask views in app.py)
+# ---------------------------------------------------------------------------
+
+async def chatbot(scope, body, send, disconnected):
+    try:
+        question, language = _read_chatbot_request(_parse_json(body))
+        data_version = get_data_version()
+
+        local_response = await _run_in(_app_executor, _chatbot_local_response, question, language, data_version)
+        if local_response is not None:
+            return await _send_json(send, {'response': local_response})
+
+        try:
+            system_prompt = await _run_in(_app_executor, create_farmer_prompt, question, language)
+            await _acquire_llm_slot()
+            try:
+                response_text = await _run_in(_io_executor, get_llm_client().generate, system_prompt)
+            finally:
+                _llm_semaphore().release()
+            response_html = _finish_chatbot_response(question, language, data_version, response_text)
+            await _send_json(send, {'response': response_html})
+        except Exception as e:
+            await _send_json(send, {'response': _chatbot_error_message(e)})
+
+    except Exception as e:
+        await _send_json(send, {'response': f'Well, I hit a snag there: {str(e)}. Mind trying again?'})
+
+async def chatbot_stream(scope, body, send, disconnected):
+    try:
+        question, language = _read_chatbot_request(_parse_json(body))
+    except Exception as e:
+        return await _send_json(send, {'response': f'Well, I hit a snag there: {str(e)}. Mind trying again?'})
+    data_version = get_data_version()
+
+    headers = [('Content-Type', 'text/event-stream; charset=utf-8')] + list(SSE_HEADERS.items())
+    await send({'type': 'http.response.start', 'status': 200, 'headers': _encode_headers(headers)})
+
+    async def emit(frame, more=True):
+        await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': more})
+
+    # Send a first frame right away so the client sees the response start
+    await emit(": stream open\n\n")
+    try:
+        local_response = await _run_in(_app_executor, _chatbot_local_response, question, language, data_version)
+        if local_response is not None:
+            return await emit(_sse_event('done', {'html': local_response}), more=False)
+
+        system_prompt = await _run_in(_app_executor, create_farmer_prompt, question, language)
+        converter = MarkdownStreamConverter()
+        await _acquire_llm_slot()
+        try:
+            chunks = _iterate_in_thread(_io_executor, get_llm_client().stream, system_prompt)
+            try:
+                async for text in chunks:
+                    if disconnected.is_set():
+                        return
+                    html, pending = converter.feed(text)
+                    await emit(_sse_event('delta', {'html': html, 'pending': pending}))
+            finally:
+                await chunks.aclose()
+        finally:
+            _llm_semaphore().release()
+        html = _finish_chatbot_response(question, language, data_version, converter.text)
+        await emit(_sse_event('done', {'html': html}), more=False)
+    except Exception as e:
+        await emit(_sse_event('done', {'html': _chatbot_error_message(e)}), more=False)
+
+async def text_to_speech(scope, body, send, disconnected):
+    try:
+        try:
+            clean_text, language = _read_tts_request(_parse_json(body))
+        except TTSRequestError as e:
+            return await _send_json(send, {'error': str(e)}, 400)
+
+        # A client replaying audio it already has needs no synthesis at all
+        key = tts_cache_key(clean_text, language)
+        if _etag_matches(scope, key):
+            return await _send_not_modified(send, tts_response_headers(key))
+
+        try:
+            audio_data = await _run_in(_io_executor, get_cached_speech, key)
+            streamed = audio_data is None and len(split_tts_text(clean_text)) > 1
+            if streamed:
+                # Long text: stream each chunk as soon as it is ready
+                parts = _iterate_in_thread(_io_executor, stream_speech, clean_text, language)
+                first_part = await parts.__anext__()
+            elif audio_data is None:
+                key, audio_data = await _run_in(_io_executor, get_speech, clean_text, language)
+        except Exception as e:
+            print(f"TTS error: {str(e)}")
+            traceback.print_exc()
+            return await _send_json(send, {'error': f'TTS generation failed: {str(e)}'}, 500)
+        if not streamed:
+            return await _send_response(send, 200, tts_response_headers(key).items(), audio_data)
+
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': _encode_headers(tts_stream_headers(key).items())})
+            await send({'type': 'http.response.body', 'body': first_part, 'more_body': True})
+            async for part in parts:
+                if disconnected.is_set():
+                    return
+                await send({'type': 'http.response.body', 'body': part, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await parts.aclose()
+
+    except Exception as e:
+        await _send_json(send, {'error': f'TTS error: {str(e)}'}, 500)
+
+ASYNC_ROUTES = {
+    ('POST', '/api/chatbot'): chatbot,
+    ('POST', '/api/chatbot/stream'): chatbot_stream,
+    ('POST', '/api/tts'): text_to_speech,
+}
+
+# ---------------------------------------------------------------------------
+# Everything else: the Flask app, run on _app_executor
+# ---------------------------------------------------------------------------
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+async def _call_flask(scope, body, send, disconnected):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return lambda data: None  # The write() callable is unused by Flask
+
+    started = False
+    chunks = _iterate_in_thread(_app_executor, dashboard.app, _wsgi_environ(scope, body), start_response)
+    try:
+        async for chunk in chunks:
+            if not started:
+                await send({'type': 'http.response.start', 'status': response['status'], 'headers': _encode_headers(response['headers'])})
+                started = True
+            if disconnected.is_set():
+                return
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        await chunks.aclose()
+    if not started:
+        await send({'type': 'http.response.start', 'status': response['status'], 'headers': _encode_headers(response['headers'])})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _io_executor.shutdown(wait=False, cancel_futures=True)
+            _app_executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return  # Client went away before sending the whole request
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+    try:
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            await handler(scope, body, send, disconnected)
+        else:
+            await _call_flask(scope, body, send, disconnected)
+    finally:
+        watcher.cancel()
@@ -0,0 +1,486 @@
+"""
+Performance checks for the Flask app.
+
+Usage:
+    python bench.py startup [--budget SECONDS]
+    python bench.py tts [--backend gtts|indic|all] [--requests N] [--concurrency N] [--language kn]
+    python bench.py questions [--rounds N]
+    python bench.py render [--rounds N]
+    python bench.py ingest
+
+`startup` imports app.py in a fresh interpreter (with MODEL_LOADING=lazy and
+WARMUP_ON_START=0 so the SARIMA models aren't loaded) and fails if the import
+takes longer than the budget or pulls in any of the heavy modules that are
+meant to be imported on first use.
+
+`questions` checks that the chatbot's single-pass keyword matcher
+(classify_question) agrees with one scan per keyword over every keyword table
+(`keyword in question` for the topic, whole words for the intents), on sample and randomly generated questions, and reports the
+per-question cost of both. It also checks that questions naming a farm are
+answered with that farm's summary, and that words merely containing a keyword
+("stop" for "top") don't send a question down the rule-based fast path.
+
+`render` times the template-rendered HTML pages (farm details, cross-farm
+comparison, price forecasts): each page with empty caches, then rendered from
+cached fragments (the stored response is dropped before each request), then
+served as the stored response. The farm data and forecasts are loaded
+beforehand so only rendering is measured.
+
+`ingest` checks append-aware farm ingest on a scratch copy of a farm CSV: after
+plain appends, and after an earlier row is edited in place (same length) while
+rows are appended, the farm's frame and metrics must equal a full parse - also
+when the change happens while the app is stopped, and after a restart from the
+binary sidecar.
+
+`tts` measures synthesis throughput and latency of each TTS backend directly
+(bypassing the audio cache): sentence-sized chunks of the chatbot's canned
+replies are synthesized with N requests in flight. gTTS needs network access,
+the indic backend needs the Indic-TTS models (see TTS_LOCAL_MODEL_DIR).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Import-time budget for `import app`, in seconds
+STARTUP_BUDGET_SECONDS = 2.0
+
+# Modules that must not be imported just by importing app.py
+LAZY_MODULES = [
+    'torch',
+    'transformers',
+    'soundfile',
+    'google.generativeai',
+    'scipy.special',
+    'scipy.optimize',
+    'pmdarima',
+    'joblib',
+    'gtts',
+]
+
+_STARTUP_PROBE = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def check_startup(budget=STARTUP_BUDGET_SECONDS, runs=3):
+    """Best-of-`runs` import time of app.py; returns True if within budget"""
+    env = dict(os.environ, MODEL_LOADING='lazy', WARMUP_ON_START='0', PYTHONWARNINGS='ignore')
+    probe = _STARTUP_PROBE % (LAZY_MODULES,)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', probe],
+            cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    best = min(result['seconds'] for result in results)
+    loaded = sorted(set(m for result in results for m in result['loaded']))
+    print(f"import app: {best:.2f}s (budget {budget:.2f}s, best of {runs})")
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(loaded)}")
+    if best > budget:
+        print("FAIL: import time over budget")
+    ok = best <= budget and not loaded
+    if ok:
+        print("OK")
+    return ok
+
+
+def _import_app():
+    """Import app.py in this process without starting the warmup or model loading"""
+    os.environ.setdefault('MODEL_LOADING', 'lazy')
+    os.environ.setdefault('WARMUP_ON_START', '0')
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    import app
+    return app
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_tts(backends, requests=24, concurrency=4, language='kn'):
+    """Throughput/latency of each TTS backend; returns True if every backend ran without errors"""
+    app = _import_app()
+    texts = []
+    for phrases in (app.CHATBOT_GREETINGS, app.CHATBOT_REFUSALS):
+        texts.extend(app.split_tts_text(app.clean_tts_text(phrases[language])))
+    texts = [texts[i % len(texts)] for i in range(requests)]
+
+    ok = True
+    for name in backends:
+        backend = app.TTS_BACKENDS[name]()
+        start = time.perf_counter()
+        try:
+            backend.warm()
+        except Exception as e:
+            print(f"{name}: unavailable ({e})")
+            ok = False
+            continue
+        load_seconds = time.perf_counter() - start
+
+        def timed(text):
+            begin = time.perf_counter()
+            audio = backend.synthesize(text, language)
+            return time.perf_counter() - begin, len(audio)
+
+        latencies, audio_bytes, errors = [], 0, []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            futures = [pool.submit(timed, text) for text in texts]
+            for future in futures:
+                try:
+                    seconds, size = future.result()
+                    latencies.append(seconds)
+                    audio_bytes += size
+                except Exception as e:
+                    errors.append(e)
+        wall = time.perf_counter() - start
+
+        if errors:
+            print(f"{name}: {len(errors)}/{len(texts)} requests failed (first: {errors[0]})")
+            ok = False
+        if latencies:
+            chars = sum(len(text) for text in texts)
+            print(f"{name}: load {load_seconds:.2f}s; {len(latencies)} requests x{concurrency} in {wall:.2f}s = "
+                  f"{len(latencies) / wall:.1f} req/s, {chars / wall:.0f} chars/s; latency p50 "
+                  f"{_percentile(latencies, 0.5) * 1000:.0f} ms, p95 {_percentile(latencies, 0.95) * 1000:.0f} ms; "
+                  f"{audio_bytes / 1024:.0f} KiB audio")
+    return ok
+
+
+BENCH_QUESTIONS = [
+    "Which farm is the best?",
+    "What is the worst performing farm?",
+    "Tell me about Farm A",
+    "How is farmc doing on spoilage?",
+    "Compare waste management between FarmA and FarmC",
+    "What are the performance scores?",
+    "Why is the spoilage so high and how can I reduce it?",
+    "Should I plant more wheat next season?",
+    "What is the tomato price forecast?",
+    "Which farm has the highest yield?",
+    "Is customer satisfaction improving?",
+    "Show me machinery uptime and downtime",
+    "How many delivery delays did we have?",
+    "What storage temperature and humidity do we use?",
+    "Any pest risk this month?",
+    "What is the defect rate at Farm D?",
+    "Can you recommend a good movie on Netflix?",
+    "What's the bitcoin price today?",
+    "Help me write some Python code",
+    "Who won the cricket match yesterday?",
+    "hello",
+    "Good morning!",
+    "What can you do?",
+    "Tell me something interesting",
+    "How do I make biogas from farm waste?",
+    "Explain segregation accuracy and upcycling rate",
+    "मेरे खेत की उपज कैसी है?",
+    "ನಮ್ಮ ಫಾರ್ಮ್ ಹೇಗಿದೆ?",
+]
+
+
+# Data-lookup questions and the farm whose summary answers them
+FARM_SUMMARY_QUESTIONS = [
+    ("Tell me about farm a", 'FarmA'),
+    ("How is FarmA doing?", 'FarmA'),
+    ("Show farm b summary", 'FarmB'),
+    ("farmb stats", 'FarmB'),
+    ("Tell me about farm c", 'FarmC'),
+    ("Summary of FarmC please", 'FarmC'),
+    ("how is farmd doing", 'FarmD'),
+    ("Give me the Farm D summary", 'FarmD'),
+]
+
+
+# Questions whose keywords only occur inside other words (or that name several
+# farms), which must not be answered without the LLM
+NOT_FAST_PATH_QUESTIONS = [
+    "is it time to stop spraying?",
+    "what's the bestseller at the market?",
+    "any tips for a pestle and mortar?",
+    "compare farm a and farm b",
+]
+
+
+def check_farm_summaries(app):
+    """Route each FARM_SUMMARY_QUESTIONS question through the rule-based answerer; returns the failures"""
+    cubes = app.load_all_farm_cubes()
+    failures = []
+    for question, farm_name in FARM_SUMMARY_QUESTIONS:
+        answer = app.answer_question(question, cubes)
+        if not answer.startswith(f"📊 {farm_name} Summary:"):
+            failures.append(f"{question!r} -> {answer.splitlines()[0]!r}, expected {farm_name}")
+    return failures
+
+
+def _whole_word(keyword, text):
+    """`keyword` occurs in text as a word, allowing a plural ending unless its last word is one letter"""
+    plural = r'(?:e?s)?' if len(keyword.split()[-1]) > 1 else ''
+    return re.search(r'(?<!\w)' + re.escape(keyword) + plural + r'(?!\w)', text) is not None
+
+
+def _reference_profile(app, question):
+    """classify_question's result computed with one scan per keyword"""
+    question_lower = question.lower()
+    intents = []
+    for intent, keywords in app.QUESTION_INTENTS:
+        for keyword in keywords:
+            if _whole_word(keyword, question_lower):
+                intents.append((intent, keyword))
+                break
+    farms = {farm for keyword, farm in app.FARM_SUMMARY_KEYWORDS.items() if _whole_word(keyword, question_lower)}
+    return app.QuestionProfile(
+        farming=any(keyword in question_lower for keyword in app.FARMING_KEYWORDS),
+        off_topic=any(keyword in question_lower for keyword in app.OFF_TOPIC_KEYWORDS),
+        open_ended=any(keyword in question_lower for keyword in app.OPEN_ENDED_MARKERS),
+        intents=tuple(intents),
+        farms=tuple(sorted(farms))
+    )
+
+
+def _random_questions(app, count, seed=0):
+    """Questions stitched from keywords, keyword fragments and filler, to exercise overlaps"""
+    rng = random.Random(seed)
+    keywords = sorted(set(app.FARMING_KEYWORDS) | set(app.OFF_TOPIC_KEYWORDS) | set(app.OPEN_ENDED_MARKERS) |
+                      {keyword for _, words in app.QUESTION_INTENTS for keyword in words})
+    filler = ['the', 'a', 'is', 'of', 'x', ' ', '?', 'Farm', 'FARM', 'ab', 'in']
+    questions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 8)):
+            word = rng.choice(keywords)
+            choice = rng.random()
+            if choice < 0.3:
+                word = word[:rng.randint(1, len(word))]  # Fragment
+            elif choice < 0.45:
+                word = word.upper()
+            parts.append(word if rng.random() < 0.7 else rng.choice(filler))
+        questions.append(rng.choice(['', ' ']).join(parts))
+    return questions
+
+
+def _per_question_us(func, questions, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            func(question)
+    return (time.perf_counter() - start) / (rounds * len(questions)) * 1e6
+
+
+def bench_questions(rounds=200):
+    """Check classify_question against plain substring scans and time both; returns True if they agree"""
+    app = _import_app()
+    classify = app.classify_question.__wrapped__  # Uncached
+    questions = BENCH_QUESTIONS + _random_questions(app, 5000)
+    mismatches = [q for q in questions if classify(q) != _reference_profile(app, q)]
+    for question in mismatches[:5]:
+        print(f"MISMATCH {question!r}: {classify(question)} != {_reference_profile(app, question)}")
+
+    matcher_us = _per_question_us(classify, BENCH_QUESTIONS, rounds)
+    reference_us = _per_question_us(lambda q: _reference_profile(app, q), BENCH_QUESTIONS, rounds)
+    app.classify_question.cache_clear()
+    cached_us = _per_question_us(app.classify_question, BENCH_QUESTIONS, rounds)
+    summary_failures = check_farm_summaries(app)
+    for failure in summary_failures:
+        print(f"WRONG FARM {failure}")
+    confident = [q for q in NOT_FAST_PATH_QUESTIONS if app.score_question_intent(q) >= app.CHATBOT_FAST_PATH_THRESHOLD]
+    for question in confident:
+        print(f"FAST PATH {question!r}: confidence {app.score_question_intent(question):.1f}")
+    print(f"checked {len(questions)} questions: {len(mismatches)} mismatches")
+    print(f"checked {len(FARM_SUMMARY_QUESTIONS)} farm summary questions: {len(summary_failures)} wrong farms")
+    print(f"checked {len(NOT_FAST_PATH_QUESTIONS)} non-lookup questions: {len(confident)} answered without the LLM")
+    print(f"single-pass matcher: {matcher_us:.1f} us/question")
+    print(f"per-keyword scans:   {reference_us:.1f} us/question")
+    print(f"matcher, cached:     {cached_us:.2f} us/question (repeat lookups within a chatbot request)")
+    return not mismatches and not summary_failures and not confident
+
+
+RENDER_PAGES = [
+    '/details/FarmA/production?page=1',
+    '/details/FarmC/transportation?page=2',
+    '/details/all/storage',
+    '/details/all/production',
+    '/api/prediction/price',
+    '/api/prediction/price?months=12',
+]
+
+
+def bench_render(rounds=50):
+    """
+    Render time of each HTML page cold (no cached fragments), from cached
+    fragments, and as a stored response (the @http_cached body cache); returns
+    True if all pages rendered
+    """
+    app = _import_app()
+    client = app.app.test_client()
+    ok = True
+    for path in RENDER_PAGES:
+        status = client.get(path).status_code  # Loads data, models and forecasts
+        if status != 200:
+            print(f"{path}: HTTP {status}")
+            ok = False
+            continue
+        cold = []
+        for _ in range(max(1, rounds // 10)):
+            app.clear_fragment_cache()
+            app.clear_body_cache()
+            start = time.perf_counter()
+            client.get(path)
+            cold.append(time.perf_counter() - start)
+        fragments = []
+        for _ in range(rounds):
+            app.clear_body_cache()  # Render the page, from cached fragments
+            start = time.perf_counter()
+            client.get(path)
+            fragments.append(time.perf_counter() - start)
+        stored = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            client.get(path)
+            stored.append(time.perf_counter() - start)
+        print(f"{path:40} cold {_percentile(cold, 0.5) * 1000:7.2f} ms   "
+              f"fragments {_percentile(fragments, 0.5) * 1000:6.2f} ms (p95 {_percentile(fragments, 0.95) * 1000:.2f} ms)   "
+              f"stored {_percentile(stored, 0.5) * 1000:6.2f} ms")
+    print(f"fragment cache: {app.fragment_cache_stats()}")
+    print(f"response cache: {app.body_cache_stats()}")
+    return ok
+
+
+def _frame_mismatch(app, farm_name, path):
+    """Differences between a farm's cached frame/metrics and a full parse of its CSV, as text (or None)"""
+    import numpy as np
+    import pandas as pd
+    entry = app._get_farm_entry(farm_name)
+    expected = app._read_farm_csv(path, path)
+    try:
+        # A deep copy, so columns memory-mapped from the sidecar compare as plain arrays
+        pd.testing.assert_frame_equal(entry['data'].copy(), expected, check_dtype=False, check_categorical=False)
+    except AssertionError as e:
+        return f"frame differs: {str(e).splitlines()[0]}"
+    metrics = app.build_farm_cube(app.build_farm_aggregates(expected))['metrics']
+    for name, value in metrics.items():
+        cached = entry['cube']['metrics'][name]
+        if not np.isclose(cached, value, rtol=1e-5, equal_nan=True):
+            return f"metric {name} is {cached}, a full parse gives {value}"
+    return None
+
+
+def _replace_field(line, header, column, value):
+    """CSV line with the `column` field replaced by `value`"""
+    fields = line.split(b',')
+    fields[header.split(b',').index(column)] = value
+    return b','.join(fields)
+
+
+def check_ingest():
+    """Append, and edit-then-append, a scratch farm CSV (while running or stopped) and compare with full parses.
+    
+    Returns True if every scenario matches.
+    """
+    app = _import_app()
+    source = os.path.join(PROJECT_DIR, 'farm_a_data.csv')
+    header, *lines = open(source, 'rb').read().rstrip(b'\n').split(b'\n')
+    scratch = tempfile.mkdtemp(prefix='ingest-check-')
+    path = os.path.join(scratch, 'farm.csv')
+    app.FARM_FILES['IngestCheck'] = path
+    
+    def write(rows, mode='wb'):
+        with open(path, mode) as f:
+            f.write(b'\n'.join(rows) + b'\n')
+    
+    # 40 rows grows the 125-row file past BINARY_CACHE_REFRESH_GROWTH, so the sidecar is rewritten
+    appended = [_replace_field(line, header, b'BatchID', f'IC{i:06d}'.encode()) for i, line in enumerate(lines[:40])]
+    yield_field = lines[0].split(b',')[header.split(b',').index(b'Yieldtonnesperha')]
+    edited = _replace_field(lines[0], header, b'Yieldtonnesperha', (b'1' if yield_field[:1] != b'1' else b'2') + yield_field[1:])
+    ok = True
+    try:
+        append = lambda: write(appended, 'ab')
+        # Same length and inode, so only the bytes tell the edit apart from a plain append
+        edit_and_append = lambda: write([header, edited] + lines[1:] + appended)
+        # (name, change, stopped while the file changes, restarted afterwards)
+        scenarios = [
+            ('append', append, False, False),
+            ('edit an earlier row and append', edit_and_append, False, False),
+            ('append, restart on the refreshed sidecar', append, False, True),
+            ('edit an earlier row and append while stopped', edit_and_append, True, False),
+            ('edit and append, restart on the sidecar', edit_and_append, False, True),
+        ]
+        for name, change, stopped, restart in scenarios:
+            write([header] + lines)
+            app.clear_farm_data_cache()
+            app._get_farm_entry('IngestCheck')  # Also writes the sidecar
+            if stopped:
+                app.clear_farm_data_cache()
+            change()
+            if restart:
+                app._get_farm_entry('IngestCheck')
+                app.clear_farm_data_cache()
+            problem = _frame_mismatch(app, 'IngestCheck', path)
+            print(f"{name:45} {'ok' if problem is None else 'FAIL: ' + problem}")
+            ok = ok and problem is None
+    finally:
+        del app.FARM_FILES['IngestCheck']
+        app.clear_farm_data_cache('IngestCheck')
+        shutil.rmtree(scratch, ignore_errors=True)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    startup = subparsers.add_parser('startup', help='check the app import-time budget')
+    startup.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS)
+    startup.add_argument('--runs', type=int, default=3)
+
+    tts = subparsers.add_parser('tts', help='compare TTS backend throughput and latency')
+    tts.add_argument('--backend', choices=['gtts', 'indic', 'all'], default='all')
+    tts.add_argument('--requests', type=int, default=24)
+    tts.add_argument('--concurrency', type=int, default=4)
+    tts.add_argument('--language', choices=['en', 'hi', 'kn'], default='kn')
+
+    questions = subparsers.add_parser('questions', help='check and time the chatbot keyword matcher')
+    questions.add_argument('--rounds', type=int, default=200)
+
+    render = subparsers.add_parser('render', help='time the HTML detail and forecast pages, cold, from fragments and stored')
+    render.add_argument('--rounds', type=int, default=50)
+
+    subparsers.add_parser('ingest', help='check append-aware farm ingest against full parses')
+    
+    args = parser.parse_args()
+    if args.command == 'startup':
+        ok = check_startup(args.budget, args.runs)
+    elif args.command == 'questions':
+        ok = bench_questions(args.rounds)
+    elif args.command == 'render':
+        ok = bench_render(args.rounds)
+    elif args.command == 'ingest':
+        ok = check_ingest()
+    elif args.command == 'tts':
+        backends = ['gtts', 'indic'] if args.backend == 'all' else [args.backend]
+        ok = bench_tts(backends, args.requests, args.concurrency, args.language)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
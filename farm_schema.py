@@ -0,0 +1,242 @@
+"""
+Shared schema for the farm CSV files.
+
+Both the Flask app and the SARIMA training script read the farm CSVs through
+`read_farm_csv`, so column names, dtypes and HarvestDate parsing are identical
+everywhere. The dtype plan keeps low-cardinality text columns as categoricals,
+stores measurements as float32 and parses HarvestDate with an explicit format
+(DDMMYYYY in the raw farm files, ISO in updated_farm_data/), instead of letting
+pandas infer every column.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+# Field name mapping from new CSV format to old internal field names
+FIELD_NAME_MAPPING = {
+    'Fertilizerkgperha': 'Fertilizer_kg_per_ha',
+    'SoilMoisture%': 'SoilMoisture_%',
+    'TemperatureC': 'Temperature_C',
+    'Rainfallmm': 'Rainfall_mm',
+    'Yieldtonnesperha': 'Yield_tonnes_per_ha',
+    'PestRiskScore': 'PestRiskScore',
+    'HarvestRobotUptime%': 'HarvestRobotUptime_%',
+    'StorageTemperatureC': 'StorageTemperature_C',
+    'Humidity%': 'Humidity_%',
+    'SpoilageRate%': 'SpoilageRate_%',
+    'GradingScore': 'GradingScore',
+    'PredictedShelfLifedays': 'PredictedShelfLife_days',
+    'StorageDays': 'StorageDays',
+    'ProcessType': 'ProcessType',
+    'PackagingType': 'PackagingType',
+    'PackagingSpeedunitspermin': 'PackagingSpeed_units_per_min',
+    'DefectRate%': 'DefectRate_%',
+    'MachineryUptime%': 'MachineryUptime_%',
+    'TransportMode': 'TransportMode',
+    'TransportDistancekm': 'TransportDistance_km',
+    'FuelUsageLper100km': 'FuelUsage_L_per_100km',
+    'DeliveryTimehr': 'DeliveryTime_hr',
+    'DeliveryDelayFlag': 'DeliveryDelayFlag',
+    'SpoilageInTransit%': 'SpoilageInTransit_%',
+    'RetailInventoryunits': 'RetailInventory_units',
+    'SalesVelocityunitsperday': 'SalesVelocity_units_per_day',
+    'DynamicPricingIndex': 'DynamicPricingIndex',
+    'WastePercentage%': 'WastePercentage_%',
+    'HouseholdWastekg': 'HouseholdWaste_kg',
+    'RecipeRecommendationAccuracy%': 'RecipeRecommendationAccuracy_%',
+    'SatisfactionScore010': 'SatisfactionScore_0_10',
+    'WasteType': 'WasteType',
+    'SegregationAccuracy%': 'SegregationAccuracy_%',
+    'UpcyclingRate%': 'UpcyclingRate_%',
+    'BiogasOutputm3': 'BiogasOutput_m3',
+    'minprice': 'minprice',
+    'maxprice': 'maxprice',
+    'modalprice': 'modalprice',
+    'marketname': 'marketname',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'BatchID': 'BatchID',
+    'CropType': 'CropType',
+    'FarmLocation': 'FarmLocation',
+    'HarvestDate': 'HarvestDate'
+}
+
+# Storage kind per internal field name:
+#   'category' - low-cardinality text, stored as pandas categorical
+#   'string'   - free text / identifiers, kept as Python strings
+#   'float'    - measurements, downcast to float32
+#   'flag'     - 0/1 indicator, stored as int8
+#   'date'     - HarvestDate, parsed with an explicit format
+CATEGORY_FIELDS = ['CropType', 'ProcessType', 'PackagingType', 'TransportMode', 'WasteType', 'GradingScore', 'marketname']
+STRING_FIELDS = ['BatchID', 'FarmLocation']
+FLAG_FIELDS = ['DeliveryDelayFlag']
+DATE_FIELDS = ['HarvestDate']
+
+FIELD_KINDS = {}
+for _name in FIELD_NAME_MAPPING.values():
+    if _name in CATEGORY_FIELDS:
+        FIELD_KINDS[_name] = 'category'
+    elif _name in STRING_FIELDS:
+        FIELD_KINDS[_name] = 'string'
+    elif _name in FLAG_FIELDS:
+        FIELD_KINDS[_name] = 'flag'
+    elif _name in DATE_FIELDS:
+        FIELD_KINDS[_name] = 'date'
+    else:
+        FIELD_KINDS[_name] = 'float'
+
+# HarvestDate formats: raw farm files use DDMMYYYY integers (leading zero often
+# lost, e.g. 8082025), updated files and food_supply_chain_data.csv use ISO dates
+HARVEST_DATE_FORMATS = [
+    (r'\d{7,8}', '%d%m%Y'),
+    (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d'),
+]
+
+# Number of validation problems printed per file before summarising
+MAX_REPORTED_ISSUES = 10
+
+
+def normalize_column_names(df):
+    """Rename columns from new CSV format to internal field names"""
+    rename_dict = {}
+    for old_name, new_name in FIELD_NAME_MAPPING.items():
+        if old_name in df.columns:
+            rename_dict[old_name] = new_name
+    if rename_dict:
+        df = df.rename(columns=rename_dict)
+    return df
+
+
+def _read_dtypes(numeric_as_text=False):
+    """read_csv dtype plan keyed by both CSV header and internal names"""
+    dtypes = {}
+    for raw_name, name in FIELD_NAME_MAPPING.items():
+        kind = FIELD_KINDS[name]
+        if kind == 'category':
+            dtype = 'category'
+        elif kind in ('string', 'date'):
+            dtype = str
+        elif numeric_as_text:
+            dtype = str
+        else:
+            dtype = 'float32'
+        dtypes[raw_name] = dtype
+        dtypes[name] = dtype
+    return dtypes
+
+
+def parse_harvest_dates(values):
+    """Parse HarvestDate text with the explicit DDMMYYYY / ISO formats.
+
+    Returns (dates, bad_mask) where bad_mask marks non-empty values that matched
+    neither format or were not valid dates.
+    """
+    text = values.astype('string').str.strip()
+    dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    matched = pd.Series(False, index=values.index)
+    for pattern, fmt in HARVEST_DATE_FORMATS:
+        mask = text.str.fullmatch(pattern).fillna(False).astype(bool) & ~matched
+        if mask.any():
+            subset = text[mask]
+            if fmt == '%d%m%Y':
+                subset = subset.str.zfill(8)
+            dates[mask] = pd.to_datetime(subset, format=fmt, errors='coerce')
+            matched |= mask
+    bad_mask = (text.fillna('') != '') & dates.isna()
+    return dates, bad_mask
+
+
+def apply_farm_dtypes(df, issues=None):
+    """Coerce an already-named farm frame to the dtype plan, recording bad values in `issues`"""
+    for col in df.columns:
+        kind = FIELD_KINDS.get(col)
+        if kind is None:
+            continue
+        series = df[col]
+        if kind == 'category':
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[col] = series.astype('category')
+        elif kind == 'date':
+            if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+                dates, bad = parse_harvest_dates(series)
+                _record_issues(issues, df, col, series, bad, 'unrecognised date')
+                df[col] = dates
+        elif kind in ('float', 'flag'):
+            if not pd.api.types.is_numeric_dtype(series.dtype):
+                numbers = pd.to_numeric(series, errors='coerce')
+                _record_issues(issues, df, col, series, series.notna() & numbers.isna(), 'not a number')
+                series = numbers
+            if kind == 'flag':
+                bad = series.notna() & ~series.isin([0, 1])
+                _record_issues(issues, df, col, series, bad, 'flag is not 0/1')
+                if series.notna().all() and not bad.any():
+                    df[col] = series.astype('int8')
+                    continue
+            if series.dtype != np.float32:
+                df[col] = series.astype('float32')
+    return df
+
+
+def _record_issues(issues, df, col, values, bad_mask, problem):
+    if issues is None or not bad_mask.any():
+        return
+    for index in df.index[bad_mask.to_numpy()]:
+        value = values.loc[index]
+        issues.append({
+            'row': int(index) + 2,  # 1-based CSV line, after the header
+            'column': col,
+            'value': value.item() if hasattr(value, 'item') else value,
+            'problem': problem
+        })
+
+
+def validate_farm_frame(df):
+    """Return row-level problems in a parsed farm frame (missing crop types, etc.)"""
+    issues = []
+    if 'CropType' in df.columns:
+        _record_issues(issues, df, 'CropType', df['CropType'], df['CropType'].isna(), 'missing crop type')
+    if 'BatchID' in df.columns:
+        duplicated = df['BatchID'].notna() & df['BatchID'].duplicated(keep='first')
+        _record_issues(issues, df, 'BatchID', df['BatchID'], duplicated, 'duplicate batch id')
+    return issues
+
+
+def read_farm_csv(source, issues=None, first_row=0):
+    """Read a farm CSV (path or file-like) with the declared schema.
+
+    Columns are renamed to internal names, categoricals/float32/int8 dtypes are
+    applied and HarvestDate is parsed. Any bad values are appended to `issues`
+    (a list of {'row', 'column', 'value', 'problem'} dicts) instead of failing.
+    `first_row` offsets the reported line numbers when reading an appended tail.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    start = source.tell() if hasattr(source, 'tell') else None
+    try:
+        df = pd.read_csv(source, dtype=_read_dtypes())
+    except ValueError:
+        # A numeric column holds text somewhere: re-read numbers as text so the
+        # offending rows can be reported and coerced to NaN
+        if start is not None:
+            source.seek(start)
+        df = pd.read_csv(source, dtype=_read_dtypes(numeric_as_text=True))
+    df = normalize_column_names(df)
+    frame_issues = []
+    df = apply_farm_dtypes(df, frame_issues)
+    frame_issues.extend(validate_farm_frame(df))
+    if issues is not None:
+        for issue in frame_issues:
+            issue['row'] += first_row
+        issues.extend(frame_issues)
+    return df
+
+
+def format_issues(issues, source_name):
+    """One-line summary plus the first few problems, for logging"""
+    lines = [f"{source_name}: {len(issues)} bad value(s) in farm data"]
+    for issue in issues[:MAX_REPORTED_ISSUES]:
+        lines.append(f"  line {issue['row']}: {issue['column']}={issue['value']!r} ({issue['problem']})")
+    if len(issues) > MAX_REPORTED_ISSUES:
+        lines.append(f"  ... {len(issues) - MAX_REPORTED_ISSUES} more")
+    return "\n".join(lines)
@@ -4,66 +4,12 @@ from pmdarima import auto_arima
 from pmdarima.arima import ARIMA
 import joblib 
 import os
+import sys
 import matplotlib.pyplot as plt
 
-# Field name mapping from new CSV format
-FIELD_NAME_MAPPING = {
-    'Fertilizerkgperha': 'Fertilizer_kg_per_ha',
-    'SoilMoisture%': 'SoilMoisture_%',
-    'TemperatureC': 'Temperature_C',
-    'Rainfallmm': 'Rainfall_mm',
-    'Yieldtonnesperha': 'Yield_tonnes_per_ha',
-    'PestRiskScore': 'PestRiskScore',
-    'HarvestRobotUptime%': 'HarvestRobotUptime_%',
-    'StorageTemperatureC': 'StorageTemperature_C',
-    'Humidity%': 'Humidity_%',
-    'SpoilageRate%': 'SpoilageRate_%',
-    'GradingScore': 'GradingScore',
-    'PredictedShelfLifedays': 'PredictedShelfLife_days',
-    'StorageDays': 'StorageDays',
-    'ProcessType': 'ProcessType',
-    'PackagingType': 'PackagingType',
-    'PackagingSpeedunitspermin': 'PackagingSpeed_units_per_min',
-    'DefectRate%': 'DefectRate_%',
-    'MachineryUptime%': 'MachineryUptime_%',
-    'TransportMode': 'TransportMode',
-    'TransportDistancekm': 'TransportDistance_km',
-    'FuelUsageLper100km': 'FuelUsage_L_per_100km',
-    'DeliveryTimehr': 'DeliveryTime_hr',
-    'DeliveryDelayFlag': 'DeliveryDelayFlag',
-    'SpoilageInTransit%': 'SpoilageInTransit_%',
-    'RetailInventoryunits': 'RetailInventory_units',
-    'SalesVelocityunitsperday': 'SalesVelocity_units_per_day',
-    'DynamicPricingIndex': 'DynamicPricingIndex',
-    'WastePercentage%': 'WastePercentage_%',
-    'HouseholdWastekg': 'HouseholdWaste_kg',
-    'RecipeRecommendationAccuracy%': 'RecipeRecommendationAccuracy_%',
-    'SatisfactionScore010': 'SatisfactionScore_0_10',
-    'WasteType': 'WasteType',
-    'SegregationAccuracy%': 'SegregationAccuracy_%',
-    'UpcyclingRate%': 'UpcyclingRate_%',
-    'BiogasOutputm3': 'BiogasOutput_m3',
-    'minprice': 'minprice',
-    'maxprice': 'maxprice',
-    'modalprice': 'modalprice',
-    'marketname': 'marketname',
-    'latitude': 'latitude',
-    'longitude': 'longitude',
-    'BatchID': 'BatchID',
-    'CropType': 'CropType',
-    'FarmLocation': 'FarmLocation',
-    'HarvestDate': 'HarvestDate'
-}
-
-def normalize_column_names(df):
-    """Rename columns from new CSV format to internal field names"""
-    rename_dict = {}
-    for old_name, new_name in FIELD_NAME_MAPPING.items():
-        if old_name in df.columns:
-            rename_dict[old_name] = new_name
-    if rename_dict:
-        df = df.rename(columns=rename_dict)
-    return df
+# Share the farm CSV schema with the Flask app (farm_schema.py lives in the project root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from farm_schema import read_farm_csv, format_issues
 
 # --- 1. CSV Reader Function (Uses REAL modalprice) ---
 def load_data_for_sarima_training(file_path: str, crop_type: str) -> pd.Series:
@@ -77,8 +23,10 @@ def load_data_for_sarima_training(file_path: str, crop_type: str) -> pd.Series:
     """
     
     try:
-        df = pd.read_csv(file_path)
-        df = normalize_column_names(df)
+        issues = []
+        df = read_farm_csv(file_path, issues)
+        if issues:
+            print(format_issues(issues, file_path))
     except FileNotFoundError:
         print(f"Error: Farm data file not found at {file_path}. Returning empty series.")
         return pd.Series()
@@ -90,8 +38,8 @@ def load_data_for_sarima_training(file_path: str, crop_type: str) -> pd.Series:
         print(f"Error: No records found for crop '{crop_type}'.")
         return pd.Series()
 
-    # 2. Create Time Series Index
-    df_crop['HarvestDate'] = pd.to_datetime(df_crop['HarvestDate'])
+    # 2. Create Time Series Index (HarvestDate is already parsed by the farm schema)
+    df_crop = df_crop.dropna(subset=['HarvestDate'])
     df_crop = df_crop.sort_values('HarvestDate').set_index('HarvestDate')
 
     # 3. Use REAL Modal Price Data
@@ -99,7 +47,7 @@ def load_data_for_sarima_training(file_path: str, crop_type: str) -> pd.Series:
          print(f"Error: 'modalprice' column not found for {crop_type}. Cannot train model.")
          return pd.Series()
          
-    price_series = df_crop['modalprice'].copy()
+    price_series = df_crop['modalprice'].astype('float64')
     price_series.name = f'{crop_type.capitalize()}_ModalPrice'
 
     # 4. Data Cleaning